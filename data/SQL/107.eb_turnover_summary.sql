@@ -0,0 +1,99 @@
+/* 売上集計テーブル
+ * v_turnover_* ビューと同じ項目を持ち、sp_refresh_turnover で月単位に更新する。
+ * 既存の請求は 204.backfill_turnover_summary.sql で集計する。
+ */
+CREATE TABLE IF NOT EXISTS eb_turnover_monthly (
+    id                varchar(6)   NOT NULL,
+    ym                varchar(20)  NOT NULL,
+    year              varchar(4)   NOT NULL,
+    month             varchar(2)   NOT NULL,
+    cost              bigint       NOT NULL DEFAULT 0,
+    amount            bigint       NOT NULL DEFAULT 0,
+    turnover_amount   bigint       NOT NULL DEFAULT 0,
+    tax_amount        bigint       NOT NULL DEFAULT 0,
+    expenses_amount   bigint       NOT NULL DEFAULT 0,
+    profit_amount     bigint       NOT NULL DEFAULT 0,
+    profit_rate       decimal(6,1)     NULL,
+    PRIMARY KEY (id),
+    UNIQUE KEY uk_turnover_monthly (year, month)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS eb_turnover_yearly (
+    year              varchar(4)   NOT NULL,
+    cost              bigint       NOT NULL DEFAULT 0,
+    amount            bigint       NOT NULL DEFAULT 0,
+    turnover_amount   bigint       NOT NULL DEFAULT 0,
+    tax_amount        bigint       NOT NULL DEFAULT 0,
+    expenses_amount   bigint       NOT NULL DEFAULT 0,
+    profit_amount     bigint       NOT NULL DEFAULT 0,
+    profit_rate       decimal(6,1)     NULL,
+    PRIMARY KEY (year)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS eb_turnover_monthly_by_organization (
+    id                varchar(6)   NOT NULL,
+    year              varchar(4)   NOT NULL,
+    month             varchar(2)   NOT NULL,
+    division_id       integer          NULL,
+    department_id     integer      NOT NULL,
+    cost              bigint       NOT NULL DEFAULT 0,
+    amount            bigint       NOT NULL DEFAULT 0,
+    turnover_amount   bigint       NOT NULL DEFAULT 0,
+    tax_amount        bigint       NOT NULL DEFAULT 0,
+    expenses_amount   bigint       NOT NULL DEFAULT 0,
+    profit_amount     bigint       NOT NULL DEFAULT 0,
+    profit_rate       decimal(6,1)     NULL,
+    PRIMARY KEY (year, month, department_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS eb_turnover_customers_by_month (
+    id                integer      NOT NULL,    -- 取引先ＩＤ
+    customer_name     varchar(30)  NOT NULL,
+    year              varchar(4)   NOT NULL,
+    month             varchar(2)   NOT NULL,
+    cost              bigint       NOT NULL DEFAULT 0,
+    amount            bigint       NOT NULL DEFAULT 0,
+    turnover_amount   bigint       NOT NULL DEFAULT 0,
+    tax_amount        bigint       NOT NULL DEFAULT 0,
+    expenses_amount   bigint       NOT NULL DEFAULT 0,
+    profit_amount     bigint       NOT NULL DEFAULT 0,
+    profit_rate       decimal(6,1)     NULL,
+    PRIMARY KEY (year, month, id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS eb_turnover_project (
+    id                integer      NOT NULL,    -- 案件ＩＤ
+    project_name      varchar(50)  NOT NULL,
+    client_id         integer      NOT NULL,
+    customer_name     varchar(30)  NOT NULL,
+    year              varchar(4)   NOT NULL,
+    month             varchar(2)   NOT NULL,
+    cost              bigint       NOT NULL DEFAULT 0,
+    amount            bigint       NOT NULL DEFAULT 0,
+    turnover_amount   bigint       NOT NULL DEFAULT 0,
+    tax_amount        bigint       NOT NULL DEFAULT 0,
+    expenses_amount   bigint       NOT NULL DEFAULT 0,
+    profit_amount     bigint       NOT NULL DEFAULT 0,
+    profit_rate       decimal(6,1)     NULL,
+    PRIMARY KEY (year, month, id),
+    KEY idx_turnover_project_client (year, month, client_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS eb_turnover_member (
+    project_request_detail_id integer NOT NULL,
+    id                integer      NOT NULL,    -- 社員ＩＤ
+    name              varchar(100) NOT NULL,
+    member_section_id integer          NULL,
+    org_name          varchar(50)      NULL,
+    project_id        integer      NOT NULL,
+    client_id         integer      NOT NULL,
+    year              varchar(4)   NOT NULL,
+    month             varchar(2)   NOT NULL,
+    cost              bigint       NOT NULL DEFAULT 0,
+    turnover_amount   bigint       NOT NULL DEFAULT 0,
+    expenses_amount   bigint       NOT NULL DEFAULT 0,
+    profit_amount     bigint       NOT NULL DEFAULT 0,
+    profit_rate       decimal(6,1)     NULL,
+    PRIMARY KEY (project_request_detail_id),
+    KEY idx_turnover_member_project (year, month, project_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
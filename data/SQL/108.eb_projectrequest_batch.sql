@@ -0,0 +1,41 @@
+/* 請求書の一括作成
+ * 一括作成の実行ごとに eb_projectrequest_batch を、対象の案件と注文書ごとに eb_projectrequest_batch_item を作成する。
+ * input_hash は請求書の作成に使ったデータのハッシュ値で、再実行時に内容が変わっていない請求書をスキップするために使う。
+ * lock_key は待機中と実行中の一括作成の対象年月（それ以外はNULL）で、同じ年月の一括作成を同時に１つしか登録できない。
+ * locked_date は実行中のプロセスが定期的に更新し、更新が途絶えた一括作成は次の一括作成に引き継がれる。
+ */
+CREATE TABLE IF NOT EXISTS eb_projectrequest_batch (
+    id                integer      NOT NULL AUTO_INCREMENT,
+    year              varchar(4)   NOT NULL,
+    month             varchar(2)   NOT NULL,
+    status            varchar(2)   NOT NULL DEFAULT '01',
+    total             integer      NOT NULL DEFAULT 0,
+    succeeded         integer      NOT NULL DEFAULT 0,
+    skipped           integer      NOT NULL DEFAULT 0,
+    failed            integer      NOT NULL DEFAULT 0,
+    created_user_id   integer          NULL,
+    created_date      datetime(6)  NOT NULL,
+    updated_date      datetime(6)  NOT NULL,
+    finished_date     datetime(6)      NULL,
+    lock_key          varchar(6)       NULL,
+    locked_date       datetime(6)      NULL,
+    PRIMARY KEY (id),
+    UNIQUE KEY uk_projectrequest_batch_lock (lock_key),
+    KEY idx_projectrequest_batch_ym (year, month)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
+
+CREATE TABLE IF NOT EXISTS eb_projectrequest_batch_item (
+    id                integer      NOT NULL AUTO_INCREMENT,
+    batch_id          integer      NOT NULL,
+    project_id        integer      NOT NULL,
+    client_order_id   integer      NOT NULL,
+    request_no        varchar(7)       NULL,
+    project_request_id integer         NULL,
+    status            varchar(2)   NOT NULL DEFAULT '01',
+    input_hash        varchar(40)      NULL,
+    message           varchar(2000)    NULL,
+    updated_date      datetime(6)  NOT NULL,
+    PRIMARY KEY (id),
+    KEY idx_projectrequest_batch_item_batch (batch_id, status),
+    KEY idx_projectrequest_batch_item_target (project_id, client_order_id, status)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
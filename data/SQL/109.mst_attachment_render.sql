@@ -0,0 +1,13 @@
+/* 帳票ファイルの描画キャッシュ
+ * render_key はテンプレート名と入力データのハッシュ値で、同じ内容の帳票を作成しなおす時に
+ * 既存のファイルを使いまわすために使う。
+ */
+CREATE TABLE IF NOT EXISTS mst_attachment_render (
+    id                integer      NOT NULL AUTO_INCREMENT,
+    attachment_id     integer      NOT NULL,
+    render_key        varchar(40)  NOT NULL,
+    created_dt        datetime(6)  NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE KEY uk_attachment_render_attachment (attachment_id),
+    KEY idx_attachment_render_key (render_key)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
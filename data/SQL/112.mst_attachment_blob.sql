@@ -0,0 +1,14 @@
+/* 添付ファイルの実体（ATTACHMENT_STORAGE_MODE = 'content' の場合）
+ * ファイルの内容（SHA-256）ごとに１つだけ保存し、参照している mst_attachment の件数を ref_count に持つ。
+ * ref_count が０になったらファイルを削除する。
+ */
+CREATE TABLE IF NOT EXISTS mst_attachment_blob (
+    id                integer      NOT NULL AUTO_INCREMENT,
+    hash              varchar(64)  NOT NULL,
+    path              varchar(100) NOT NULL,
+    size              bigint       NOT NULL DEFAULT 0,
+    ref_count         integer      NOT NULL DEFAULT 0,
+    created_dt        datetime(6)  NOT NULL,
+    PRIMARY KEY (id),
+    UNIQUE KEY uk_attachment_blob_hash (hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
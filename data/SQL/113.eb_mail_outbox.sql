@@ -0,0 +1,26 @@
+/* メールの送信キュー
+ * 画面から送信したメールは eb_mail_outbox に登録し、ワーカー（send_outbox_mails コマンド）が送信する。
+ * mail_data は Mail に渡す引数のJSONで、送信に失敗した場合は next_attempt_date まで待ってから再送信する。
+ * locked_by は送信中のワーカー、result は送信後のコールバック（mail_sent_callback）の結果のJSON。
+ */
+CREATE TABLE IF NOT EXISTS eb_mail_outbox (
+    id                integer      NOT NULL AUTO_INCREMENT,
+    mail_title        varchar(255)     NULL,
+    mail_data         longtext     NOT NULL,
+    content_type_id   integer          NULL,
+    object_id         integer          NULL,
+    status            varchar(2)   NOT NULL DEFAULT '01',
+    attempts          integer      NOT NULL DEFAULT 0,
+    next_attempt_date datetime(6)  NOT NULL,
+    locked_by         varchar(100)     NULL,
+    locked_date       datetime(6)      NULL,
+    last_error        varchar(2000)    NULL,
+    result            longtext         NULL,
+    created_user_id   integer          NULL,
+    created_date      datetime(6)  NOT NULL,
+    updated_date      datetime(6)  NOT NULL,
+    sent_date         datetime(6)      NULL,
+    PRIMARY KEY (id),
+    KEY idx_mail_outbox_status (status, next_attempt_date),
+    KEY idx_mail_outbox_object (content_type_id, object_id)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8;
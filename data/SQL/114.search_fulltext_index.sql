@@ -0,0 +1,41 @@
+/* 横断検索（SEARCH_BACKEND = 'utils.search_service.MysqlFulltextBackend'）で使うFULLTEXTインデックス
+ * ngramパーサーを使うので、MySQL 5.7.6以降が必要。
+ * インデックスの項目は、各アプリの search.py で登録した項目（関連先を除く）と同じ順番にする。
+ */
+DELIMITER //
+
+DROP PROCEDURE IF EXISTS tmp_add_fulltext_index //
+
+CREATE PROCEDURE tmp_add_fulltext_index (
+    in_table_name varchar(64),
+    in_index_name varchar(64),
+    in_columns varchar(500)
+)
+BEGIN
+    if not exists (
+        select 1
+          from information_schema.statistics
+         where table_schema = database()
+           and table_name = in_table_name
+           and index_name = in_index_name
+    ) then
+        set @sql = concat('alter table ', in_table_name, ' add fulltext index ', in_index_name, ' (', in_columns, ') with parser ngram');
+        prepare stmt from @sql;
+        execute stmt;
+        deallocate prepare stmt;
+    end if;
+END //
+
+DELIMITER ;
+
+call tmp_add_fulltext_index('eb_project', 'ft_project_search', 'name');
+call tmp_add_fulltext_index('eb_client', 'ft_client_search', 'name, japanese_spell');
+call tmp_add_fulltext_index('eb_clientmember', 'ft_clientmember_search', 'name');
+call tmp_add_fulltext_index('eb_subcontractor', 'ft_subcontractor_search', 'name, kana');
+call tmp_add_fulltext_index('eb_bank', 'ft_bank_search', 'name, kana, code');
+call tmp_add_fulltext_index(
+    'eb_member', 'ft_member_search',
+    'first_name, last_name, first_name_ja, last_name_ja, first_name_en, last_name_en, common_last_name, common_first_name, common_last_name_ja, common_first_name_ja'
+);
+
+DROP PROCEDURE tmp_add_fulltext_index;
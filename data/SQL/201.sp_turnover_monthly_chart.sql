@@ -11,7 +11,7 @@ BEGIN
 select year
      , month
      , turnover_amount
-  from v_turnover_monthly
+  from eb_turnover_monthly
  where concat(year, month) >= date_format(date_add(current_date(), interval -1 year), '%Y%m')
  order by year, month
 ;
@@ -13,7 +13,7 @@ select v.year
      , v.division_id
      , s.name as division_name
      , sum(v.turnover_amount) as turnover_amount
-  from v_turnover_monthly_by_organization v
+  from eb_turnover_monthly_by_organization v
   join eb_section s on s.id = v.division_id
   /*right join (select date_format(m1, '%Y') as year
                    , date_format(m1, '%m') as month
@@ -0,0 +1,175 @@
+delimiter //
+
+DROP PROCEDURE IF EXISTS sp_refresh_turnover //
+
+/* 指定年月の売上集計テーブルを再作成する
+ * 削除された請求書と明細は集計しない。
+ */
+CREATE PROCEDURE sp_refresh_turnover(
+    in_year varchar(4),     -- 対象年
+    in_month varchar(2)     -- 対象月
+)
+BEGIN
+
+-- 月別売上
+delete from eb_turnover_monthly where year = in_year and month = in_month;
+insert into eb_turnover_monthly (
+       id, ym, year, month, cost, amount, turnover_amount, tax_amount, expenses_amount, profit_amount, profit_rate
+)
+select concat(pr.year, pr.month) as id
+     , concat(pr.year, '年', pr.month, '月') as ym
+     , pr.year
+     , pr.month
+     , sum(pr.cost) as cost
+     , sum(pr.amount) as amount
+     , sum(pr.turnover_amount) as turnover_amount
+     , sum(pr.tax_amount) as tax_amount
+     , sum(pr.expenses_amount) as expenses_amount
+     , sum(pr.turnover_amount) - sum(pr.cost) as profit_amount
+     , round((sum(pr.turnover_amount) - sum(pr.cost)) / sum(pr.turnover_amount), 1) * 100 as profit_rate
+  from eb_projectrequest pr
+  join eb_projectrequestheading prh on prh.project_request_id = pr.id
+ where pr.is_deleted = 0
+   and pr.year = in_year
+   and pr.month = in_month
+ group by pr.year, pr.month
+;
+
+-- 年間売上（月別売上から集計）
+delete from eb_turnover_yearly where year = in_year;
+insert into eb_turnover_yearly (
+       year, cost, amount, turnover_amount, tax_amount, expenses_amount, profit_amount, profit_rate
+)
+select t.year
+     , sum(t.cost) as cost
+     , sum(t.amount) as amount
+     , sum(t.turnover_amount) as turnover_amount
+     , sum(t.tax_amount) as tax_amount
+     , sum(t.expenses_amount) as expenses_amount
+     , sum(t.turnover_amount) - sum(t.cost) as profit_amount
+     , round((sum(t.turnover_amount) - sum(t.cost)) / sum(t.turnover_amount), 1) * 100 as profit_rate
+  from eb_turnover_monthly t
+ where t.year = in_year
+ group by t.year
+;
+
+-- 部署別、かつ月別売上
+delete from eb_turnover_monthly_by_organization where year = in_year and month = in_month;
+insert into eb_turnover_monthly_by_organization (
+       id, year, month, division_id, department_id,
+       cost, amount, turnover_amount, tax_amount, expenses_amount, profit_amount, profit_rate
+)
+select concat(pr.year, pr.month) as id
+     , pr.year
+     , pr.month
+     , get_division_new(p.department_id) as division_id
+     , p.department_id
+     , sum(pr.cost) as cost
+     , sum(pr.amount) as amount
+     , sum(pr.turnover_amount) as turnover_amount
+     , sum(pr.tax_amount) as tax_amount
+     , sum(pr.expenses_amount) as expenses_amount
+     , sum(pr.turnover_amount) - sum(pr.cost) as profit_amount
+     , round((sum(pr.turnover_amount) - sum(pr.cost)) / sum(pr.turnover_amount), 1) * 100 as profit_rate
+  from eb_projectrequest pr
+  join eb_projectrequestheading prh on prh.project_request_id = pr.id
+  join eb_project p on p.is_deleted = 0 and p.id = pr.project_id
+ where pr.is_deleted = 0
+   and pr.year = in_year
+   and pr.month = in_month
+   and p.department_id is not null
+ group by pr.year, pr.month, p.department_id
+;
+
+-- お客様別売上
+delete from eb_turnover_customers_by_month where year = in_year and month = in_month;
+insert into eb_turnover_customers_by_month (
+       id, customer_name, year, month,
+       cost, amount, turnover_amount, tax_amount, expenses_amount, profit_amount, profit_rate
+)
+select c.id
+     , c.name as customer_name
+     , pr.year
+     , pr.month
+     , sum(pr.cost) as cost
+     , sum(pr.amount) as amount
+     , sum(pr.turnover_amount) as turnover_amount
+     , sum(pr.tax_amount) as tax_amount
+     , sum(pr.expenses_amount) as expenses_amount
+     , sum(pr.turnover_amount) - sum(pr.cost) as profit_amount
+     , round((sum(pr.turnover_amount) - sum(pr.cost)) / sum(pr.turnover_amount), 1) * 100 as profit_rate
+  from eb_projectrequest pr
+  join eb_projectrequestheading prh on prh.project_request_id = pr.id
+  join eb_project p on p.is_deleted = 0 and p.id = pr.project_id
+  join eb_client c on c.id = p.client_id
+ where pr.is_deleted = 0
+   and pr.year = in_year
+   and pr.month = in_month
+ group by c.id, pr.year, pr.month
+;
+
+-- 案件別売上
+delete from eb_turnover_project where year = in_year and month = in_month;
+insert into eb_turnover_project (
+       id, project_name, client_id, customer_name, year, month,
+       cost, amount, turnover_amount, tax_amount, expenses_amount, profit_amount, profit_rate
+)
+select p.id
+     , p.name as project_name
+     , p.client_id
+     , c.name as customer_name
+     , pr.year
+     , pr.month
+     , sum(pr.cost) as cost
+     , sum(pr.amount) as amount
+     , sum(pr.turnover_amount) as turnover_amount
+     , sum(pr.tax_amount) as tax_amount
+     , sum(pr.expenses_amount) as expenses_amount
+     , sum(pr.turnover_amount) - sum(pr.cost) as profit_amount
+     , round((sum(pr.turnover_amount) - sum(pr.cost)) / sum(pr.turnover_amount), 1) * 100 as profit_rate
+  from eb_projectrequest pr
+  join eb_projectrequestheading prh on prh.project_request_id = pr.id
+  join eb_project p on p.is_deleted = 0 and p.id = pr.project_id
+  join eb_client c on c.id = p.client_id
+ where pr.is_deleted = 0
+   and pr.year = in_year
+   and pr.month = in_month
+ group by c.id, p.id, pr.year, pr.month
+;
+
+-- 社員売上
+delete from eb_turnover_member where year = in_year and month = in_month;
+insert into eb_turnover_member (
+       project_request_detail_id, id, name, member_section_id, org_name, project_id, client_id, year, month,
+       cost, turnover_amount, expenses_amount, profit_amount, profit_rate
+)
+select prd.id as project_request_detail_id
+     , m.id
+     , concat(m.first_name, ' ', m.last_name) as name
+     , prd.member_section_id
+     , s.name as org_name
+     , pm.project_id
+     , p.client_id
+     , pr.year
+     , pr.month
+     , prd.cost as cost
+     , prd.total_price as turnover_amount
+     , prd.expenses_price as expenses_amount
+     , prd.total_price - prd.cost as profit_amount
+     , round((prd.total_price - prd.cost) / prd.total_price, 1) * 100 as profit_rate
+  from eb_projectrequestdetail prd
+  join eb_projectrequest pr on pr.id = prd.project_request_id
+  join eb_projectmember pm on pm.id = prd.project_member_id
+  join eb_member m on m.id = pm.member_id
+  join eb_project p on p.is_deleted = 0 and p.id = pm.project_id
+  join eb_client c on c.id = p.client_id
+  left join eb_section s on s.id = prd.member_section_id
+ where prd.is_deleted = 0
+   and pr.is_deleted = 0
+   and pr.year = in_year
+   and pr.month = in_month
+;
+
+END //
+
+delimiter ;
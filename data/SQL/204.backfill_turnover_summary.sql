@@ -0,0 +1,37 @@
+/* 売上集計テーブル（107.eb_turnover_summary.sql）の初期データ
+ * 請求が存在する全ての年月を sp_refresh_turnover で集計する。
+ * 集計済みの年月がある場合は何もしないので、再実行する場合は rebuild_turnover コマンドを使う。
+ */
+DELIMITER //
+
+DROP PROCEDURE IF EXISTS tmp_backfill_turnover //
+
+CREATE PROCEDURE tmp_backfill_turnover ()
+BEGIN
+    declare done boolean default false;
+    declare v_year varchar(4);
+    declare v_month varchar(2);
+    declare cur_months cursor for
+        select distinct year, month
+          from eb_projectrequest
+         order by year, month;
+    declare continue handler for not found set done = true;
+
+    if not exists (select 1 from eb_turnover_monthly) then
+        open cur_months;
+        read_loop: loop
+            fetch cur_months into v_year, v_month;
+            if done then
+                leave read_loop;
+            end if;
+            call sp_refresh_turnover(v_year, v_month);
+        end loop;
+        close cur_months;
+    end if;
+END //
+
+DELIMITER ;
+
+call tmp_backfill_turnover();
+
+DROP PROCEDURE tmp_backfill_turnover;
@@ -1,9 +1,9 @@
 DELIMITER //
 
-DROP PROCEDURE IF EXISTS sp_project_member_cost //
+DROP PROCEDURE IF EXISTS sp_project_member_cost_calc //
 
-/* アサインした社員のコスト */
-CREATE PROCEDURE sp_project_member_cost (
+/* アサインした社員のコストを計算する */
+CREATE PROCEDURE sp_project_member_cost_calc (
     in_member_id integer,           -- 社員ＩＤ
     in_project_member_id integer,   -- アサインＩＤ
     in_year char(4),                -- 対象年
@@ -13,7 +13,10 @@ CREATE PROCEDURE sp_project_member_cost (
     in_allowance integer,           -- 手当
     in_night_days integer,          -- 深夜日数
     in_traffic_cost integer,        -- 交通費
-    in_expenses integer             -- 経費
+    in_expenses integer,            -- 経費
+    OUT out_salary integer,         -- 給料
+    OUT out_overtime_cost integer,  -- 残業代
+    OUT out_cost integer            -- コスト
 )
 BEGIN
 
@@ -166,6 +169,39 @@ END IF;
 select get_employment_insurance(tmp_member_type, tmp_salary, in_allowance, tmp_night_allowance, tmp_overtime_cost, tmp_traffic_cost) into tmp_employment_insurance;
 SET tmp_cost = tmp_salary + in_allowance + tmp_night_allowance + tmp_overtime_cost + tmp_traffic_cost + tmp_expenses + tmp_employment_insurance + tmp_health_insurance;
 
+set out_salary = tmp_salary;
+set out_overtime_cost = tmp_overtime_cost;
+set out_cost = tmp_cost;
+
+END //
+
+DROP PROCEDURE IF EXISTS sp_project_member_cost //
+
+/* アサインした社員のコスト */
+CREATE PROCEDURE sp_project_member_cost (
+    in_member_id integer,           -- 社員ＩＤ
+    in_project_member_id integer,   -- アサインＩＤ
+    in_year char(4),                -- 対象年
+    in_month char(2),               -- 対象月
+    in_business_days integer,       -- 営業日数
+    in_total_hours decimal(5,2),    -- 出金時間
+    in_allowance integer,           -- 手当
+    in_night_days integer,          -- 深夜日数
+    in_traffic_cost integer,        -- 交通費
+    in_expenses integer             -- 経費
+)
+BEGIN
+
+DECLARE tmp_salary integer;
+DECLARE tmp_overtime_cost integer;
+DECLARE tmp_cost integer;
+
+call sp_project_member_cost_calc(
+    in_member_id, in_project_member_id, in_year, in_month, in_business_days,
+    in_total_hours, in_allowance, in_night_days, in_traffic_cost, in_expenses,
+    tmp_salary, tmp_overtime_cost, tmp_cost
+);
+
 select tmp_salary as `salary`
      , tmp_overtime_cost as `overtime_cost`
      , tmp_cost as `cost`
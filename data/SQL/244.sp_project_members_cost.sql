@@ -0,0 +1,67 @@
+DELIMITER //
+
+DROP PROCEDURE IF EXISTS sp_project_members_cost //
+
+/* アサインした複数の社員のコスト
+
+in_members は社員ごとに「;」、項目ごとに「,」で区切る。
+項目の順番は 社員ＩＤ,アサインＩＤ,出金時間,手当,深夜日数,交通費,経費
+*/
+CREATE PROCEDURE sp_project_members_cost (
+    in_year char(4),                -- 対象年
+    in_month char(2),               -- 対象月
+    in_business_days integer,       -- 営業日数
+    in_members text                 -- 社員ごとのパラメーター
+)
+BEGIN
+
+DECLARE tmp_rest text;
+DECLARE tmp_row varchar(255);
+DECLARE tmp_project_member_id integer;
+DECLARE tmp_salary integer;
+DECLARE tmp_overtime_cost integer;
+DECLARE tmp_cost integer;
+
+DROP TEMPORARY TABLE IF EXISTS tmp_project_members_cost;
+CREATE TEMPORARY TABLE tmp_project_members_cost (
+    project_member_id integer NOT NULL PRIMARY KEY,
+    salary integer,
+    overtime_cost integer,
+    cost integer
+);
+
+set tmp_rest = in_members;
+while tmp_rest is not null and tmp_rest <> '' do
+    set tmp_row = substring_index(tmp_rest, ';', 1);
+    set tmp_rest = if(locate(';', tmp_rest) > 0, substring(tmp_rest, locate(';', tmp_rest) + 1), '');
+    set tmp_project_member_id = substring_index(substring_index(tmp_row, ',', 2), ',', -1);
+    call sp_project_member_cost_calc(
+        substring_index(tmp_row, ',', 1),
+        tmp_project_member_id,
+        in_year,
+        in_month,
+        in_business_days,
+        substring_index(substring_index(tmp_row, ',', 3), ',', -1),
+        substring_index(substring_index(tmp_row, ',', 4), ',', -1),
+        substring_index(substring_index(tmp_row, ',', 5), ',', -1),
+        substring_index(substring_index(tmp_row, ',', 6), ',', -1),
+        substring_index(tmp_row, ',', -1),
+        tmp_salary,
+        tmp_overtime_cost,
+        tmp_cost
+    );
+    insert into tmp_project_members_cost values (tmp_project_member_id, tmp_salary, tmp_overtime_cost, tmp_cost);
+end while;
+
+select project_member_id
+     , salary
+     , overtime_cost
+     , cost
+  from tmp_project_members_cost
+;
+
+DROP TEMPORARY TABLE IF EXISTS tmp_project_members_cost;
+
+END //
+
+DELIMITER ;
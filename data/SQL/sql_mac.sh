@@ -13,13 +13,22 @@ mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 1
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 104.v_turnover_customers_by_month.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 105.v_turnover_project.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 106.v_turnover_member.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 107.eb_turnover_summary.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 108.eb_projectrequest_batch.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 109.mst_attachment_render.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 110.v_project.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 112.mst_attachment_blob.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 113.eb_mail_outbox.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 114.search_fulltext_index.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 201.sp_turnover_monthly_chart.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 202.sp_turnover_monthly_by_division_chart.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 203.sp_refresh_turnover.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 204.backfill_turnover_summary.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 240.sp_project_member_cost.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 241.sp_project_attendance_list.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 242.sp_project_attendance.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 243.sp_project_order_list.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 244.sp_project_members_cost.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 300.sp_search_member.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 301.sp_member_brief_status.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 302.sp_member_working_status.sql
@@ -36,3 +45,4 @@ mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 3
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 320.sp_partner_member_orders.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 321.sp_partner_lump_orders.sql
 mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 322.sp_partner_contracts_by_month.sql
+mysql -h 192.168.99.100 -u root -proot --default-character-set=utf8 eb_sales < 323.sp_search_member_by_ids.sql
@@ -135,6 +135,27 @@ else:
         }
     }
 
+# Cache
+# プロシージャの結果とマスターデータのキャッシュは、テーブルのバージョンをこのキャッシュで共有して、
+# 他のプロセスの変更を検知する。LocMemCache（既定値）はプロセスごとになるので、
+# 複数のプロセスで動かす場合は memcached などの共有のキャッシュが必須となる。
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': '{}:{}'.format(
+            os.environ.get('MEMCACHED_PORT_11211_TCP_ADDR', '127.0.0.1'),
+            os.environ.get('MEMCACHED_PORT_11211_TCP_PORT', '11211'),
+        ),
+    },
+}
+
+# Email
+# メールサーバーが応答しない場合に備えて、SMTPの操作ごとのタイムアウト（秒）を設定する。
+# 送信キューのワーカーはメール１件ごとに送信中のロックを延長するので、
+# MAIL_OUTBOX_LOCK_TIMEOUT（既定値は1800秒）は１件の送信にかかる最大時間より十分に大きくすること。
+EMAIL_TIMEOUT = 60
+
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticated',
@@ -206,6 +227,8 @@ STATIC_URL = '/static/'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 if not os.path.exists(MEDIA_ROOT):
     os.mkdir(MEDIA_ROOT)
+# 添付ファイルの保存方法（uuid：ファイルごとに保存、content：同じ内容のファイルは１つだけ保存）
+ATTACHMENT_STORAGE_MODE = 'content'
 LOG_ROOT = os.path.join(BASE_DIR, "logs")
 if not os.path.exists(LOG_ROOT):
     os.mkdir(LOG_ROOT)
@@ -51,12 +51,18 @@ router.register(r'turnover/customers_by_month', turnover_api.TurnoverCustomersBy
 router.register(r'turnover/project', turnover_api.TurnoverProjectViewSet)
 router.register(r'turnover/member', turnover_api.TurnoverMemberViewSet)
 router.register(r'mail', mail_api.MailGroupViewSet)
+router.register(r'mail-outbox', mail_api.MailOutboxViewSet)
 
 urlpatterns = [
     url(r'^admin/', admin.site.urls),
     url(r'^api-auth/', include('rest_framework.urls')),
     url(r'^api/token-auth/', obtain_jwt_token),
     url(r'^api/me/$', member_api.MeApiView.as_view()),
+    url(r'^api/turnover/cube/$', turnover_api.TurnoverCubeApiView.as_view()),
+    url(r'^api/project/request-batch/$', project_api.ProjectRequestBatchApiView.as_view()),
+    url(r'^api/project/request-batch/(?P<pk>\d+)/$', project_api.ProjectRequestBatchApiView.as_view()),
+    url(r'^api/attachment/(?P<uuid>[^/?]+)/download/$', master_api.FileStreamApiView.as_view()),
+    url(r'^api/search/$', master_api.SearchApiView.as_view()),
     url(r'^api/', include(router.urls)),
     url(r'^api/member/', include('member.urls')),
     url(r'^api/contract/', include('contract.urls')),
@@ -7,6 +7,15 @@ def send_mail(mail_data, user):
     mail = Mail(**mail_data)
     mail.send_email(user)
     # メール送信後の処理
+    return call_mail_sent_callback(mail_data)
+
+
+def call_mail_sent_callback(mail_data):
+    """メール送信後、送信対象のオブジェクトのコールバック関数を呼び出す。
+
+    :param mail_data: メールデータ（content_type と object_id で送信対象を指定する）
+    :return: コールバック関数の結果
+    """
     content_type_id = mail_data.get('content_type')
     object_id = mail_data.get('object_id')
     if content_type_id and object_id:
@@ -0,0 +1,194 @@
+import contextlib
+import os
+import smtplib
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import connection as db_connection
+
+from utils import constants, common, procedure_cache
+from utils.errors import CustomException
+from utils.master_cache import master_cache
+
+logger = common.get_system_logger()
+
+CONFIG_NAMES = (
+    constants.CONFIG_EMAIL_SMTP_HOST,
+    constants.CONFIG_EMAIL_SMTP_PORT,
+    constants.CONFIG_EMAIL_ADDRESS,
+    constants.CONFIG_EMAIL_PASSWORD,
+)
+CONFIG_TABLE = 'mst_config'
+
+# 他のプロセスでシステム設定が変更された場合も、テーブルのバージョンが上がるように登録する。
+procedure_cache.track_tables(CONFIG_TABLE)
+
+
+class SmtpConnectionPool(object):
+    """SMTP接続を再利用するプール
+
+    SMTPサーバーの設定（mst_config）は MAIL_CONFIG_TIMEOUT 秒（既定値は300秒）キャッシュする。
+    システム設定が変更された場合、invalidate()でキャッシュと接続を破棄する。
+    他のプロセスで変更された場合は、mst_config のバージョン（master_cache と同じもの）が変わったことで検知し、
+    次の送信の前に破棄する。
+    使い終わった接続は MAIL_POOL_MAX_IDLE 個（既定値は２）まで残しておき、
+    MAIL_POOL_IDLE_TIMEOUT 秒（既定値は60秒）以内なら次の送信で使いまわす。
+
+    使用例::
+
+        with smtp_pool.connection() as backend:
+            email = EmailMessage(..., connection=backend)
+            email.send()
+    """
+
+    def __init__(self, max_idle=None, idle_timeout=None, config_timeout=None):
+        self.max_idle = max_idle if max_idle is not None else getattr(settings, 'MAIL_POOL_MAX_IDLE', 2)
+        self.idle_timeout = idle_timeout or getattr(settings, 'MAIL_POOL_IDLE_TIMEOUT', 60)
+        self.config_timeout = config_timeout or getattr(settings, 'MAIL_CONFIG_TIMEOUT', 300)
+        self._lock = threading.Lock()
+        self._config = None
+        self._config_expires = 0
+        self._config_version = None
+        self._idle = []
+        self._generation = 0
+        self._pid = os.getpid()
+
+    def invalidate(self):
+        """キャッシュした設定と待機中の接続を破棄する。
+
+        :return:
+        """
+        with self._lock:
+            self._config = None
+            self._generation += 1
+            idle, self._idle = self._idle, []
+        for backend, released in idle:
+            self.close(backend)
+
+    def check_version(self):
+        """システム設定のバージョンが変わっていたら、キャッシュした設定と待機中の接続を破棄する。
+
+        :return:
+        """
+        version = master_cache.get_versions((CONFIG_TABLE,))
+        if version != self._config_version:
+            if self._config_version is not None:
+                self.invalidate()
+            self._config_version = version
+
+    def get_config(self):
+        """SMTPサーバーの設定を取得する。
+
+        :return: host、port、username、password の辞書
+        """
+        self.check_version()
+        config = self._config
+        if config is None or self._config_expires < time.time():
+            with db_connection.cursor() as cursor:
+                cursor.execute(
+                    "select name, value from mst_config where name in (%s, %s, %s, %s)", list(CONFIG_NAMES)
+                )
+                values = dict(cursor.fetchall())
+            missing = [name for name in CONFIG_NAMES if name not in values]
+            if missing:
+                raise CustomException(constants.ERROR_MAIL_CONFIG_NOT_FOUND.format(name=','.join(missing)))
+            config = {
+                'host': str(values[constants.CONFIG_EMAIL_SMTP_HOST]),
+                'port': int(values[constants.CONFIG_EMAIL_SMTP_PORT]),
+                'username': str(values[constants.CONFIG_EMAIL_ADDRESS]),
+                'password': str(values[constants.CONFIG_EMAIL_PASSWORD]),
+            }
+            with self._lock:
+                self._config = config
+                self._config_expires = time.time() + self.config_timeout
+        return config
+
+    def create_backend(self):
+        """接続していないメールバックエンドを作成する。
+
+        :return:
+        """
+        return get_connection(**self.get_config())
+
+    @staticmethod
+    def is_alive(backend):
+        if backend.connection is None:
+            return False
+        try:
+            return backend.connection.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def close(backend):
+        try:
+            backend.close()
+        except Exception as ex:
+            logger.warning(ex)
+
+    def acquire(self):
+        """接続済みのメールバックエンドを取得する。
+
+        待機中の接続があればそれを使い、なければ新しく接続する。
+
+        :return:
+        """
+        self.check_version()
+        while True:
+            with self._lock:
+                if self._pid != os.getpid():
+                    # フォークした子プロセスでは親の接続を使わない。
+                    self._idle = []
+                    self._pid = os.getpid()
+                if not self._idle:
+                    break
+                backend, released = self._idle.pop()
+            if released + self.idle_timeout > time.time() and self.is_alive(backend):
+                return backend
+            self.close(backend)
+
+        try:
+            generation = self._generation
+            backend = self.create_backend()
+            backend.open()
+            backend.pool_generation = generation
+            return backend
+        except CustomException:
+            raise
+        except Exception as ex:
+            logger.error(ex)
+            logger.error(traceback.format_exc())
+            raise CustomException(constants.ERROR_MAIL_CONNECTION_FAILED.format(message=ex))
+
+    def release(self, backend, broken=False):
+        """使い終わった接続をプールに戻す。
+
+        :param backend: acquire()で取得したメールバックエンド
+        :param broken: Trueの場合、接続を閉じる
+        :return:
+        """
+        if not broken and backend.connection is not None:
+            with self._lock:
+                # 使用中に設定が変更された接続は戻さない。
+                if self._pid == os.getpid() and len(self._idle) < self.max_idle \
+                        and getattr(backend, 'pool_generation', None) == self._generation:
+                    self._idle.append((backend, time.time()))
+                    return
+        self.close(backend)
+
+    @contextlib.contextmanager
+    def connection(self):
+        backend = self.acquire()
+        try:
+            yield backend
+        except Exception:
+            self.release(backend, broken=not self.is_alive(backend))
+            raise
+        else:
+            self.release(backend)
+
+
+smtp_pool = SmtpConnectionPool()
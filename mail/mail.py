@@ -1,27 +1,24 @@
 import os
 import mimetypes
-import zipfile
 import traceback
-import subprocess
 import io
-import datetime
-import shutil
-import sys
+
+from collections import OrderedDict
 
 from email import encoders
 from email.header import Header
 
 from django.conf import settings
 from django.core.exceptions import ValidationError
-from django.core.mail import EmailMultiAlternatives, get_connection, SafeMIMEText
+from django.core.mail import EmailMultiAlternatives, SafeMIMEText
 from django.core.mail.message import MIMEBase
 from django.core.validators import validate_email
-from django.db import connection
 from django.utils.encoding import smart_str
 
+from .connection import smtp_pool
 from .models import EMailLogEntry
 from master.models import Attachment
-from utils import constants, common
+from utils import constants, common, zip_writer
 from utils.errors import CustomException
 
 
@@ -42,7 +39,6 @@ class Mail(object):
         self.pass_title = pass_title
         self.password = None
         self.pass_body = pass_body
-        self.temp_files = []
 
     def check_recipient(self):
         if not self.recipient_list:
@@ -69,30 +65,18 @@ class Mail(object):
 
     @classmethod
     def get_mail_connection(cls):
+        """接続していないメールバックエンドを取得する。
+
+        SMTPサーバーの設定はキャッシュしたものを使う。
+
+        :return:
+        """
         try:
-            with connection.cursor() as cursor:
-                cursor.execute(
-                    "select value from mst_config where name = %s "
-                    " union all "
-                    "select value from mst_config where name = %s "
-                    " union all "
-                    "select value from mst_config where name = %s "
-                    " union all "
-                    "select value from mst_config where name = %s ",
-                    [constants.CONFIG_EMAIL_SMTP_HOST, constants.CONFIG_EMAIL_SMTP_PORT,
-                     constants.CONFIG_EMAIL_ADDRESS, constants.CONFIG_EMAIL_PASSWORD]
-                )
-                host, port, username, password = cursor.fetchall()
-            backend = get_connection()
-            backend.host = str(host[0])
-            backend.port = int(port[0])
-            backend.username = str(username[0])
-            backend.password = str(password[0])
-            return backend
+            return smtp_pool.create_backend()
         except Exception as ex:
             logger.error(str(ex))
             logger.error(traceback.format_exc())
-            raise CustomException(str(ex))
+            raise CustomException(getattr(ex, 'message', None) or str(ex))
 
     @classmethod
     def str_to_list(cls, s):
@@ -121,44 +105,17 @@ class Mail(object):
 
     def zip_attachments(self):
         if self.attachment_list:
-            if sys.platform in ("linux", "linux2"):
-                # tempフォルダー配下の一時フォルダーを取得する
-                temp_path = os.path.join(common.get_temp_path(), datetime.datetime.now().strftime('%Y%m%d%H%M%S%f'))
-                if not os.path.exists(temp_path):
-                    os.mkdir(temp_path)
-                    self.temp_files.append(temp_path)
-                temp_zip = os.path.join(common.get_temp_path(), datetime.datetime.now().strftime('%Y%m%d%H%M%S%f.zip'))
-                self.temp_files.append(temp_zip)
-                file_list = []
-                for attachment_file in self.attachment_list:
-                    new_path = os.path.join(temp_path, attachment_file.filename)
-                    file_list.append(new_path)
-                    self.temp_files.append(new_path)
-                    if attachment_file.is_bytes():
-                        # バイナリーファイルを一時ファイルに書き込む
-                        with open(new_path, 'wb') as f:
-                            f.write(attachment_file.content)
-                    else:
-                        shutil.copy(attachment_file.path, new_path)
-                password = self.generate_password()
-                # tempフォルダー配下すべてのファイル名をUTF8からShift-JISに変換する
-                subprocess.call(["convmv", "-r", "-f", "utf8", '-t', 'sjis', '--notest', temp_path.rstrip('/') + '/'])
-                # 一時フォルダーを圧縮する
-                command = "zip --password {0} -j {1} {2}/*".format(password, temp_zip, temp_path.rstrip('/'))
-                print(command)
-                subprocess.call(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                bytes_data = open(temp_zip, 'rb', ).read()
-                return bytes_data
-            else:
-                buff = io.BytesIO()
-                in_memory_zip = zipfile.ZipFile(buff, mode='w')
-                for attachment_file in self.attachment_list:
-                    if attachment_file.is_bytes():
-                        in_memory_zip.writestr(attachment_file.filename, attachment_file.content)
-                    else:
-                        in_memory_zip.write(attachment_file.path, attachment_file.filename)
-                in_memory_zip.close()
-                return buff.getvalue()
+            # ファイル名はShift-JIS（CP932）にして、添付ファイルから直接パスワード付きで圧縮する
+            password = self.generate_password()
+            # 同じファイル名の添付ファイルは後のもので上書きする
+            files = OrderedDict()
+            for attachment_file in self.attachment_list:
+                files[attachment_file.filename] = (attachment_file.path, attachment_file.content)
+            buff = io.BytesIO()
+            zip_writer.write_encrypted_zip(buff, [
+                (filename, path, content) for filename, (path, content) in files.items()
+            ], password)
+            return buff.getvalue()
         else:
             return None
 
@@ -182,7 +139,15 @@ class Mail(object):
         self.password = common.generate_password(length)
         return self.password
 
-    def send_email(self, user=None):
+    def send_email(self, user=None, connection=None):
+        """メールを送信する。
+
+        パスワード付きの場合、パスワードのメールも同じSMTP接続で送信する。
+
+        :param user: 送信者（送信ログに記録する）
+        :param connection: 接続済みのメールバックエンド、省略時はプールから取得する
+        :return:
+        """
         try:
             self.check_recipient()
             self.check_cc_list()
@@ -190,33 +155,11 @@ class Mail(object):
             self.check_attachment()
             self.check_mail_title()
 
-            mail_connection = self.get_mail_connection()
-            if not self.sender:
-                self.sender = mail_connection.username
-
-            email = EmailMultiAlternativesWithEncoding(
-                subject=self.mail_title,
-                body=self.mail_body,
-                from_email=self.sender,
-                to=self.recipient_list,
-                cc=self.cc_list,
-                bcc=self.bcc_list,
-                connection=mail_connection
-            )
-            # email.attach_alternative(self.mail_body, constants.MIME_TYPE_HTML)
-            if self.is_encrypt is False:
-                for attachment in [item for item in self.attachment_list]:
-                    if attachment.is_bytes():
-                        email.attach(attachment.filename, attachment.content, constants.MIME_TYPE_ZIP)
-                    else:
-                        email.attach_file(attachment.path, constants.MIME_TYPE_STREAM)
+            if connection is None:
+                with smtp_pool.connection() as mail_connection:
+                    self.send_message(mail_connection, user)
             else:
-                attachments = self.zip_attachments()
-                if attachments:
-                    email.attach('%s.zip' % self.mail_title, attachments, constants.MIME_TYPE_ZIP)
-            email.send()
-            # パスワードを送信する。
-            self.send_password(mail_connection, user=user)
+                self.send_message(connection, user)
             log_format = "題名: %s; TO: %s; CC: %s; 送信完了。"
             logger.info(log_format % (
                 self.mail_title,
@@ -240,22 +183,65 @@ class Mail(object):
                     body=self.mail_body,
                     attachment=attachment_name,
                 )
-        except subprocess.CalledProcessError as e:
-            logger.error(e.output)
-            logger.error(traceback.format_exc())
-            raise CustomException(str(e.output))
         except Exception as ex:
             logger.error(ex)
             logger.error(traceback.format_exc())
-            raise CustomException(str(ex))
-        finally:
-            # 一時ファイルを削除
-            for path in self.temp_files:
-                if os.path.exists(path):
-                    if os.path.isdir(path):
-                        shutil.rmtree(path)
-                    else:
-                        os.remove(path)
+            raise CustomException(getattr(ex, 'message', None) or str(ex))
+
+    def send_message(self, mail_connection, user=None):
+        if not self.sender:
+            self.sender = mail_connection.username
+
+        email = EmailMultiAlternativesWithEncoding(
+            subject=self.mail_title,
+            body=self.mail_body,
+            from_email=self.sender,
+            to=self.recipient_list,
+            cc=self.cc_list,
+            bcc=self.bcc_list,
+            connection=mail_connection
+        )
+        # email.attach_alternative(self.mail_body, constants.MIME_TYPE_HTML)
+        if self.is_encrypt is False:
+            for attachment in [item for item in self.attachment_list]:
+                if attachment.is_bytes():
+                    email.attach(attachment.filename, attachment.content, constants.MIME_TYPE_ZIP)
+                else:
+                    email.attach_file(attachment.path, constants.MIME_TYPE_STREAM)
+        else:
+            attachments = self.zip_attachments()
+            if attachments:
+                email.attach('%s.zip' % self.mail_title, attachments, constants.MIME_TYPE_ZIP)
+        email.send()
+        # パスワードを送信する。
+        self.send_password(mail_connection, user=user)
+
+    @classmethod
+    def send_many(cls, mails, user=None):
+        """複数のメールを１つのSMTP接続でまとめて送信する。
+
+        １件エラーになっても残りのメールは送信する。
+        接続が切れた場合は次のメールの前に接続しなおす。
+
+        :param mails: Mailのリスト
+        :param user: 送信者（送信ログに記録する）
+        :return: メールごとのエラーメッセージのリスト、送信できたメールはNone
+        """
+        errors = []
+        if not mails:
+            return errors
+        with smtp_pool.connection() as backend:
+            for mail in mails:
+                try:
+                    if backend.connection is None:
+                        backend.open()
+                    mail.send_email(user, connection=backend)
+                    errors.append(None)
+                except Exception as ex:
+                    errors.append(getattr(ex, 'message', None) or str(ex))
+                    if not smtp_pool.is_alive(backend):
+                        smtp_pool.close(backend)
+        return errors
 
     def send_password(self, conn, user=None):
         if self.attachment_list and self.is_encrypt and self.password:
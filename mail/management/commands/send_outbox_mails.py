@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from mail import outbox
+from utils import common, constants
+
+
+class Command(BaseCommand):
+    help = '送信キュー（eb_mail_outbox）のメールを送信する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='終了しないで送信待ちのメールを待ち続ける')
+        parser.add_argument('--interval', type=int, default=5, help='送信待ちのメールを確認する間隔（秒）')
+        parser.add_argument('--batch-size', type=int, default=20, dest='batch_size', help='１回に取得する件数')
+
+    def handle(self, *args, **options):
+        sent = outbox.run_worker(
+            loop=options.get('loop'),
+            interval=options.get('interval'),
+            batch_size=options.get('batch_size'),
+            progress=self.show_progress,
+        )
+        self.stdout.write(self.style.SUCCESS('{}件送信しました。'.format(sent)))
+
+    def show_progress(self, job, status, message):
+        line = '{} {}：{}'.format(job.pk, job.mail_title, common.get_choice_name_by_key(constants.CHOICE_MAIL_OUTBOX_STATUS, status))
+        if message:
+            line += '（{}）'.format(message)
+        self.stdout.write(line)
@@ -1,13 +1,17 @@
+import copy
+
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.template import Context, Template
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
+from .template_cache import template_cache
 from master.models import Company
-from utils import constants, common
+from utils import constants, common, procedure_cache
 from utils.errors import CustomException
+from utils.master_cache import master_cache
 from utils.models import BaseModel
 
 
@@ -81,34 +85,41 @@ class MailGroup(BaseModel):
 
         :return:
         """
-        qs = MailCcList.objects.filter(group=self, is_bcc=False, is_deleted=False)
-        return [item.email for item in qs]
+        return [email for email, is_bcc in self.get_cc_bcc_list() if not is_bcc]
 
     def get_bcc_list(self):
         """メール送信時のＢＣＣ一覧を取得する。
 
         :return:
         """
-        qs = MailCcList.objects.filter(group=self, is_bcc=True, is_deleted=False)
-        return [item.email for item in qs]
+        return [email for email, is_bcc in self.get_cc_bcc_list() if is_bcc]
+
+    def get_cc_bcc_list(self):
+        return list(master_cache.get('mail_cc_list:{}'.format(self.pk), lambda: list(MailCcList.objects.filter(
+            group=self, is_deleted=False
+        ).values_list('email', 'is_bcc')), (MailCcList._meta.db_table,)))
 
     @classmethod
     def get_mail_group_by_code(cls, code):
         """指定コードによってメールグループを取得する。
 
+        キャッシュしたインスタンスは全てのリクエストで共有するので、コピーを返す。
+
         :param code:
         :return:
         """
-        try:
-            return MailGroup.objects.get(code=code)
-        except ObjectDoesNotExist:
+        groups = master_cache.get('mail_group:{}'.format(code), lambda: list(MailGroup.objects.filter(
+            code=code
+        ).select_related('template', 'footer')), (MailGroup._meta.db_table, MailTemplate._meta.db_table))
+        if not groups:
             raise CustomException(constants.ERROR_MAIL_GROUP_NOT_FOUND.format(
                 name=common.get_choice_name_by_key(constants.CHOICE_MAIL_GROUP, code)
             ))
-        except MultipleObjectsReturned:
+        elif len(groups) > 1:
             raise CustomException(constants.ERROR_MAIL_GROUP_MULTI_FOUND.format(
                 name=common.get_choice_name_by_key(constants.CHOICE_MAIL_GROUP, code)
             ))
+        return copy.deepcopy(groups[0])
 
     @classmethod
     def get_partner_order_group(cls):
@@ -122,17 +133,39 @@ class MailGroup(BaseModel):
         """
         if 'company' not in context:
             context['company'] = Company.get_company()
+        return self.render_content(context)
+
+    def render_many(self, contexts):
+        """複数のコンテキストでメールテンプレートの内容を取得する。
+
+        コンパイル済みのテンプレートと自社情報は全てのコンテキストで共有する。
+
+        :param contexts: コンテキストのリスト
+        :return: get_template_content()と同じ内容のリスト
+        """
+        company = None
+        for context in contexts:
+            if 'company' not in context:
+                if company is None:
+                    company = Company.get_company()
+                context['company'] = company
+        return [self.render_content(context) for context in contexts]
+
+    def render_content(self, context):
         ctx = Context(context)
-        t_title = Template(context.get('mail_title') if 'mail_title' in context else self.template.mail_title)
-        t_body = Template(context.get('mail_body') if 'mail_body' in context else self.template.mail_body)
-        t_pwd_title = Template(self.template.pass_title) if self.template.pass_title else None
-        t_password = Template(self.template.pass_body) if self.template.pass_body else None
+        t_title = Template(context.get('mail_title')) if 'mail_title' in context \
+            else template_cache.get(self.template, 'mail_title')
+        t_body = Template(context.get('mail_body')) if 'mail_body' in context \
+            else template_cache.get(self.template, 'mail_body')
+        t_pwd_title = template_cache.get(self.template, 'pass_title')
+        t_password = template_cache.get(self.template, 'pass_body')
         comment = self.template.description or ''
-        title = t_title.render(ctx)
-        body = t_body.render(ctx)
+        title = t_title.render(ctx) if t_title else ''
+        body = t_body.render(ctx) if t_body else ''
         ctx.update({'mail_title': title})
-        if self.footer:
-            footer = Template(self.footer.mail_body).render(ctx)
+        t_footer = template_cache.get(self.footer, 'mail_body') if self.footer else None
+        if t_footer:
+            footer = t_footer.render(ctx)
             body = common.join_html(body, footer)
         return {
             'index': context.get('index', None),            # 複数のメール同時送信時、indexが必要
@@ -154,21 +187,36 @@ class MailGroup(BaseModel):
         :param context:
         :return:
         """
-        content = self.get_template_content(context)
-        cc_list = context.get('cc_list') if 'cc_list' in context else [cc.email for cc in self.get_cc_list()]
-        bcc_list = context.get('bcc_list') if 'bcc_list' in context else [bcc.email for bcc in self.get_bcc_list()]
-        return {
-            'sender': self.get_full_sender(),
-            'recipient_list': context.get('recipient'),
-            'cc_list': cc_list,
-            'bcc_list': bcc_list,
-            'mail_title': content.get('title'),
-            'mail_body': content.get('body'),
-            'attachment_list': context.get('attachment_list'),
-            'pass_title': content.get('pwd_title', None),
-            'pass_body': content.get('password', None),
-            'is_encrypt': context.get('is_encrypt', False),
-        }
+        return self.get_mail_data_many([context])[0]
+
+    def get_mail_data_many(self, contexts):
+        """複数のコンテキストで送信するメールのデータを取得する。
+
+        ＣＣとＢＣＣの一覧は一度だけ取得する。
+
+        :param contexts: コンテキストのリスト
+        :return: メールデータのリスト
+        """
+        cc_list = bcc_list = None
+        if any('cc_list' not in context for context in contexts):
+            cc_list = self.get_cc_list()
+        if any('bcc_list' not in context for context in contexts):
+            bcc_list = self.get_bcc_list()
+        data_list = []
+        for context, content in zip(contexts, self.render_many(contexts)):
+            data_list.append({
+                'sender': self.get_full_sender(),
+                'recipient_list': context.get('recipient'),
+                'cc_list': context.get('cc_list') if 'cc_list' in context else list(cc_list),
+                'bcc_list': context.get('bcc_list') if 'bcc_list' in context else list(bcc_list),
+                'mail_title': content.get('title'),
+                'mail_body': content.get('body'),
+                'attachment_list': context.get('attachment_list'),
+                'pass_title': content.get('pwd_title', None),
+                'pass_body': content.get('password', None),
+                'is_encrypt': context.get('is_encrypt', False),
+            })
+        return data_list
 
 
 class MailCcList(BaseModel):
@@ -210,3 +258,44 @@ class EMailLogEntry(models.Model):
         default_permissions = ()
         ordering = ('-action_time',)
         verbose_name = verbose_name_plural = "メール送信履歴"
+
+
+class MailOutbox(models.Model):
+    mail_title = models.CharField(max_length=255, blank=True, null=True, verbose_name="件名")
+    mail_data = models.TextField(verbose_name="メールデータ")
+    content_type = models.ForeignKey(
+        ContentType, blank=True, null=True, on_delete=models.SET_NULL, verbose_name="送信対象の種類"
+    )
+    object_id = models.IntegerField(blank=True, null=True, verbose_name="送信対象のＩＤ")
+    status = models.CharField(
+        max_length=2, default='01', choices=constants.CHOICE_MAIL_OUTBOX_STATUS, verbose_name="ステータス"
+    )
+    attempts = models.IntegerField(default=0, verbose_name="送信回数")
+    next_attempt_dt = models.DateTimeField(
+        default=timezone.now, db_column='next_attempt_date', verbose_name="次回送信日時"
+    )
+    locked_by = models.CharField(max_length=100, blank=True, null=True, verbose_name="ワーカー")
+    locked_dt = models.DateTimeField(blank=True, null=True, db_column='locked_date', verbose_name="ロック日時")
+    last_error = models.CharField(max_length=2000, blank=True, null=True, verbose_name="エラー")
+    result = models.TextField(blank=True, null=True, verbose_name="コールバックの結果")
+    created_user = models.ForeignKey(
+        User, related_name='created_mail_outbox', null=True, on_delete=models.PROTECT,
+        editable=False, verbose_name="作成者"
+    )
+    created_dt = models.DateTimeField(auto_now_add=True, db_column='created_date', verbose_name="作成日時")
+    updated_dt = models.DateTimeField(auto_now=True, db_column='updated_date', verbose_name="更新日時")
+    sent_dt = models.DateTimeField(blank=True, null=True, db_column='sent_date', verbose_name="送信日時")
+
+    class Meta:
+        managed = False
+        db_table = 'eb_mail_outbox'
+        default_permissions = ()
+        ordering = ('-id',)
+        verbose_name = verbose_name_plural = "メール送信キュー"
+
+    def __str__(self):
+        return self.mail_title or str(self.pk)
+
+
+# マスターデータのキャッシュ（master_cache）で参照するテーブル
+procedure_cache.track_tables(MailTemplate._meta.db_table, MailGroup._meta.db_table, MailCcList._meta.db_table)
@@ -0,0 +1,284 @@
+"""メールの送信キュー
+
+画面から送信したメールはすぐに送信しないで eb_mail_outbox に登録し、
+ワーカー（send_outbox_mails コマンド）が別プロセスで送信するので、
+ＡＰＩの応答時間はメールサーバーの速度に影響されない。
+
+ワーカーは行ロックで送信するメールを取得するので、複数のワーカーを同時に実行してもいい。
+送信に失敗したメールは MAIL_OUTBOX_RETRY_DELAY 秒（既定値は60秒）後から、
+失敗するたびに倍の時間を空けて、MAIL_OUTBOX_MAX_ATTEMPTS 回（既定値は５回）まで送信しなおす。
+再送信は常駐のワーカー（send_outbox_mails --loop）か、cronで定期的に実行したワーカーが行う。
+"""
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import traceback
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .biz import call_mail_sent_callback
+from .mail import Mail
+from .models import MailOutbox
+from utils import common
+
+logger = common.get_system_logger()
+
+STATUS_WAITING = '01'
+STATUS_SENDING = '02'
+STATUS_SENT = '03'
+STATUS_RETRY = '04'
+STATUS_FAILED = '05'
+
+
+def get_max_attempts():
+    return getattr(settings, 'MAIL_OUTBOX_MAX_ATTEMPTS', 5)
+
+
+def get_lock_timeout():
+    return getattr(settings, 'MAIL_OUTBOX_LOCK_TIMEOUT', 1800)
+
+
+def get_retry_delay(attempts):
+    """再送信までの待ち時間（秒）を取得する。
+
+    :param attempts: 送信した回数
+    :return:
+    """
+    delay = getattr(settings, 'MAIL_OUTBOX_RETRY_DELAY', 60)
+    return min(delay * (2 ** max(attempts - 1, 0)), 3600)
+
+
+def get_worker_id():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())[:100]
+
+
+def enqueue(mail_data, user=None, start_worker=True):
+    """メールを送信キューに登録する。
+
+    宛先と件名はここでチェックし、間違っている場合はすぐにエラーにする。
+    送信対象（content_type と object_id）に送信待ちのメールがある場合、新しい内容で置き換えるので、
+    同じメールが二重に送信されることはない。
+
+    :param mail_data: Mailの引数
+    :param user: 送信者
+    :param start_worker: Trueの場合、登録後にワーカーを起動する
+    :return: MailOutbox
+    """
+    mail_data = dict(mail_data)
+    mail_data.pop('attachment_list_choices', None)
+    mail = Mail(**mail_data)
+    mail.check_recipient()
+    mail.check_cc_list()
+    mail.check_bcc_list()
+    mail.check_mail_title()
+
+    content_type_id = int(mail_data['content_type']) if mail_data.get('content_type') else None
+    object_id = int(mail_data['object_id']) if mail_data.get('object_id') else None
+    with transaction.atomic():
+        outbox = None
+        if content_type_id and object_id:
+            outbox = MailOutbox.objects.select_for_update().filter(
+                content_type_id=content_type_id, object_id=object_id, status__in=(STATUS_WAITING, STATUS_RETRY),
+            ).first()
+        if outbox is None:
+            outbox = MailOutbox(created_user=user if getattr(user, 'pk', None) else None)
+        outbox.mail_title = (mail.mail_title or '')[:255]
+        outbox.mail_data = json.dumps(mail_data, cls=DjangoJSONEncoder, ensure_ascii=False)
+        outbox.content_type_id = content_type_id
+        outbox.object_id = object_id
+        outbox.status = STATUS_WAITING
+        outbox.attempts = 0
+        outbox.next_attempt_dt = timezone.now()
+        outbox.last_error = None
+        outbox.save()
+        if start_worker:
+            transaction.on_commit(start_worker_process)
+    return outbox
+
+
+def start_worker_process():
+    """送信待ちのメールを送信するワーカーを別プロセスで起動する。
+
+    ワーカーは送信待ちのメールがなくなったら終了する。
+    MAIL_OUTBOX_AUTO_WORKER が False の場合（常駐のワーカーを使う場合）は起動しない。
+
+    :return:
+    """
+    if not getattr(settings, 'MAIL_OUTBOX_AUTO_WORKER', True):
+        return None
+    args = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'send_outbox_mails']
+    try:
+        return subprocess.Popen(
+            args, cwd=settings.BASE_DIR, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, close_fds=True,
+        )
+    except OSError as ex:
+        # 起動できなくても、メールはキューに残っているので次のワーカーが送信する。
+        logger.error(ex)
+        return None
+
+
+def claim_jobs(worker_id, limit=20):
+    """送信するメールを取得して、送信中にする。
+
+    送信中のまま MAIL_OUTBOX_LOCK_TIMEOUT 秒（既定値は1800秒）過ぎたメールは、
+    ワーカーが異常終了したと判断して取得しなおす。
+    ワーカーはメールを１件送信するたびに残りのメールのロック日時を更新する（heartbeat）ので、
+    タイムアウトは１件の送信にかかる最大時間（EMAIL_TIMEOUT を参照）より十分に大きくすること。
+
+    :param worker_id: ワーカーの識別子
+    :param limit: 最大件数
+    :return: MailOutboxのリスト
+    """
+    now = timezone.now()
+    stale = now - datetime.timedelta(seconds=get_lock_timeout())
+    lock_options = {'skip_locked': True} if connection.features.has_select_for_update_skip_locked else {}
+    with transaction.atomic():
+        id_list = list(MailOutbox.objects.select_for_update(**lock_options).filter(
+            Q(status__in=(STATUS_WAITING, STATUS_RETRY), next_attempt_dt__lte=now) |
+            Q(status=STATUS_SENDING, locked_dt__lt=stale)
+        ).order_by('next_attempt_dt', 'pk').values_list('pk', flat=True)[:limit])
+        if id_list:
+            MailOutbox.objects.filter(pk__in=id_list).update(
+                status=STATUS_SENDING, locked_by=worker_id, locked_dt=now, attempts=F('attempts') + 1, updated_dt=now,
+            )
+    if not id_list:
+        return []
+    return list(MailOutbox.objects.filter(
+        pk__in=id_list, locked_by=worker_id, status=STATUS_SENDING,
+    ).select_related('created_user').order_by('pk'))
+
+
+def heartbeat(id_list, worker_id):
+    """取得したメールのロック日時を更新して、他のワーカーに取得されないようにする。
+
+    :param id_list: MailOutboxのＩＤのリスト
+    :param worker_id: ワーカーの識別子
+    :return: 更新した件数、他のワーカーに取得しなおされたメールは更新しない
+    """
+    if not id_list:
+        return 0
+    return MailOutbox.objects.filter(pk__in=id_list, locked_by=worker_id, status=STATUS_SENDING).update(
+        locked_dt=timezone.now(),
+    )
+
+
+def deliver(jobs, worker_id, progress=None):
+    """取得したメールを送信する。
+
+    メールは１件ずつ送信し、SMTP接続はプール（smtp_pool）で再利用する。
+    送信する前に、そのメールがまだこのワーカーのものか確認して、残りのメールのロック日時を更新する。
+
+    :param jobs: claim_jobs()で取得したMailOutboxのリスト
+    :param worker_id: ワーカーの識別子
+    :param progress: メールごとに呼ばれる関数、引数は (MailOutbox, ステータス, エラーメッセージ)
+    :return: 送信できた件数
+    """
+    sent = 0
+    for i, job in enumerate(jobs):
+        if not heartbeat([job.pk], worker_id):
+            logger.warning("送信キュー%sは他のワーカーに取得されたので、送信しません。" % job.pk)
+            continue
+        heartbeat([j.pk for j in jobs[i + 1:]], worker_id)
+        mail_data = json.loads(job.mail_data)
+        try:
+            error = Mail.send_many([Mail(**mail_data)], job.created_user)[0]
+        except Exception as ex:
+            logger.error(ex)
+            logger.error(traceback.format_exc())
+            error = getattr(ex, 'message', None) or str(ex)
+        if error:
+            status = on_failed(job, worker_id, error)
+        else:
+            status = on_sent(job, worker_id, mail_data)
+            sent += 1
+        if progress:
+            progress(job, status, error)
+    return sent
+
+
+def on_sent(job, worker_id, mail_data):
+    now = timezone.now()
+    updated = MailOutbox.objects.filter(pk=job.pk, locked_by=worker_id, status=STATUS_SENDING).update(
+        status=STATUS_SENT, sent_dt=now, locked_by=None, locked_dt=None, last_error=None, updated_dt=now,
+    )
+    if not updated:
+        # ロックがタイムアウトして他のワーカーに取得された場合、コールバックはそのワーカーが呼び出す。
+        logger.warning("送信キュー%sは送信しましたが、他のワーカーに取得されていました。" % job.pk)
+        return STATUS_SENT
+    error = None
+    result = None
+    try:
+        result = call_mail_sent_callback(mail_data)
+    except Exception as ex:
+        # メールは送信済みなので、コールバックのエラーでは再送信しない。
+        logger.error(ex)
+        logger.error(traceback.format_exc())
+        error = getattr(ex, 'message', None) or str(ex)
+    if error or result is not None:
+        MailOutbox.objects.filter(pk=job.pk).update(
+            last_error=error and error[:2000],
+            result=json.dumps(result, cls=DjangoJSONEncoder, ensure_ascii=False) if result is not None else None,
+        )
+    return STATUS_SENT
+
+
+def on_failed(job, worker_id, error):
+    now = timezone.now()
+    if job.attempts >= get_max_attempts():
+        status = STATUS_FAILED
+        next_attempt_dt = job.next_attempt_dt
+    else:
+        status = STATUS_RETRY
+        next_attempt_dt = now + datetime.timedelta(seconds=get_retry_delay(job.attempts))
+    MailOutbox.objects.filter(pk=job.pk, locked_by=worker_id, status=STATUS_SENDING).update(
+        status=status, next_attempt_dt=next_attempt_dt, locked_by=None, locked_dt=None, last_error=error[:2000],
+        updated_dt=now,
+    )
+    return status
+
+
+def run_worker(loop=False, interval=5, batch_size=20, progress=None):
+    """送信キューのメールを送信する。
+
+    :param loop: Trueの場合、終了しないで interval 秒ごとに送信待ちのメールを確認する
+    :param interval: 確認する間隔（秒）
+    :param batch_size: １回に取得する件数
+    :param progress: メールごとに呼ばれる関数、引数は (MailOutbox, ステータス, エラーメッセージ)
+    :return: 送信できた件数
+    """
+    worker_id = get_worker_id()
+    sent = 0
+    while True:
+        close_old_connections()
+        jobs = claim_jobs(worker_id, batch_size)
+        if jobs:
+            sent += deliver(jobs, worker_id, progress)
+        elif loop:
+            time.sleep(interval)
+        else:
+            break
+    return sent
+
+
+def retry(outbox, start_worker=True):
+    """送信に失敗したメールを送信しなおす。
+
+    :param outbox: MailOutbox
+    :param start_worker: Trueの場合、ワーカーを起動する
+    :return:
+    """
+    MailOutbox.objects.filter(pk=outbox.pk, status__in=(STATUS_RETRY, STATUS_FAILED)).update(
+        status=STATUS_WAITING, attempts=0, next_attempt_dt=timezone.now(), updated_dt=timezone.now(),
+    )
+    outbox.refresh_from_db()
+    if start_worker and outbox.status == STATUS_WAITING:
+        start_worker_process()
+    return outbox
@@ -1,3 +1,7 @@
+import json
+
+from rest_framework import serializers
+
 from . import models
 from utils.rest_base import BaseModelSerializer
 
@@ -7,3 +11,15 @@ class MailGroupSerializer(BaseModelSerializer):
     class Meta:
         model = models.MailGroup
         fields = '__all__'
+
+
+class MailOutboxSerializer(BaseModelSerializer):
+    status_name = serializers.CharField(source='get_status_display', read_only=True, label='ステータス名')
+    result = serializers.SerializerMethodField(read_only=True, label='コールバックの結果')
+
+    class Meta:
+        model = models.MailOutbox
+        exclude = ('mail_data', 'locked_by', 'locked_dt')
+
+    def get_result(self, obj):
+        return json.loads(obj.result) if obj.result else None
@@ -0,0 +1,19 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .models import MailGroup, MailTemplate
+from .template_cache import template_cache
+
+
+@receiver(post_save, sender=MailTemplate)
+@receiver(post_delete, sender=MailTemplate)
+def mail_template_changed(sender, instance, **kwargs):
+    """メールテンプレートが変更されたら、コンパイル済みのテンプレートを破棄する。"""
+    template_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=MailGroup)
+@receiver(post_delete, sender=MailGroup)
+def mail_group_changed(sender, **kwargs):
+    """メールグループのテンプレートとフッターが変更された場合に備えて、全て破棄する。"""
+    template_cache.invalidate()
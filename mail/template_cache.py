@@ -0,0 +1,55 @@
+import threading
+
+from django.template import Template
+
+
+class CompiledTemplateCache(object):
+    """コンパイル済みのメールテンプレートのキャッシュ
+
+    (モデル, ＩＤ, 項目名) ごとにコンパイルした django.template.Template を保持し、
+    更新日時（updated_dt）が変わらない間は使いまわす。
+    メールテンプレートとメールグループが保存された場合、invalidate()で破棄する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._templates = dict()
+
+    def invalidate(self, instance=None):
+        """キャッシュしたテンプレートを破棄する。
+
+        :param instance: 破棄するテンプレートのモデル、省略時は全て破棄する
+        :return:
+        """
+        with self._lock:
+            if instance is None:
+                self._templates = dict()
+            else:
+                label = instance._meta.label
+                for key in [k for k in self._templates if k[0] == label and k[1] == instance.pk]:
+                    del self._templates[key]
+
+    def get(self, instance, field_name):
+        """モデルの項目の内容をコンパイルしたテンプレートを取得する。
+
+        :param instance: MailTemplateなど
+        :param field_name: テンプレートの項目名
+        :return: 項目が空の場合はNone
+        """
+        source = getattr(instance, field_name)
+        if not source:
+            return None
+        version = getattr(instance, 'updated_dt', None)
+        if instance.pk is None or version is None:
+            return Template(source)
+        key = (instance._meta.label, instance.pk, field_name)
+        cached = self._templates.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        template = Template(source)
+        with self._lock:
+            self._templates[key] = (version, template)
+        return template
+
+
+template_cache = CompiledTemplateCache()
@@ -1,3 +1,81 @@
-from django.test import TestCase
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+import zipfile
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from utils import zip_writer
+from .mail import Mail, AttachmentFile
+
+
+def read_zip(data, password):
+    """ZIPの中のファイルを読み込む。
+
+    :param data: ZIPのバイト列
+    :param password: パスワード
+    :return: {ファイル名: バイト列}
+    """
+    with zipfile.ZipFile(io.BytesIO(data)) as zip_file:
+        files = {}
+        for info in zip_file.infolist():
+            # UTF-8のフラグがない場合、zipfileはファイル名をCP437でデコードする
+            filename = info.filename.encode('cp437').decode('cp932')
+            files[filename] = zip_file.read(info, pwd=password.encode('utf-8'))
+        return files
+
+
+class ZipWriterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_encrypted_zip(self):
+        path = os.path.join(self.temp_dir, 'order.pdf')
+        file_data = os.urandom(200 * 1024)
+        with open(path, 'wb') as f:
+            f.write(file_data)
+        bytes_data = '請求書'.encode('utf-8') * 50000
+        buff = io.BytesIO()
+        zip_writer.write_encrypted_zip(buff, [
+            ('請求書.xlsx', None, bytes_data),
+            ('注文書.pdf', path, None),
+            ('empty.txt', None, b''),
+        ], 'P@ssw0rd')
+
+        files = read_zip(buff.getvalue(), 'P@ssw0rd')
+        self.assertEqual(list(files), ['請求書.xlsx', '注文書.pdf', 'empty.txt'])
+        self.assertEqual(files['請求書.xlsx'], bytes_data)
+        self.assertEqual(files['注文書.pdf'], file_data)
+        self.assertEqual(files['empty.txt'], b'')
+        with self.assertRaises(RuntimeError):
+            read_zip(buff.getvalue(), 'wrong')
+
+    def test_stored_zip(self):
+        buff = io.BytesIO()
+        with zip_writer.ZipWriter(buff, password='abc', compression=zipfile.ZIP_STORED) as writer:
+            writer.write_bytes('a.txt', b'abc' * 1000)
+        self.assertEqual(read_zip(buff.getvalue(), 'abc'), {'a.txt': b'abc' * 1000})
+
+    @unittest.skipUnless(shutil.which('unzip'), 'unzip is not installed')
+    def test_unzip(self):
+        path = os.path.join(self.temp_dir, 'test.zip')
+        with open(path, 'wb') as f:
+            zip_writer.write_encrypted_zip(f, [('a.txt', None, b'abc' * 1000)], 'abc')
+        result = subprocess.run(['unzip', '-t', '-P', 'abc', path], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        self.assertEqual(result.returncode, 0, result.stdout)
+
+    def test_duplicate_attachments(self):
+        mail = Mail(attachment_list=[
+            AttachmentFile(content=b'old', filename='請求書.xlsx'),
+            AttachmentFile(content=b'abc', filename='a.txt'),
+            AttachmentFile(content=b'new', filename='請求書.xlsx'),
+        ], is_encrypt=True)
+        files = read_zip(mail.zip_attachments(), mail.password)
+        self.assertEqual(files, {'請求書.xlsx': b'new', 'a.txt': b'abc'})
@@ -1,8 +1,11 @@
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from . import models, serializers, biz
-from utils.rest_base import BaseModelViewSet
+from . import models, serializers, outbox
+from partner.biz import send_partner_order_mails
+from utils import constants
+from utils.errors import CustomException
+from utils.rest_base import BaseModelViewSet, BaseReadOnlyModelViewSet
 
 
 # Create your views here.
@@ -12,8 +15,35 @@ class MailGroupViewSet(BaseModelViewSet):
 
     @action(methods=['post'], detail=False)
     def send(self, request, *args, **kwargs):
-        data = biz.send_mail(request.data, request.user)
-        if data:
-            return Response(data)
-        else:
-            return Response({'detail': 'success'})
+        """メールを送信キューに登録する。
+
+        送信はワーカーが行うので、結果は mail-outbox で確認する。
+        """
+        mail_outbox = outbox.enqueue(request.data, request.user)
+        return Response(serializers.MailOutboxSerializer(mail_outbox).data)
+
+    @action(methods=['post'], url_path='send-partner-orders', detail=False)
+    def send_partner_orders(self, request, *args, **kwargs):
+        """指定年月の未送信のＢＰ注文書をまとめて送信キューに登録する。"""
+        year = request.data.get('year')
+        month = request.data.get('month')
+        if not year or not month:
+            raise CustomException(constants.ERROR_REQUIRE_FIELD.format(name='対象年月'))
+        results = send_partner_order_mails(str(year), '%02d' % int(month), request.user)
+        return Response({
+            'total': len(results),
+            'queued': len([r for r in results if r['outbox_id']]),
+            'results': results,
+        })
+
+
+class MailOutboxViewSet(BaseReadOnlyModelViewSet):
+    queryset = models.MailOutbox.objects.all()
+    serializer_class = serializers.MailOutboxSerializer
+    filter_fields = ('status', 'content_type', 'object_id')
+
+    @action(methods=['post'], detail=True)
+    def retry(self, request, *args, **kwargs):
+        """送信に失敗したメールを送信しなおす。"""
+        mail_outbox = outbox.retry(self.get_object())
+        return Response(self.get_serializer(mail_outbox).data)
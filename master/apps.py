@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class MasterConfig(AppConfig):
     name = 'master'
+
+    def ready(self):
+        from . import search, signals  # noqa
+        from utils import procedure_cache, search_service
+        signals.connect_model_changed(procedure_cache.get_tracked_tables())
+        signals.connect_search_target_changed(search_service.get_targets())
@@ -0,0 +1,43 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from master.models import Attachment, AttachmentBlob
+
+
+class Command(BaseCommand):
+    help = 'ファイルごとに保存した添付ファイルを、内容ごとの保存（mst_attachment_blob）に移行する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', dest='dry_run', help='移行しないで件数とサイズだけ表示する')
+
+    def handle(self, *args, **options):
+        dry_run = options.get('dry_run')
+        count = 0
+        saved = 0
+        hashes = set()
+        for attachment in Attachment.objects.exclude(path__startswith=AttachmentBlob.PATH_PREFIX).order_by('pk'):
+            path = attachment.path.path
+            if not os.path.exists(path):
+                self.stderr.write('{}: ファイルがありません。（{}）'.format(attachment.uuid, attachment.path.name))
+                continue
+            with open(path, 'rb') as f:
+                data = f.read()
+            count += 1
+            if dry_run:
+                hash_value = AttachmentBlob.get_hash(data)
+                if hash_value in hashes or AttachmentBlob.objects.filter(hash=hash_value).exists():
+                    saved += len(data)
+                hashes.add(hash_value)
+                continue
+            with transaction.atomic():
+                existed = AttachmentBlob.objects.filter(hash=AttachmentBlob.get_hash(data)).exists()
+                attachment.path.name = AttachmentBlob.add_ref(data)
+                attachment.save(update_fields=('path',))
+                transaction.on_commit(lambda p=path: os.remove(p))
+            if existed:
+                saved += len(data)
+        self.stdout.write('{}件{}、重複していたサイズ：{:,}バイト'.format(
+            count, '（移行しません）' if dry_run else 'を移行しました', saved
+        ))
@@ -0,0 +1,39 @@
+from importlib import import_module
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from utils.query_plan import query_planner
+from utils.rest_base import QueryPlanMixin
+
+
+def get_viewsets(cls=QueryPlanMixin):
+    for subclass in cls.__subclasses__():
+        if getattr(subclass, 'serializer_class', None) is not None:
+            yield subclass
+        for viewset in get_viewsets(subclass):
+            yield viewset
+
+
+class Command(BaseCommand):
+    help = 'ビューセットごとに、自動的に適用する select_related / prefetch_related を表示する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('viewset', nargs='*', help='ビューセットのクラス名、省略時は全て')
+
+    def handle(self, *args, **options):
+        # 全てのビューを読み込む
+        import_module(settings.ROOT_URLCONF)
+        names = options.get('viewset')
+        viewsets = sorted(set(get_viewsets()), key=lambda v: (v.__module__, v.__name__))
+        for viewset in viewsets:
+            if names and viewset.__name__ not in names:
+                continue
+            self.stdout.write('{}.{} ({})'.format(
+                viewset.__module__, viewset.__name__, viewset.serializer_class.__name__
+            ))
+            if not viewset.use_query_plan:
+                self.stdout.write('  (disabled)')
+                continue
+            plan = query_planner.get_plan(viewset.serializer_class)
+            self.stdout.write(plan.report() if plan else '  (no model)')
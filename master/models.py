@@ -1,15 +1,21 @@
+import copy
+import hashlib
+import io
 import os
 import uuid
 
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.base import File
 from django.core.validators import RegexValidator
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F
 from django.utils import timezone
 
-from utils import common, constants
+from utils import common, constants, procedure_cache
+from utils.master_cache import master_cache
 from utils.models import BaseModel, AbstractCompany, AbstractBankAccount
 
 
@@ -26,9 +32,11 @@ class Company(AbstractCompany):
     def get_company(cls):
         """自社情報を取得する。
 
+        キャッシュしたインスタンスは全てのリクエストで共有するので、コピーを返す。
+
         :return:
         """
-        return cls.objects.first()
+        return copy.deepcopy(master_cache.get('company', lambda: cls.objects.first(), (cls._meta.db_table,)))
 
 
 class Bank(BaseModel):
@@ -57,6 +65,20 @@ class Bank(BaseModel):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_bank(cls, code):
+        """金融機関を取得する。
+
+        キャッシュしたインスタンスは全てのリクエストで共有するので、コピーを返す。
+
+        :param code: 金融機関コード
+        :return:
+        """
+        banks = master_cache.get(
+            'banks', lambda: dict((bank.pk, bank) for bank in cls._base_manager.all()), (cls._meta.db_table,)
+        )
+        return copy.deepcopy(banks.get(code))
+
 
 # class BankBranch(BaseModel):
 #     bank = models.ForeignKey(Bank, on_delete=models.PROTECT, verbose_name="銀行")
@@ -132,6 +154,18 @@ class ExpensesCategory(BaseModel):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def get_categories(cls):
+        """全ての精算分類を取得する（削除済みも含む）。
+
+        キャッシュした辞書を全てのリクエストで共有するので、変更しないこと。
+
+        :return: ＩＤをキーとした辞書
+        """
+        return master_cache.get(
+            'expenses_categories', lambda: dict((c.pk, c) for c in cls._base_manager.all()), (cls._meta.db_table,)
+        )
+
 
 class Holiday(BaseModel):
     date = models.DateField(unique=True, verbose_name="日付")
@@ -174,14 +208,18 @@ class Attachment(BaseModel):
 
     @classmethod
     def save_from_bytes(cls, content_object, byte_file, filename, existed_file=None):
-        if existed_file:
-            try:
-                cls.objects.get(uuid=existed_file).delete()
-            except ObjectDoesNotExist:
-                pass
+        if AttachmentBlob.is_enabled():
+            # 内容ごとに１つだけ保存する。既存ファイルと同じ内容の場合があるので、先に参照を追加する。
+            with transaction.atomic():
+                attachment = cls(content_object=content_object, name=filename)
+                attachment.path.name = AttachmentBlob.add_ref(byte_file)
+                attachment.save()
+                cls.delete_by_uuid(existed_file)
+            return attachment
+
+        cls.delete_by_uuid(existed_file)
         byte_file.seek(0)
-        uploaded_file = ContentFile(byte_file.read())
-        uploaded_file.name = filename
+        uploaded_file = File(byte_file, name=filename)
         attachment = cls.objects.create(
             content_object=content_object,
             name=filename,
@@ -189,10 +227,278 @@ class Attachment(BaseModel):
         )
         return attachment
 
+    @classmethod
+    def delete_by_uuid(cls, file_uuid):
+        if file_uuid:
+            try:
+                cls.objects.get(uuid=file_uuid).delete()
+            except ObjectDoesNotExist:
+                pass
+
+    @classmethod
+    def save_from_render(cls, content_object, render_key, render, filename, existed_file=None):
+        """描画結果をキャッシュしてファイルを保存する。
+
+        既存のファイルが同じ内容（render_keyが同じ）の場合は、描画しないでそのまま使う。
+        他のファイルが同じ内容の場合は、そのファイルを参照する（link_from）。
+
+        :param content_object:
+        :param render_key: common.get_render_key() で取得したキー
+        :param render: ファイルを描画する関数（BytesIOを返す）
+        :param filename: ファイル名
+        :param existed_file: 既存ファイルのUUID
+        :return:
+        """
+        existed, cached = cls.get_render_cache(render_key, filename, existed_file)
+        if cached is not None and cached is existed:
+            return existed
+        attachment = None
+        if cached is not None:
+            attachment = cls.link_from(content_object, cached, filename, existed)
+        if attachment is None:
+            attachment = cls.save_from_bytes(content_object, render(), filename, existed_file)
+        AttachmentRender.objects.create(attachment=attachment, render_key=render_key)
+        return attachment
+
+    @classmethod
+    def get_render_cache(cls, render_key, filename, existed_file=None):
+        """同じ内容のファイルを取得する。
+
+        :param render_key: common.get_render_key() で取得したキー
+        :param filename: ファイル名
+        :param existed_file: 既存ファイルのUUID
+        :return: (既存のAttachment, 同じ内容のAttachment)
+        """
+        existed = cls.objects.filter(uuid=existed_file).select_related('render').first() if existed_file else None
+        if existed and existed.name == filename and existed.get_render_key() == render_key \
+                and os.path.exists(existed.path.path):
+            return existed, existed
+        cached = AttachmentRender.objects.filter(
+            render_key=render_key, attachment__is_deleted=False
+        ).select_related('attachment').order_by('-pk').first()
+        if cached and os.path.exists(cached.attachment.path.path):
+            return existed, cached.attachment
+        return existed, None
+
+    @classmethod
+    def link_from(cls, content_object, source, filename, existed=None):
+        """他のファイルと同じ内容のファイルを作成する。
+
+        内容ごとに保存したファイルの場合は参照を追加し、それ以外の場合はハードリンクを作成する。
+        ハードリンクできない場合（別のファイルシステムなど）はNoneを返す。
+
+        :param content_object:
+        :param source: リンク元のAttachment
+        :param filename: ファイル名
+        :param existed: 既存のAttachment
+        :return:
+        """
+        attachment = cls(content_object=content_object, name=filename)
+        if AttachmentBlob.is_blob_path(source.path.name):
+            with transaction.atomic():
+                name = AttachmentBlob.add_ref_by_path(source.path.name)
+                if name is None:
+                    return None
+                attachment.path.name = name
+                attachment.save()
+                if existed:
+                    existed.delete()
+            return attachment
+        attachment.path.name = common.get_attachment_path(attachment, filename)
+        path = attachment.path.path
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.link(source.path.path, path)
+        except OSError:
+            return None
+        if existed:
+            existed.delete()
+        attachment.save()
+        return attachment
+
+    def get_render_key(self):
+        try:
+            return self.render.render_key
+        except ObjectDoesNotExist:
+            return None
+
     def delete(self, using=None, keep_parents=False):
-        if os.path.exists(self.path.path):
-            os.remove(self.path.path)
+        if AttachmentBlob.is_blob_path(self.path.name):
+            with transaction.atomic():
+                AttachmentBlob.remove_ref(self.path.name)
+                super(BaseModel, self).delete(using, keep_parents)
+            return
+        # ロールバックされた場合にファイルだけ消えないように、コミット後に削除する。
+        path = self.path.path
         super(BaseModel, self).delete(using, keep_parents)
+        transaction.on_commit(lambda: os.path.exists(path) and os.remove(path))
+
+
+class AttachmentBlob(models.Model):
+    """添付ファイルの実体
+
+    ATTACHMENT_STORAGE_MODE が 'content' の場合、ファイルは内容のハッシュ値（SHA-256）で
+    content/ab/cd/<hash> に１つだけ保存し、Attachment はそのパスを参照する。
+    参照している Attachment の件数を ref_count に持ち、０になったらコミット後にファイルと行を削除する。
+    ファイルの書き込みと削除は行をロック（select_for_update）している間に行うので、
+    削除中の実体に参照が追加されてもファイルが消えることはない。
+    """
+    hash = models.CharField(max_length=64, unique=True, verbose_name="ハッシュ値")
+    path = models.CharField(max_length=100, verbose_name="パス")
+    size = models.BigIntegerField(default=0, verbose_name="サイズ")
+    ref_count = models.IntegerField(default=0, verbose_name="参照数")
+    created_dt = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+
+    class Meta:
+        managed = False
+        db_table = 'mst_attachment_blob'
+        default_permissions = ()
+        verbose_name = verbose_name_plural = "添付ファイルの実体"
+
+    PATH_PREFIX = 'content/'
+
+    @classmethod
+    def is_enabled(cls):
+        return getattr(settings, 'ATTACHMENT_STORAGE_MODE', 'uuid') == 'content'
+
+    @classmethod
+    def is_blob_path(cls, name):
+        return bool(name) and name.startswith(cls.PATH_PREFIX)
+
+    @classmethod
+    def get_path(cls, hash_value):
+        return '{}{}/{}/{}'.format(cls.PATH_PREFIX, hash_value[:2], hash_value[2:4], hash_value)
+
+    @classmethod
+    def get_hash(cls, data):
+        return hashlib.sha256(data).hexdigest()
+
+    @classmethod
+    def add_ref(cls, byte_file):
+        """ファイルの内容を保存し、参照数を１つ増やす。
+
+        BytesIOの場合はバッファーを直接ハッシュ計算とファイルの書き込みに使い、コピーしない。
+
+        :param byte_file: BytesIO または bytes
+        :return: Attachment.path に設定するパス
+        """
+        if isinstance(byte_file, io.BytesIO):
+            buffer = byte_file.getbuffer()
+        elif isinstance(byte_file, (bytes, bytearray, memoryview)):
+            buffer = memoryview(byte_file)
+        else:
+            byte_file.seek(0)
+            buffer = memoryview(byte_file.read())
+        try:
+            hash_value = cls.get_hash(buffer)
+            for retry in (True, False):
+                try:
+                    with transaction.atomic():
+                        # ロックする読み込みなので、他のトランザクションで削除された行は見えない。
+                        blob = cls.objects.select_for_update().filter(hash=hash_value).first()
+                        created = blob is None
+                        if created:
+                            blob = cls.objects.create(
+                                hash=hash_value, path=cls.get_path(hash_value), size=buffer.nbytes
+                            )
+                        full_path = os.path.join(settings.MEDIA_ROOT, blob.path)
+                        if created or not os.path.exists(full_path):
+                            write_file_atomic(full_path, buffer)
+                        cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                    return blob.path
+                except IntegrityError:
+                    # 同じ内容のファイルが同時に追加された場合は、その行を参照しなおす。
+                    if not retry:
+                        raise
+        finally:
+            buffer.release()
+
+    @classmethod
+    def add_ref_by_path(cls, name):
+        """保存済みのファイルの参照数を１つ増やす。
+
+        実体の行がない（削除された）場合は、ファイルが残っていればその内容で保存しなおす。
+
+        :param name: Attachment.path のパス
+        :return: Attachment.path に設定するパス、ファイルがない場合はNone
+        """
+        full_path = os.path.join(settings.MEDIA_ROOT, name)
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(hash=os.path.basename(name)).first()
+            if blob is not None and os.path.exists(full_path):
+                cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                return blob.path
+        try:
+            with open(full_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        return cls.add_ref(data)
+
+    @classmethod
+    def remove_ref(cls, name):
+        """参照数を１つ減らし、０になったらファイルを削除する（コミット後）。
+
+        :param name: Attachment.path のパス
+        :return:
+        """
+        hash_value = os.path.basename(name)
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(hash=hash_value).first()
+            if blob is None:
+                return
+            cls.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') - 1)
+            if blob.ref_count <= 1:
+                transaction.on_commit(lambda: cls.remove_file(hash_value, name))
+
+    @classmethod
+    def remove_file(cls, hash_value, name):
+        """参照されていない実体のファイルと行を削除する。
+
+        行をロックしてから削除するので、その間に add_ref() で参照が追加された場合は削除しない。
+
+        :param hash_value: ハッシュ値
+        :param name: Attachment.path のパス
+        :return:
+        """
+        with transaction.atomic():
+            blob = cls.objects.select_for_update().filter(hash=hash_value).first()
+            if blob is None or blob.ref_count > 0:
+                return
+            full_path = os.path.join(settings.MEDIA_ROOT, name)
+            if os.path.exists(full_path):
+                os.remove(full_path)
+            blob.delete()
+
+
+def write_file_atomic(full_path, buffer):
+    """一時ファイルに書き込んでから名前を変更するので、書き込み途中のファイルは見えない。
+
+    :param full_path:
+    :param buffer:
+    :return:
+    """
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    temp_path = '{}.{}.tmp'.format(full_path, uuid.uuid4().hex)
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(buffer)
+        os.replace(temp_path, full_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+class AttachmentRender(models.Model):
+    attachment = models.OneToOneField(Attachment, on_delete=models.CASCADE, related_name='render')
+    render_key = models.CharField(max_length=40, db_index=True, verbose_name="描画キャッシュキー")
+    created_dt = models.DateTimeField(auto_now_add=True, verbose_name="作成日時")
+
+    class Meta:
+        managed = False
+        db_table = 'mst_attachment_render'
+        default_permissions = ()
+        verbose_name = verbose_name_plural = "帳票ファイルの描画キャッシュ"
 
 
 class Config(models.Model):
@@ -211,21 +517,22 @@ class Config(models.Model):
     def get(cls, config_name, default_value=None, group_name=None):
         """システム設定を取得する。
 
-        DBから値を取得する。
+        全ての設定をまとめて読み込んでキャッシュする。
 
         :param config_name: 設定名
         :param default_value: デフォルト値
         :param group_name: グループ名
         :return:
         """
-        try:
-            c = cls.objects.get(name=config_name)
-            return c.value
-        except ObjectDoesNotExist:
-            if default_value is not None:
-                c = cls(group=group_name, name=config_name, value=default_value)
-                c.save()
-            return default_value
+        values = master_cache.get(
+            'configs', lambda: dict(cls.objects.values_list('name', 'value')), (cls._meta.db_table,)
+        )
+        if config_name in values:
+            return values[config_name]
+        if default_value is not None:
+            c = cls(group=group_name, name=config_name, value=default_value)
+            c.save()
+        return default_value
 
     @classmethod
     def get_bp_order_delivery_properties(cls):
@@ -250,3 +557,10 @@ class Config(models.Model):
         :return:
         """
         return cls.get(constants.CONFIG_BP_ORDER_CONTRACT_ITEMS, '', group_name=constants.CONFIG_GROUP_BP_ORDER)
+
+
+# マスターデータのキャッシュ（master_cache）で参照するテーブル
+procedure_cache.track_tables(
+    Company._meta.db_table, Bank._meta.db_table, ExpensesCategory._meta.db_table, Holiday._meta.db_table,
+    Config._meta.db_table,
+)
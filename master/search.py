@@ -0,0 +1,3 @@
+from utils.search_service import SearchTarget, register
+
+bank = register(SearchTarget('bank', 'master.Bank', ('name', 'kana', 'code')))
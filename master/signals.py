@@ -0,0 +1,85 @@
+from django.apps import apps
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .models import Config, Holiday
+from mail.connection import smtp_pool
+from utils import procedure_cache, search_service
+from utils.business_calendar import business_calendar
+from utils.master_cache import master_cache
+
+
+@receiver(post_save, sender=Holiday)
+@receiver(post_delete, sender=Holiday)
+def holiday_changed(sender, **kwargs):
+    """休日が変更されたら、営業日カレンダーのキャッシュを破棄する。"""
+    business_calendar.invalidate()
+
+
+@receiver(post_save, sender=Config)
+@receiver(post_delete, sender=Config)
+def config_changed(sender, **kwargs):
+    """システム設定が変更されたら、キャッシュしたメールサーバーの設定と接続を破棄する。"""
+    smtp_pool.invalidate()
+
+
+def model_changed(sender, **kwargs):
+    """データが変更されたら、そのテーブルを参照するプロシージャとマスターデータのキャッシュを無効にする。
+
+    ProjectRequest、ProjectMember、BpContract、OrganizationPeriodなど、
+    キャッシュで使うテーブル（procedure_cache.track_tables）のモデルだけに接続する。
+    """
+    if kwargs.get('action', 'post_').startswith('post_'):
+        procedure_cache.invalidate_tables(sender._meta.db_table)
+        master_cache.invalidate_tables(sender._meta.db_table)
+
+
+def connect_model_changed(tables):
+    """指定テーブルのモデル（多対多の中間テーブルを含む）に model_changed を接続する。
+
+    :param tables: テーブル名のリスト
+    :return:
+    """
+    if not apps.models_ready:
+        # モデルの読み込み後に、MasterConfig.ready() で登録済みのテーブルをまとめて接続する。
+        return
+    for model in apps.get_models(include_auto_created=True):
+        if model._meta.db_table in tables:
+            for signal in (post_save, post_delete, m2m_changed):
+                signal.connect(model_changed, sender=model, dispatch_uid='model_changed')
+
+
+@receiver(procedure_cache.tables_tracked)
+def tables_tracked(sender, tables, **kwargs):
+    """キャッシュで使うテーブルが登録されたら、そのモデルの変更を受け取る。"""
+    connect_model_changed(tables)
+
+
+def search_target_changed(sender, instance, signal, **kwargs):
+    """検索対象（関連先を含む）のデータが変更されたら、コミット後に検索のインデックスに反映する。
+
+    post_delete を受け取るモデルは QuerySet.delete() で一括削除できなくなるので、
+    全てのモデルではなく、検索対象とその関連先のモデルだけに接続する。
+    """
+    search_service.instance_changed(instance, deleted=signal is post_delete)
+
+
+def connect_search_target_changed(targets):
+    """検索対象とその関連先のモデルに search_target_changed を接続する。
+
+    :param targets: SearchTargetのリスト
+    :return:
+    """
+    if not apps.models_ready:
+        # モデルの読み込み後に、MasterConfig.ready() で登録済みの検索対象をまとめて接続する。
+        return
+    for target in targets:
+        for model in (target.model,) + tuple(target.related.values()):
+            for signal in (post_save, post_delete):
+                signal.connect(search_target_changed, sender=model, dispatch_uid='search_target_changed')
+
+
+@receiver(search_service.target_registered)
+def target_registered(sender, target, **kwargs):
+    """検索対象が登録されたら、そのモデルの変更を受け取る。"""
+    connect_search_target_changed([target])
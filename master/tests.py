@@ -1,3 +1,52 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+from django.test import SimpleTestCase
+
+from utils import jholiday
+
+
+class HolidayTableTest(SimpleTestCase):
+
+    def test_parity_with_holiday_name(self):
+        table = jholiday.holiday_table(1948, 2150)
+        date = datetime.date(1948, 1, 1)
+        end_date = datetime.date(2150, 12, 31)
+        while date <= end_date:
+            self.assertEqual(table.get(date), jholiday.holiday_name(date=date), date)
+            date += datetime.timedelta(days=1)
+
+    def test_year_holidays(self):
+        holidays = dict(jholiday.year_holidays(2019))
+        self.assertEqual(len(holidays), 19)
+        self.assertEqual(holidays[datetime.date(2019, 1, 14)], '成人の日')
+        self.assertEqual(holidays[datetime.date(2019, 3, 21)], '春分の日')
+        self.assertEqual(holidays[datetime.date(2019, 9, 23)], '秋分の日')
+        # 日曜日の祝日の翌日
+        self.assertEqual(holidays[datetime.date(2019, 5, 6)], '振替休日')
+        self.assertEqual(holidays[datetime.date(2019, 8, 12)], '振替休日')
+        self.assertEqual(holidays[datetime.date(2019, 11, 4)], '振替休日')
+        self.assertNotIn(datetime.date(2019, 5, 7), holidays)
+        # ５月３日、４日が日曜日の場合は５月６日が振替休日になる
+        self.assertEqual(dict(jholiday.year_holidays(2008))[datetime.date(2008, 5, 6)], '振替休日')
+        self.assertEqual(dict(jholiday.year_holidays(2014))[datetime.date(2014, 5, 6)], '振替休日')
+        # 敬老の日と秋分の日に挟まれた日
+        self.assertEqual(dict(jholiday.year_holidays(2015))[datetime.date(2015, 9, 22)], '国民の休日')
+        self.assertEqual(dict(jholiday.year_holidays(1988))[datetime.date(1988, 5, 4)], '国民の休日')
+        self.assertEqual(dict(jholiday.year_holidays(1989))[datetime.date(1989, 2, 24)], '昭和天皇の大喪の礼')
+        self.assertEqual(dict(jholiday.year_holidays(2016))[datetime.date(2016, 8, 11)], '山の日')
+        self.assertNotIn(datetime.date(2015, 8, 11), dict(jholiday.year_holidays(2015)))
+        # 祝日法の施行（1948年7月20日）前の祝日はない
+        self.assertEqual(jholiday.year_holidays(1948)[0], (datetime.date(1948, 9, 23), '秋分の日'))
+
+    def test_lookup_by_ordinal(self):
+        table = jholiday.holiday_table(2018)
+        self.assertEqual(table.get(datetime.date(2018, 1, 1).toordinal()), '元日')
+        self.assertEqual(table.get(datetime.date(2018, 12, 24)), '振替休日')
+        self.assertIsNone(table.get(datetime.date(2018, 12, 25)))
+
+    def test_out_of_range(self):
+        table = jholiday.holiday_table(2018, 2019)
+        with self.assertRaises(ValueError):
+            table.get(datetime.date(2020, 1, 1))
+        with self.assertRaises(ValueError):
+            jholiday.holiday_table(2019, 2018)
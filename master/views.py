@@ -1,16 +1,14 @@
 import os
 import base64
-import operator
-from functools import reduce
 
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
 
 from rest_framework.response import Response
 
 from . import models, serializers
-from utils import constants
+from utils import constants, search_service
 from utils.errors import CustomException
+from utils.file_response import get_file_response
 from utils.rest_base import BaseModelViewSet, BaseApiView
 
 
@@ -28,14 +26,7 @@ class BankViewSet(BaseModelViewSet):
 
     def get_queryset(self):
         search = self.request.GET.get('search')
-        queryset = self.queryset
-        if not search:
-            return queryset
-        else:
-            for bit in search.split():
-                or_queries = [Q(**{orm_lookup: bit}) for orm_lookup in ('code', 'name__icontains', 'kana__icontains')]
-                queryset = queryset.filter(reduce(operator.or_, or_queries))
-            return queryset
+        return search_service.filter_queryset(self.queryset, 'bank', search)
 
 
 class BankAccountViewSet(BaseModelViewSet):
@@ -58,3 +49,39 @@ class FileDownloadApiView(BaseApiView):
             })
         else:
             raise CustomException(constants.ERROR_FILE_NOT_FOUND)
+
+
+class FileStreamApiView(BaseApiView):
+    """ファイルをダウンロードする。
+
+    FileDownloadApiView と違って、ファイルをBase64に変換しないで少しずつ読み込んで返す。
+    Range と ETag（AttachmentのUUID）に対応する。
+    """
+
+    def get(self, request, *args, **kwargs):
+        attachment = get_object_or_404(models.Attachment, uuid=kwargs.get('uuid'))
+        path = attachment.path.path
+        if not os.path.exists(path):
+            raise CustomException(constants.ERROR_FILE_NOT_FOUND)
+        disposition = 'inline' if request.GET.get('inline') == '1' else 'attachment'
+        return get_file_response(request, path, attachment.name, attachment.uuid, disposition=disposition)
+
+
+class SearchApiView(BaseApiView):
+    """案件、顧客、協力会社、銀行、メンバーなどを横断検索する。
+
+    type にカンマ区切りで検索対象（project、customer など）を指定できる。
+    """
+
+    def get_context_data(self, **kwargs):
+        search = self.request.GET.get('search', None)
+        types = [t for t in self.request.GET.get('type', '').split(',') if t]
+        try:
+            limit = min(int(self.request.GET.get('limit', 20)), 100)
+        except ValueError:
+            limit = 20
+        results = search_service.search(search, types, limit)
+        return {
+            'count': len(results),
+            'results': results,
+        }
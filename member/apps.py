@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MemberConfig(AppConfig):
     name = 'member'
+
+    def ready(self):
+        from . import biz, search  # noqa
@@ -1,13 +1,52 @@
 from decimal import Decimal
 
+from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
-from django.db import connection
 from django.db.models import Max, Q, Count
 from django.utils import timezone
 
 from . import models
-from utils import common, constants
+from utils import common, constants, search_service
 from utils.errors import CustomException
+from utils.procedure_cache import CachedProcedure
+
+
+sp_member_status = CachedProcedure('sp_member_status', tables=(
+    'eb_member', 'eb_projectmember', 'eb_contract', 'eb_bp_contract',
+))
+sp_member_working_status = CachedProcedure('sp_member_working_status', tables=(
+    'eb_member', 'eb_project', 'eb_projectmember', 'eb_contract',
+))
+sp_partner_working_status = CachedProcedure('sp_partner_working_status', tables=(
+    'eb_member', 'eb_project', 'eb_projectmember', 'eb_bp_contract',
+))
+sp_salesperson_status = CachedProcedure('sp_salesperson_status', tables=(
+    'eb_projectmember', 'eb_salesperson', 'eb_membersalespersonperiod',
+))
+sp_search_member_by_ids = CachedProcedure('sp_search_member_by_ids', tables=(
+    'eb_member', 'eb_contract', 'eb_bp_contract', 'eb_subcontractor', 'eb_section', 'eb_membersectionperiod',
+    'eb_salesperson', 'eb_membersalespersonperiod',
+), timeout=60)
+sp_member_list = CachedProcedure('sp_member_list', tables=(
+    'eb_member', 'eb_contract', 'eb_bp_contract', 'eb_subcontractor', 'eb_projectmember', 'eb_section',
+    'eb_membersectionperiod', 'eb_salesperson', 'eb_membersalespersonperiod', 'eb_membersalesoffperiod',
+    'mst_salesofreason',
+))
+sp_project_dashboard = CachedProcedure('sp_project_dashboard', tables=(
+    'eb_project', 'eb_projectmember', 'eb_section',
+))
+sp_organization_dashboard = CachedProcedure('sp_organization_dashboard', tables=(
+    'eb_section', 'eb_membersectionperiod',
+))
+sp_salesperson_history = CachedProcedure('sp_salesperson_history', tables=(
+    'eb_salesperson', 'eb_membersalespersonperiod',
+))
+sp_organization_list = CachedProcedure('sp_organization_list', tables=(
+    'eb_member', 'eb_section', 'eb_membersectionperiod', 'eb_positionship',
+))
+sp_organization_members = CachedProcedure('sp_organization_members', tables=(
+    'eb_member', 'eb_projectmember', 'eb_section', 'eb_membersectionperiod', 'eb_positionship',
+))
 
 
 def get_me(user):
@@ -33,23 +72,17 @@ def get_me(user):
 
 
 def get_member_status():
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_member_status')
-        results = common.dictfetchall(cursor)
+    results = sp_member_status()
     return results[0] if results and len(results) > 0 else None
 
 
 def get_member_working_status():
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_member_working_status')
-        results = common.dictfetchall(cursor)
+    results = sp_member_working_status()
     return chart_working_status(results)
 
 
 def get_partner_working_status():
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_working_status')
-        results = common.dictfetchall(cursor)
+    results = sp_partner_working_status()
     return chart_working_status(results)
 
 
@@ -81,21 +114,23 @@ def chart_working_status(results):
 def search_member_by_name(keyword):
     """名前によってメンバーを検索する
 
-    :param keyword: 名前またはその一部
+    横断検索（search_service）で一致度の高い順に MEMBER_SEARCH_LIMIT 件（既定値は50件）まで検索し、
+    そのメンバーの契約と所属だけをプロシージャで取得する。
+
+    :param keyword: 名前（漢字、フリカナ、ローマ字）またはその一部
     :return:
     """
-    members = []
     if not keyword:
-        return members
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_search_member', (keyword,))
-        results = common.dictfetchall(cursor)
-    # ＩＤ重複したデータを消す
+        return []
+    member_id_list = search_service.search_ids('member', keyword, getattr(settings, 'MEMBER_SEARCH_LIMIT', 50))
+    if not member_id_list:
+        return []
+    results = sp_search_member_by_ids(','.join(str(member_id) for member_id in member_id_list))
+    # ＩＤ重複したデータを消す（最後の契約を使う）
+    members = dict()
     for item in results:
-        if len(members) > 0 and item.get('id') == members[-1].get('id'):
-            members.pop()
-        members.append(item)
-    return members
+        members[item.get('id')] = item
+    return [members[member_id] for member_id in member_id_list if member_id in members]
 
 
 def get_member_list(date=timezone.now().date()):
@@ -108,9 +143,7 @@ def get_member_list(date=timezone.now().date()):
         x['url'] = '/member/{pk}'.format(pk=x.get('id'))
         return x
 
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_member_list', (date,))
-        results = common.dictfetchall(cursor)
+    results = sp_member_list(date)
     members = list(map(set_detail_url, results))
     return members
 
@@ -121,9 +154,7 @@ def get_project_history(member_id):
     :param member_id:
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_project_dashboard', (member_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_project_dashboard(member_id)
     projects = []
     prev_p = None
     for p in results:
@@ -147,9 +178,7 @@ def get_organization_history(member_id):
     :param member_id:
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_organization_dashboard', (member_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_organization_dashboard(member_id)
     return results
 
 
@@ -159,25 +188,19 @@ def get_salesperson_history(member_id):
     :param member_id:
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_salesperson_history', (member_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_salesperson_history(member_id)
     return results
 
 
 def get_organization_list():
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_organization_list')
-        results = common.dictfetchall(cursor)
+    results = sp_organization_list()
     for row in results:
         row['url'] = '/organization/{pk}'.format(pk=row.get('id'))
     return results
 
 
 def get_organization_members(org_id):
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_organization_members', (org_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_organization_members(org_id)
     for row in results:
         if row.get('positions') is None:
             continue
@@ -244,9 +267,7 @@ def get_release_status():
 
 
 def get_salesperson_status():
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_salesperson_status')
-        results = common.dictfetchall(cursor)
+    results = sp_salesperson_status()
     return chart_salesperson_status(results)
 
 
@@ -0,0 +1,35 @@
+from utils.search_service import SearchTarget, register
+
+NAME_FIELDS = (
+    'last_name', 'first_name', 'last_name_ja', 'first_name_ja', 'last_name_en', 'first_name_en',
+    'common_last_name', 'common_first_name', 'common_last_name_ja', 'common_first_name_ja',
+)
+
+
+def get_name_texts(values):
+    """メンバーの検索対象の名前を取得する。
+
+    漢字、フリカナ、ローマ字、通称名のそれぞれについて、姓、名、姓名を対象とする。
+    ローマ字は「名 姓」の順でも検索できるようにする。
+
+    :param values: NAME_FIELDS の辞書
+    :return:
+    """
+    texts = []
+    for last_name, first_name in (
+            (values['last_name'], values['first_name']),
+            (values['last_name_ja'], values['first_name_ja']),
+            (values['last_name_en'], values['first_name_en']),
+            (values['common_last_name'], values['common_first_name']),
+            (values['common_last_name_ja'], values['common_first_name_ja']),
+    ):
+        texts.extend([last_name, first_name, (last_name or '') + (first_name or '')])
+    texts.append((values['first_name_en'] or '') + (values['last_name_en'] or ''))
+    return texts
+
+
+def get_name_label(values):
+    return '{} {}'.format(values['last_name'], values['first_name'])
+
+
+member = register(SearchTarget('member', 'member.Member', NAME_FIELDS, get_name_texts, get_name_label))
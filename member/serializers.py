@@ -31,6 +31,8 @@ class OrganizationSerializer(BaseModelSerializer):
     def get_parent_url(self, obj):
         return '/organization/{pk}'.format(pk=obj.parent.pk) if obj.parent else None
 
+    get_parent_url.related_fields = ('parent',)
+
 
 class PositionShipSerializer(BaseModelSerializer):
     member_name = serializers.CharField(source='member.full_name', read_only=True, label='メンバー')
@@ -1,3 +1,84 @@
-from django.test import TestCase
+from django.test import SimpleTestCase
 
-# Create your tests here.
+from utils.ngram_index import NgramIndex, normalize, split_keyword, to_hiragana, to_katakana
+from utils.search_service import MysqlFulltextBackend
+from .search import get_name_texts
+
+
+class NormalizeTest(SimpleTestCase):
+
+    def test_normalize(self):
+        self.assertEqual(normalize('ヤマダ　タロウ'), 'やまだたろう')
+        self.assertEqual(normalize('ﾔﾏﾀﾞ ﾀﾛｳ'), 'やまだたろう')
+        self.assertEqual(normalize('ＹＡＭＡＤＡ．Taro'), 'yamadataro')
+        self.assertEqual(normalize('ジョン・スミス'), 'じょんすみす')
+        self.assertEqual(normalize('ヴァ'), 'ゔぁ')
+        self.assertEqual(normalize('山田'), '山田')
+        self.assertEqual(normalize(123), '123')
+        self.assertEqual(normalize(None), '')
+
+    def test_kana(self):
+        self.assertEqual(to_hiragana('ヤマダ・ヴァ山田ー'), 'やまだ・ゔぁ山田ー')
+        self.assertEqual(to_katakana('やまだ・ゔぁ山田ー'), 'ヤマダ・ヴァ山田ー')
+
+    def test_fulltext_tokens(self):
+        # MySQLにはひらがな・小文字に変換しないトークンと、カタカナ・ひらがなの表記を渡す
+        self.assertEqual(MysqlFulltextBackend.get_tokens('ﾔﾏﾀﾞ　Taro やまだ ・'), ['ヤマダ', 'Taro'])
+        self.assertEqual(MysqlFulltextBackend.get_variants('ヤマダ'), ['ヤマダ', 'やまだ'])
+        self.assertEqual(MysqlFulltextBackend.get_variants('山田'), ['山田'])
+
+    def test_split_keyword(self):
+        self.assertEqual(split_keyword('山田　ﾀﾛｳ  山田'), ['山田', 'たろう'])
+        self.assertEqual(split_keyword(' ・ '), [])
+        self.assertEqual(split_keyword(''), [])
+
+
+class NgramIndexTest(SimpleTestCase):
+
+    def setUp(self):
+        self.index = NgramIndex()
+        self.index.add(1, ['山田 太郎', 'ヤマダ タロウ'])
+        self.index.add(2, ['山田太', 'ヤマダタ'])
+        self.index.add(3, ['小山田 花子', 'オヤマダ ハナコ'])
+        self.index.add(4, ['田中 一郎', 'タナカ イチロウ'])
+
+    def test_rank(self):
+        # 完全一致、前方一致、部分一致の順、同じ場合は文字列の短い順
+        self.assertEqual(self.index.search('山田太'), [2, 1])
+        self.assertEqual(self.index.search('やまだ'), [2, 1, 3])
+        self.assertEqual(self.index.search('田'), [4, 2, 1, 3])
+        self.assertEqual(self.index.rank('山田太郎'), [(1, 1.0)])
+        self.assertEqual(self.index.rank('やまだ'), [(2, 2 / 3.0), (1, 2 / 3.0), (3, 1 / 3.0)])
+        self.assertEqual(self.index.search('やまだ', limit=1), [2])
+
+    def test_and_search(self):
+        self.assertEqual(self.index.search('山田 ﾀﾛｳ'), [1])
+        self.assertEqual(self.index.search('山田 いちろう'), [])
+
+    def test_not_contiguous(self):
+        # バイグラムが全て含まれていても、連続していない場合は一致しない
+        self.index.add(5, ['あいう', 'いうえ'])
+        self.assertEqual(self.index.search('あいうえ'), [])
+
+    def test_replace_and_remove(self):
+        self.index.add(1, ['鈴木 次郎'])
+        self.assertEqual(self.index.search('たろう'), [])
+        self.assertEqual(self.index.search('鈴木'), [1])
+        self.index.remove(1)
+        self.index.remove(99)
+        self.assertNotIn(1, self.index)
+        self.assertEqual(self.index.search('鈴木'), [])
+        self.assertEqual(len(self.index), 3)
+        self.index.add(2, [None, ''])
+        self.assertNotIn(2, self.index)
+        self.assertEqual(self.index.search('山田'), [3])
+
+    def test_member_names(self):
+        index = NgramIndex()
+        index.add(1, get_name_texts({
+            'last_name': '山田', 'first_name': '太郎', 'last_name_ja': 'ヤマダ', 'first_name_ja': 'タロウ',
+            'last_name_en': 'Yamada', 'first_name_en': 'Taro', 'common_last_name': None,
+            'common_first_name': None, 'common_last_name_ja': None, 'common_first_name_ja': None,
+        }))
+        for keyword in ('山田太郎', 'やまだ たろう', 'taro yamada', 'TaroYamada', 'ﾔﾏﾀﾞﾀﾛｳ'):
+            self.assertEqual(index.search(keyword), [1], keyword)
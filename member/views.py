@@ -3,6 +3,7 @@ from rest_framework.response import Response
 from rest_framework_extensions.mixins import NestedViewSetMixin
 
 from . import models, serializers, biz
+from utils.query_executor import query_executor
 from utils.rest_base import BaseModelViewSet, BaseApiView
 
 
@@ -16,13 +17,13 @@ class MeApiView(BaseApiView):
 class DashboardApiView(BaseApiView):
 
     def get_context_data(self, **kwargs):
-        return {
-            'member_status': biz.get_member_status(),
-            'member_working_status': biz.get_member_working_status(),
-            'partner_working_status': biz.get_partner_working_status(),
-            'release_status': biz.get_release_status(),
-            'salesperson_status': biz.get_salesperson_status(),
-        }
+        return query_executor.run({
+            'member_status': biz.get_member_status,
+            'member_working_status': biz.get_member_working_status,
+            'partner_working_status': biz.get_partner_working_status,
+            'release_status': biz.get_release_status,
+            'salesperson_status': biz.get_salesperson_status,
+        })
 
 
 class MemberViewSet(NestedViewSetMixin, BaseModelViewSet):
@@ -41,12 +42,13 @@ class MemberViewSet(NestedViewSetMixin, BaseModelViewSet):
     def history(self, *args, **kwargs):
         pk = kwargs.get('pk')
         member = self.get_object()
-        return Response({
-            'member': serializers.MemberSerializer(member).data,
-            'projects': biz.get_project_history(pk),
-            'organizations': biz.get_organization_history(pk),
-            'salesperson': biz.get_salesperson_history(pk),
+        data = query_executor.run({
+            'projects': (biz.get_project_history, (pk,)),
+            'organizations': (biz.get_organization_history, (pk,)),
+            'salesperson': (biz.get_salesperson_history, (pk,)),
         })
+        data['member'] = serializers.MemberSerializer(member).data
+        return Response(data)
 
     @action(methods=['get'], url_path='project-history', detail=True)
     def project_history(self, *args, **kwargs):
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class PartnerConfig(AppConfig):
     name = 'partner'
+
+    def ready(self):
+        from . import biz, search  # noqa
@@ -1,22 +1,47 @@
 import datetime
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.contrib.humanize.templatetags import humanize
-from django.db import connection
+from django.db import transaction
 from django.db.models import Q
-from django.utils import timezone
 
 from . import models, serializers
+from mail import outbox
+from mail.models import MailGroup
 from master.models import Config
 from member.biz import get_member_salesperson_by_month
 from utils import common, constants
+from utils.business_calendar import business_calendar
 from utils.errors import CustomException
+from utils.procedure_cache import CachedProcedure
+
+
+sp_partner_list = CachedProcedure('sp_partner_list', tables=(
+    'eb_subcontractor', 'eb_bp_contract',
+))
+sp_partner_monthly_status = CachedProcedure('sp_partner_monthly_status', tables=(
+    # get_division_new() で組織（eb_section）を参照する
+    'eb_member', 'eb_subcontractor', 'eb_subcontractorrequest', 'eb_bp_contract', 'eb_section',
+    'eb_membersectionperiod',
+))
+sp_partner_members = CachedProcedure('sp_partner_members', tables=(
+    'eb_member', 'eb_subcontractor', 'eb_bp_contract', 'eb_projectmember', 'eb_section', 'eb_membersectionperiod',
+))
+sp_partner_member_orders = CachedProcedure('sp_partner_member_orders', tables=(
+    'eb_member', 'eb_subcontractor', 'eb_bp_contract', 'eb_bpmemberorder', 'eb_project', 'eb_projectmember',
+))
+sp_partner_lump_orders = CachedProcedure('sp_partner_lump_orders', tables=(
+    'eb_subcontractor', 'eb_bp_lump_contract', 'eb_bplumporder', 'eb_project', 'eb_salesperson',
+))
+sp_partner_contracts_by_month = CachedProcedure('sp_partner_contracts_by_month', tables=(
+    'eb_member', 'eb_subcontractor', 'eb_subcontractorrequest', 'eb_bp_contract', 'eb_bp_lump_contract',
+    'eb_project', 'eb_projectmember', 'eb_section', 'eb_membersectionperiod',
+))
 
 
 def get_partner_list():
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_list')
-        results = common.dictfetchall(cursor)
+    results = sp_partner_list()
     for row in results:
         row['url'] = '/partner/{pk}'.format(pk=row.get('id'))
     return results
@@ -36,9 +61,7 @@ def get_partner_employee_choices(partner_id):
 
 
 def get_partner_monthly_status(partner_id):
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_monthly_status', (partner_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_partner_monthly_status(partner_id)
     for row in results:
         row['url'] = '/partner/{partner_id}/division/{year}/{month}'.format(
             partner_id=partner_id,
@@ -54,9 +77,7 @@ def get_partner_members(partner_id):
     :param partner_id: 協力会社ID
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_members', (partner_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_partner_members(partner_id)
     for row in results:
         row['url'] = '/partner/{partner_id}/members/{member_id}'.format(
             partner_id=partner_id,
@@ -71,9 +92,7 @@ def get_partner_members_order_status(partner_id):
     :param partner_id:
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_member_orders', (partner_id, timezone.now().today()))
-        results = common.dictfetchall(cursor)
+    results = sp_partner_member_orders(partner_id, datetime.date.today())
     for row in results:
         row['url'] = '/partner/{partner_id}/members/{member_id}/orders'.format(
             partner_id=partner_id,
@@ -120,7 +139,7 @@ def get_partner_member_orders(member_id):
                     'month': month,
                     'end_year': year,
                     'end_month': month,
-                    'business_days': len(common.get_business_days(year, month)),
+                    'business_days': business_calendar.count(year, month),
                     'parent': project_member.pk,
                 })
     return results
@@ -256,9 +275,7 @@ def get_partner_member_contract(partner, member, year=None, month=None):
 
 
 def get_partner_lump_contracts(partner_id, contract_id=None):
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_lump_orders', (partner_id,))
-        results = common.dictfetchall(cursor)
+    results = sp_partner_lump_orders(partner_id)
     for row in results:
         row['order_url'] = '/partner/{partner_id}/order/{order_id}'.format(
             partner_id=partner_id,
@@ -270,9 +287,7 @@ def get_partner_lump_contracts(partner_id, contract_id=None):
 
 
 def get_partner_division_all_by_month(partner_id, year, month):
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_partner_contracts_by_month', (partner_id, year, month))
-        results = common.dictfetchall(cursor)
+    results = sp_partner_contracts_by_month(partner_id, year, month)
     for row in results:
         if row.get('id'):
             row['member_url'] = '/partner/{partner_id}/members/{member_Id}/orders'.format(
@@ -298,3 +313,41 @@ def get_partner_divisions_by_month(partner_id, year, month):
         else:
             existed_rows[0]['member_count'] += 1
     return data
+
+
+def send_partner_order_mails(year, month, user):
+    """指定年月の未送信のＢＰ注文書のメールをまとめて送信キューに登録する。
+
+    メールテンプレートは一度だけコンパイルして全ての注文書で使い、
+    ワーカーは全てのメールとパスワードのメールを１つのSMTP接続で送信する。
+    送信できた注文書はコールバックで送信済みにする。
+
+    :param year: 対象年
+    :param month: 対象月
+    :param user: 送信者
+    :return: 注文書ごとの登録結果
+    """
+    orders = []
+    for model in (models.BpMemberOrder, models.BpLumpOrder):
+        orders.extend(model.objects.filter(
+            year=year, month=month, is_sent=False, filename__isnull=False,
+        ).select_related('partner').order_by('order_no'))
+    group = MailGroup.get_partner_order_group()
+    cc_list = group.get_cc_list()
+    bcc_list = group.get_bcc_list()
+    results = []
+    for order, mail_data in zip(orders, group.get_mail_data_many([
+        order.get_mail_context(cc_list, bcc_list) for order in orders
+    ])):
+        result = {'order_id': order.pk, 'order_no': order.order_no, 'partner_name': order.partner.name}
+        mail_data['content_type'] = ContentType.objects.get_for_model(order).pk
+        mail_data['object_id'] = order.pk
+        try:
+            mail_outbox = outbox.enqueue(mail_data, user, start_worker=False)
+            result.update({'outbox_id': mail_outbox.pk, 'status': mail_outbox.status, 'message': None})
+        except CustomException as ex:
+            result.update({'outbox_id': None, 'status': None, 'message': ex.message})
+        results.append(result)
+    if any(result['outbox_id'] for result in results):
+        transaction.on_commit(outbox.start_worker_process)
+    return results
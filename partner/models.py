@@ -16,6 +16,7 @@ from mail.models import MailGroup
 from master.models import Bank, Attachment
 from member.models import Member
 from utils import constants, common
+from utils.business_calendar import business_calendar
 from utils.models import AbstractCompany, AbstractMember, BaseModel, AbstractBankAccount
 
 
@@ -210,11 +211,11 @@ class BpContract(BaseModel):
         elif self.calculate_type == '01':
             return 160
         elif self.calculate_type == '02':
-            return len(common.get_business_days(year, month)) * 8
+            return business_calendar.count(year, month) * 8
         elif self.calculate_type == '03':
-            return len(common.get_business_days(year, month)) * 7.9
+            return business_calendar.count(year, month) * 7.9
         elif self.calculate_type == '04':
-            return len(common.get_business_days(year, month)) * 7.75
+            return business_calendar.count(year, month) * 7.75
         else:
             return self.allowance_time_min
 
@@ -244,7 +245,7 @@ class BpContract(BaseModel):
             elif self.calculate_type == '04':
                 hours = 7.75
             allowance_time_memo += "   （%s＝%s月の営業日数(%s)×%s）" % (
-                allowance_time_min, month, len(common.get_business_days(year, month)), hours
+                allowance_time_min, month, business_calendar.count(year, month), hours
             )
         return allowance_time_memo
 
@@ -392,24 +393,39 @@ class AbstractPartnerOrder(BaseModel):
 
     def get_mail_data(self):
         group = MailGroup.get_partner_order_group()
+        mail_data = group.get_mail_data(self.get_mail_context(group.get_cc_list(), group.get_bcc_list()))
+        return self.update_mail_data(mail_data)
+
+    def get_mail_context(self, group_cc_list, group_bcc_list):
+        """注文書のメールテンプレートのコンテキストを取得する。
+
+        :param group_cc_list: メールグループのＣＣ一覧
+        :param group_bcc_list: メールグループのＢＣＣ一覧
+        :return:
+        """
         recipient_list, cc_list = self.partner.get_pay_notify_recipient_list()
-        cc_list.extend(group.get_cc_list())
-        bcc_list = group.get_bcc_list()
-        attachment_list_choices = [{
-            'value': item.uuid,
-            'display_name': item.name,
-        } for item in self.attachments.filter(is_deleted=False)]
-        mail_data = group.get_mail_data({
+        cc_list.extend(group_cc_list)
+        return {
             'recipient': recipient_list,
             'cc_list': cc_list,
-            'bcc_list': bcc_list,
+            'bcc_list': list(group_bcc_list),
             'attachment_list': [self.filename, self.filename_request],
             'subcontractor': self.partner,
             'deadline': self.get_deadline(),
             'month': self.month,
             'is_encrypt': True,
-        })
-        mail_data['attachment_list_choices'] = attachment_list_choices
+        }
+
+    def update_mail_data(self, mail_data):
+        """メールデータに添付ファイルの選択肢と送信対象を追加する。
+
+        :param mail_data:
+        :return:
+        """
+        mail_data['attachment_list_choices'] = [{
+            'value': item.uuid,
+            'display_name': item.name,
+        } for item in self.attachments.filter(is_deleted=False)]
         mail_data['content_type'] = ContentType.objects.get_for_model(self).pk
         mail_data['object_id'] = self.pk
         return mail_data
@@ -431,11 +447,7 @@ class AbstractPartnerOrder(BaseModel):
         """
         date = common.get_first_day_from_ym(self.year + self.month)
         next_month = common.add_months(date, 1)
-        business_days = common.get_business_days(next_month.year, next_month.month)
-        if len(business_days) > 5:
-            return business_days[5]
-        else:
-            return next_month
+        return business_calendar.get_nth_business_day(next_month.year, next_month.month, 6) or next_month
 
 
 class AbstractPartnerOrderHeading(BaseModel):
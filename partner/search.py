@@ -0,0 +1,3 @@
+from utils.search_service import SearchTarget, register
+
+partner = register(SearchTarget('partner', 'partner.Partner', ('name', 'kana')))
@@ -2,7 +2,8 @@ from rest_framework import serializers
 
 from . import models
 from member.models import Member
-from utils import constants, common
+from utils import constants
+from utils.business_calendar import business_calendar
 from utils.rest_base import BaseModelSerializer
 
 
@@ -97,7 +98,7 @@ class BpMemberOrderDisplaySerializer(BaseModelSerializer):
         if obj.business_days:
             return obj.business_days
         else:
-            return len(common.get_business_days(obj.year, obj.month))
+            return business_calendar.count(obj.year, obj.month)
 
     def get_order_url(self, obj):
         return '/partner/{partner_id}/members/{member_id}/orders/{order_id}'.format(
@@ -109,6 +110,9 @@ class BpMemberOrderDisplaySerializer(BaseModelSerializer):
     def get_parent(self, obj):
         return obj.project_member.pk
 
+    get_order_url.related_fields = ('project_member.member',)
+    get_parent.related_fields = ('project_member',)
+
 
 class BpLumpContractSerializer(BaseModelSerializer):
     company_name = serializers.CharField(source='company.name', read_only=True, label='会社名')
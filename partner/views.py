@@ -1,6 +1,8 @@
 import datetime
 import django_filters
 
+from functools import partial
+
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
@@ -16,7 +18,7 @@ from member.biz import get_next_bp_employee_id, get_member_salesperson_by_month
 from member.models import Organization
 from member.serializers import MemberSerializer, OrganizationPeriodSerializer, SalespersonPeriodSerializer
 from project.models import ProjectMember
-from utils import file_gen, common, constants
+from utils import file_gen, common, constants, search_service
 from utils.django_base import BaseTemplateViewWithoutLogin
 from utils.errors import CustomException
 from utils.rest_base import BaseModelViewSet, BaseApiView, BaseReadOnlyModelViewSet
@@ -39,6 +41,10 @@ class PartnerViewSet(BaseModelViewSet):
     filter_fields = ('name', 'president')
     filter_class = PartnerFilter
 
+    def get_queryset(self):
+        search = self.request.GET.get('search')
+        return search_service.filter_queryset(self.queryset, 'partner', search)
+
 
 class PartnerListApiView(BaseApiView):
 
@@ -207,15 +213,42 @@ class PartnerOrderCreateMixin(object):
         :param existed_uuid:
         :return:
         """
-        html = render_to_string(template_name, {'data': order_data})
-        byte_file = file_gen.generate_report_pdf_binary(html)
-        return Attachment.save_from_bytes(
+        return Attachment.save_from_render(
             instance,
-            byte_file,
+            common.get_render_key(template_name, order_data),
+            lambda: file_gen.generate_report_pdf_binary(render_to_string(template_name, {'data': order_data})),
             filename,
             existed_file=existed_uuid
         )
 
+    def create_order_files(self, instance, order_data, files):
+        """注文書と注文請書をまとめて作成
+
+        :param instance:
+        :param order_data:
+        :param files: (テンプレート名, ファイル名, 既存ファイルのUUID) のリスト
+        :return: Attachmentのリスト
+        """
+        render_keys = [common.get_render_key(template_name, order_data) for template_name, _, _ in files]
+        # 内容が変わったファイルだけまとめて描画する。
+        missing = [
+            i for i, (render_key, (_, filename, existed_uuid)) in enumerate(zip(render_keys, files))
+            if Attachment.get_render_cache(render_key, filename, existed_uuid)[1] is None
+        ]
+        html_list = [render_to_string(files[i][0], {'data': order_data}) for i in missing]
+        byte_files = dict(zip(missing, file_gen.generate_report_pdf_binaries(html_list))) if missing else {}
+
+        def render(i):
+            if i in byte_files:
+                return byte_files[i]
+            return file_gen.generate_report_pdf_binary(render_to_string(files[i][0], {'data': order_data}))
+
+        return [
+            Attachment.save_from_render(
+                instance, render_key, partial(render, i), filename, existed_file=existed_uuid
+            ) for i, (render_key, (_, filename, existed_uuid)) in enumerate(zip(render_keys, files))
+        ]
+
 
 class LumpOrderCreateApiView(BaseApiView, PartnerOrderCreateMixin):
 
@@ -251,16 +284,13 @@ class LumpOrderCreateApiView(BaseApiView, PartnerOrderCreateMixin):
         order.updated_user = request.user
         order.save(other_data=order_data)
         filename, filename_request = common.get_order_file_path(order.order_no, contract.project.name)
-        # 注文書
-        attachment = self.create_order_file(
-            order, 'partner/lump_order.html', order_data, filename, order.filename
-        )
+        # 注文書と注文請書
+        attachment, attachment_request = self.create_order_files(order, order_data, [
+            ('partner/lump_order.html', filename, order.filename),
+            ('partner/lump_order_request.html', filename_request, order.filename_request),
+        ])
         order.filename = attachment.uuid
-        # 注文請書
-        attachment = self.create_order_file(
-            order, 'partner/lump_order_request.html', order_data, filename_request, order.filename_request
-        )
-        order.filename_request = attachment.uuid
+        order.filename_request = attachment_request.uuid
         order.save(update_fields=('filename', 'filename_request'))
         return Response(biz.get_partner_lump_contracts(partner.pk, contract.pk))
 
@@ -301,16 +331,13 @@ class BpMemberOrderCreateApiView(BaseApiView, PartnerOrderCreateMixin):
         order.updated_user = request.user
         order.save(other_data=order_data)
         filename, filename_request = common.get_order_file_path(order.order_no, project_member.member.full_name)
-        # 注文書
-        attachment = self.create_order_file(
-            order, 'partner/member_order.html', order_data, filename, order.filename
-        )
+        # 注文書と注文請書
+        attachment, attachment_request = self.create_order_files(order, order_data, [
+            ('partner/member_order.html', filename, order.filename),
+            ('partner/member_order_request.html', filename, order.filename_request),
+        ])
         order.filename = attachment.uuid
-        # 注文請書
-        attachment = self.create_order_file(
-            order, 'partner/member_order_request.html', order_data, filename, order.filename_request
-        )
-        order.filename_request = attachment.uuid
+        order.filename_request = attachment_request.uuid
         order.save(update_fields=('filename', 'filename_request'))
         return Response(serializers.BpMemberOrderDisplaySerializer(order).data)
 
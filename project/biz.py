@@ -1,14 +1,23 @@
 import json
-import operator
-from functools import reduce
 
 from django.contrib.humanize.templatetags import humanize
-from django.db import connection
-from django.db.models import Q
 
 from . import models, serializers
-from utils import common, constants
+from master.models import Attachment, Bank, ExpensesCategory
+from utils import common, constants, file_gen, search_service
 from utils.errors import CustomException
+from utils.procedure_cache import CachedProcedure
+
+
+sp_project_attendance_list = CachedProcedure('sp_project_attendance_list', tables=(
+    'eb_projectmember', 'eb_memberattendance',
+))
+sp_project_attendance = CachedProcedure('sp_project_attendance', tables=(
+    'eb_member', 'eb_projectmember', 'eb_memberattendance',
+))
+sp_project_order_list = CachedProcedure('sp_project_order_list', tables=(
+    'eb_project', 'eb_clientorder', 'eb_clientorder_projects', 'eb_projectrequest', 'mst_attachment',
+))
 
 
 def get_project_choice(pk_list):
@@ -27,9 +36,7 @@ def get_project_attendance_list(project_id):
     :param project_id: 案件ＩＤ
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_project_attendance_list', (project_id,))
-        data = common.dictfetchall(cursor)
+    data = sp_project_attendance_list(project_id)
     for row in data:
         row['url'] = '/project/{pk}/attendance/{year}/{month}'.format(
             pk=project_id,
@@ -47,9 +54,7 @@ def get_project_attendance(project_id, year, month):
     :param month:
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_project_attendance', (project_id, year, month))
-        data = common.dictfetchall(cursor)
+    data = sp_project_attendance(project_id, year, month)
     return data
 
 
@@ -59,9 +64,7 @@ def get_project_order_list(project_id):
     :param project_id: 案件ＩＤ
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_project_order_list', (project_id,))
-        data = common.dictfetchall(cursor)
+    data = sp_project_order_list(project_id)
     for row in data:
         row['projects'] = json.loads(row['projects'])
         if row['request_no']:
@@ -79,14 +82,12 @@ def get_project_order_list(project_id):
 def search_project(keyword):
     """案件を検索する
 
+    案件名と顧客名を横断検索（search_service）で検索する。
+
     :param keyword:
     :return:
     """
-    queryset = models.Project.objects.all()
-    for bit in keyword.split():
-        or_queries = [Q(**{orm_lookup: bit}) for orm_lookup in ('name__icontains', 'customer__name__icontains')]
-        queryset = queryset.filter(reduce(operator.or_, or_queries))
-    return queryset
+    return search_service.filter_queryset(models.Project.objects.all(), 'project', keyword)
 
 
 def get_request_data(request_no):
@@ -113,6 +114,48 @@ def generate_request_data(company, project, customer_order, year, month, initial
     return data
 
 
+def save_project_request(project_request, request_data, user=None):
+    """作成した請求データで請求情報と請求書ファイルを保存する。
+
+    :param project_request: 請求情報
+    :param request_data: generate_request_data() で作成した請求データ
+    :param user: 作成者
+    :return: 請求書ファイル
+    """
+    heading = request_data.get('heading')
+    project_request.request_name = heading.get('CONTRACT_NAME')
+    project_request.amount = heading['ITEM_AMOUNT_ALL']
+    project_request.turnover_amount = heading.get('ITEM_AMOUNT_ATTENDANCE')
+    project_request.tax_amount = heading.get('ITEM_AMOUNT_ATTENDANCE_TAX')
+    project_request.expenses_amount = heading.get('ITEM_AMOUNT_EXPENSES')
+    project_request.created_user = user
+    project_request.updated_user = user
+    project_request.save(other_data=request_data)
+    filename = common.get_request_filename(project_request.request_no, heading.get('CONTRACT_NAME'))
+    attachment = Attachment.save_from_render(
+        project_request,
+        common.get_render_key(file_gen.REQUEST_TEMPLATE_NAME, [project_request.request_no, request_data]),
+        lambda: file_gen.generate_request(request_data, project_request.request_no),
+        filename,
+        existed_file=project_request.filename
+    )
+    project_request.filename = attachment.uuid
+    project_request.save(update_fields=('filename',))
+    return attachment
+
+
+def get_request_data_hash(request_data, request_no):
+    """請求データのハッシュ値を取得する。
+
+    請求書の内容が変わったかどうかの判断に使う。
+
+    :param request_data: generate_request_data() で作成した請求データ
+    :param request_no: 請求番号
+    :return:
+    """
+    return common.get_data_hash(request_no, request_data)
+
+
 def generate_request_heading(company, project, customer_order, year, month, initial):
     first_day = common.get_first_day_from_ym(year + month)
     first_day = project.start_date if project.start_date > first_day else first_day
@@ -170,7 +213,8 @@ def generate_request_heading(company, project, customer_order, year, month, init
         bank_account = customer_order.bank_account
     data['BANK_ACCOUNT'] = bank_account
     # 振込先銀行名称
-    data['BANK_NAME'] = bank_account.bank.name if bank_account else ""
+    bank = (Bank.get_bank(bank_account.bank_id) or bank_account.bank) if bank_account else None
+    data['BANK_NAME'] = bank.name if bank else ""
     # 支店番号
     data['BRANCH_NO'] = bank_account.branch_no if bank_account else ""
     # 支店名称
@@ -186,11 +230,88 @@ def generate_request_heading(company, project, customer_order, year, month, init
     return data
 
 
+class InvoiceDataLoader(object):
+    """請求書の作成に必要なデータを一括で取得する
+
+    対象メンバー、出勤情報、精算とメンバーを案件の人数に関係なく、一定のクエリ数で取得し、
+    請求書の明細の作成に使う。
+    """
+
+    def __init__(self, project, customer_order, year, month):
+        self.project = project
+        self.customer_order = customer_order
+        self.year = year
+        self.month = month
+        self.project_members = []
+        self.attendances = dict()
+        self.expenses = []
+        self.expenses_prices = dict()
+
+    def load(self):
+        """データを取得する。
+
+        :return: self
+        """
+        self.project_members = list(get_request_members_in_project(
+            self.project, self.customer_order, self.year, self.month
+        ).select_related('project', 'member'))
+        if not self.project_members:
+            return self
+        self.load_attendances()
+        self.load_expenses()
+        return self
+
+    def load_attendances(self):
+        queryset = models.MemberAttendance.objects.filter(
+            project_member__in=self.project_members,
+            year=self.year,
+            month=self.month,
+            is_deleted=False,
+        )
+        for attendance in queryset:
+            if attendance.project_member_id in self.attendances:
+                raise models.MemberAttendance.MultipleObjectsReturned()
+            self.attendances[attendance.project_member_id] = attendance
+
+    def load_expenses(self):
+        # 請求書の精算リストは str(month)、メンバーごとの精算金額は２桁の月で絞り込む。
+        list_month = str(self.month)
+        price_month = "%02d" % int(self.month)
+        queryset = models.MemberExpenses.objects.filter(
+            project_member__in=self.project_members,
+            year=str(self.year),
+            month__in={list_month, price_month},
+        ).order_by('category__name')
+        project_members = dict((project_member.pk, project_member) for project_member in self.project_members)
+        categories = ExpensesCategory.get_categories()
+        for expenses in queryset:
+            project_member = project_members[expenses.project_member_id]
+            expenses.project_member = project_member
+            if expenses.category_id in categories:
+                expenses.category = categories[expenses.category_id]
+            if expenses.month == price_month:
+                self.expenses_prices[project_member.pk] = self.expenses_prices.get(project_member.pk, 0) + expenses.price
+            if expenses.month == list_month and project_member.project_id == self.project.pk:
+                self.expenses.append(expenses)
+
+    def get_attendance_dict(self, project_member):
+        """ProjectMember.get_attendance_dict() と同じ内容を取得済みのデータから作成する。
+
+        :param project_member:
+        :return:
+        """
+        attendance = self.attendances.get(project_member.pk)
+        if attendance is None:
+            raise CustomException(constants.ERROR_NO_ATTENDANCE.format(name=project_member))
+        return project_member.build_attendance_dict(attendance, self.expenses_prices.get(project_member.pk))
+
+
 def generate_request_details(project, customer_order, year, month, heading):
     detail_all = dict()
     detail_members = []
     members_amount = 0
-    project_members = get_request_members_in_project(project, customer_order, year, month)
+    loader = InvoiceDataLoader(project, customer_order, year, month).load()
+    project_members = loader.project_members
     if project.is_lump:
         members_amount = project.lump_amount
         # 番号
@@ -226,7 +347,7 @@ def generate_request_details(project, customer_order, year, month, heading):
                 dict_item['ITEM_PRICE'] = project_member.price or 0
                 # Min/Max（H）
                 dict_item['ITEM_MIN_MAX'] = "%s/%s" % (project_member.min_hours, project_member.max_hours)
-                dict_item.update(project_member.get_attendance_dict(year, month))
+                dict_item.update(loader.get_attendance_dict(project_member))
             # 金額合計
             members_amount += dict_item['ITEM_AMOUNT_TOTAL']
             detail_members.append(dict_item)
@@ -235,7 +356,8 @@ def generate_request_details(project, customer_order, year, month, heading):
         project,
         year,
         month,
-        project_members
+        project_members,
+        expenses_list=loader.expenses,
     )
     tax_amount = common.get_consumption_tax(members_amount, project.customer.tax_rate, project.customer.decimal_type)
 
@@ -265,18 +387,18 @@ def get_request_members_in_project(project, customer_order, year, month):
     """
     first_day = common.get_first_day_from_ym(year + month)
     last_day = common.get_last_day_by_month(first_day)
-    if customer_order.projects.filter(is_deleted=False).count() > 1:
+    project_id_list = list(customer_order.projects.filter(is_deleted=False).values_list('pk', flat=True))
+    if len(project_id_list) > 1:
         # 一つの注文書に複数の案件がある場合
-        projects = customer_order.projects.filter(is_deleted=False)
         project_members = models.ProjectMember.objects.filter(
-            project__in=projects,
+            project__in=project_id_list,
             start_date__lte=last_day,
             end_date__gte=first_day,
             is_deleted=False,
         )
-    elif project.customerorder_set.filter(
+    elif len(project.customerorder_set.filter(
             start_date__lte=last_day, end_date__gte=first_day, is_deleted=False
-    ).count() > 1:
+    ).values_list('pk', flat=True)[:2]) > 1:
         # １つの案件に複数の注文書ある場合
         raise CustomException(constants.ERROR_NOT_IMPLEMENTED)
     else:
@@ -284,17 +406,22 @@ def get_request_members_in_project(project, customer_order, year, month):
     return project_members
 
 
-def get_request_expenses_list(project, year, month, project_members):
+def get_request_expenses_list(project, year, month, project_members, expenses_list=None):
     """請求書の精算リストを取得
 
     :param project: 案件
     :param year: 対象年
     :param month: 対象月
     :param project_members: アサインしたメンバー
+    :param expenses_list: 取得済みの精算リスト、省略時は get_project_expenses() で取得する
     :return:
     """
+    if expenses_list is None:
+        expenses_list = get_project_expenses(project, year, month, project_members).select_related(
+            'category', 'project_member__member'
+        )
     dict_expenses = {}
-    for expenses in get_project_expenses(project, year, month, project_members):
+    for expenses in expenses_list:
         if expenses.category.name not in dict_expenses:
             dict_expenses[expenses.category.name] = [expenses]
         else:
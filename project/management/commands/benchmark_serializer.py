@@ -0,0 +1,39 @@
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from rest_framework.renderers import JSONRenderer
+
+from project import serializers
+from project.samples import create_projects, create_vprojects
+
+
+class Command(BaseCommand):
+    help = 'BaseModelSerializerの行プランと従来の出力を比較する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='一覧の件数')
+        parser.add_argument('--repeat', type=int, default=5, help='繰り返し回数')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        for serializer_class, instances in (
+                (serializers.VProjectSerializer, create_vprojects(rows)),
+                (serializers.ProjectSerializer, create_projects(rows)),
+        ):
+            def by_plan():
+                return serializer_class(instances, many=True).data
+
+            def by_fields():
+                serializer = serializer_class(instances, many=True)
+                return [serializer.child.to_representation_by_fields(instance) for instance in instances]
+
+            if JSONRenderer().render(by_plan()) != JSONRenderer().render(by_fields()):
+                self.stderr.write('{}: 出力が一致しません。'.format(serializer_class.__name__))
+                continue
+            time_plan = min(timeit.repeat(by_plan, number=1, repeat=repeat))
+            time_fields = min(timeit.repeat(by_fields, number=1, repeat=repeat))
+            self.stdout.write('{}: {}件 従来 {:.1f}ms / 行プラン {:.1f}ms （{:.2f}倍）'.format(
+                serializer_class.__name__, rows, time_fields * 1000, time_plan * 1000, time_fields / time_plan,
+            ))
@@ -0,0 +1,55 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from project import models, request_batch
+from utils.errors import CustomException
+
+
+class Command(BaseCommand):
+    help = '指定年月の全ての案件の請求書を一括で作成する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('ym', nargs='?', help='対象年月（YYYYMM）')
+        parser.add_argument('--batch', type=int, help='実行する一括作成のＩＤ（中断した一括作成の再開など）')
+        parser.add_argument('--workers', type=int, help='ワーカー数')
+        parser.add_argument('--force', action='store_true', help='データが変わっていない請求書も作成しなおす')
+
+    def handle(self, *args, **options):
+        if options.get('batch'):
+            try:
+                batch = models.ProjectRequestBatch.objects.get(pk=options['batch'])
+            except models.ProjectRequestBatch.DoesNotExist:
+                raise CommandError('一括作成 {} は存在しません。'.format(options['batch']))
+        elif options.get('ym'):
+            ym = options['ym']
+            try:
+                datetime.datetime.strptime(ym, '%Y%m')
+            except ValueError:
+                raise CommandError('年月の形式が正しくありません：{}'.format(ym))
+            try:
+                batch = request_batch.create_batch(ym[:4], ym[4:])
+            except CustomException as ex:
+                raise CommandError(ex.message)
+        else:
+            raise CommandError('対象年月か一括作成のＩＤを指定してください。')
+
+        self.stdout.write('{}の請求書を作成します。（{}件、一括作成ＩＤ：{}）'.format(batch, batch.total, batch.pk))
+        try:
+            request_batch.run_batch(batch, options.get('workers'), options.get('force'), self.show_progress)
+        except CustomException as ex:
+            raise CommandError(ex.message)
+        message = '作成：{}件、変更なし：{}件、エラー：{}件'.format(batch.succeeded, batch.skipped, batch.failed)
+        if batch.failed:
+            self.stdout.write(self.style.ERROR(message))
+        else:
+            self.stdout.write(self.style.SUCCESS(message))
+
+    def show_progress(self, batch, item_id, status, message):
+        item = models.ProjectRequestBatchItem.objects.select_related('project').get(pk=item_id)
+        line = '[{}/{}] {} {}：{}'.format(
+            batch.processed, batch.total, item.request_no, item.project.name, item.get_status_display()
+        )
+        if message:
+            line += '（{}）'.format(message)
+        self.stdout.write(line)
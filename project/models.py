@@ -12,7 +12,8 @@ from django.utils import timezone
 from master.models import ProjectStage, BankAccount, ExpensesCategory
 from member.models import Member, Organization, Salesperson
 from partner.models import Partner
-from utils import constants, common
+from utils import constants, common, procedure_cache
+from utils.business_calendar import business_calendar
 from utils.errors import CustomException
 from utils.models import AbstractCompany, BaseModel, BaseView
 
@@ -276,6 +277,21 @@ class ProjectMember(BaseModel):
         :return:
         """
         attendance = self.get_attendance(year, month)
+        # 精算金額
+        expense = self.memberexpenses_set.filter(
+            year=str(year),
+            month="%02d" % int(month),
+            is_deleted=False
+        ).aggregate(price=Sum('price'))
+        return self.build_attendance_dict(attendance, expense.get('price'))
+
+    def build_attendance_dict(self, attendance, expenses_price):
+        """取得済みの出勤情報と精算金額から、請求書の明細を作成する。
+
+        :param attendance: MemberAttendanceのインスタンス
+        :param expenses_price: 精算金額の合計
+        :return:
+        """
         d = dict()
         # 勤務時間
         d['ITEM_WORK_HOURS'] = attendance.total_hours if attendance else ""
@@ -326,12 +342,7 @@ class ProjectMember(BaseModel):
             # 基本金額＋残業金額
             d['ITEM_AMOUNT_TOTAL'] = attendance.price if attendance else self.price
         # 精算金額
-        expense = self.memberexpenses_set.filter(
-            year=str(year),
-            month="%02d" % int(month),
-            is_deleted=False
-        ).aggregate(price=Sum('price'))
-        d['ITEM_EXPENSES_PRICE'] = expense.get('price') if expense.get('price') else 0
+        d['ITEM_EXPENSES_PRICE'] = expenses_price if expenses_price else 0
         # 備考
         d['ITEM_COMMENT'] = attendance.comment if attendance and attendance.comment else ""
         d['ITEM_OTHER'] = ""
@@ -535,9 +546,8 @@ class ProjectRequest(BaseModel):
         if other_data:
             data = other_data
             # 既存のデータを全部消す。
-            if hasattr(self, "projectrequestheading"):
-                self.projectrequestheading.delete()
-            self.projectrequestdetail_set.all().delete()
+            ProjectRequestDetail._base_manager.filter(project_request=self).delete()
+            ProjectRequestHeading._base_manager.filter(project_request=self).delete()
             heading = ProjectRequestHeading(
                 project_request=self,
                 is_lump=self.project.is_lump,
@@ -569,33 +579,17 @@ class ProjectRequest(BaseModel):
                 account_holder=data['heading']['BANK_ACCOUNT_HOLDER']
             )
             heading.save()
-            for i, item in enumerate(data['MEMBERS'], start=1):
+            members = data['MEMBERS']
+            costs = self.get_member_costs([item["EXTRA_PROJECT_MEMBER"] for item in members], [
+                item['ITEM_EXPENSES_PRICE'] for item in members
+            ])
+            details = []
+            for i, item in enumerate(members, start=1):
                 project_member = item["EXTRA_PROJECT_MEMBER"]
                 total_hours = item['ITEM_WORK_HOURS'] if item['ITEM_WORK_HOURS'] else 0
                 expenses_price = item['ITEM_EXPENSES_PRICE']
-                try:
-                    member_attendance = MemberAttendance.objects.get(
-                        project_member=project_member, year=self.year, month=self.month
-                    )
-                    with connection.cursor() as cursor:
-                        cursor.callproc('sp_project_member_cost', [
-                            project_member.member.pk,
-                            project_member.pk,
-                            self.year,
-                            self.month,
-                            len(common.get_business_days(self.year, self.month)),
-                            member_attendance.total_hours_bp or member_attendance.total_hours,
-                            member_attendance.allowance or 0,
-                            member_attendance.night_days or 0,
-                            member_attendance.traffic_cost or 0,
-                            expenses_price,
-                        ])
-                        dict_cost = common.dictfetchall(cursor)[0]
-                except Exception as ex:
-                    logger.error(ex)
-                    logger.error(traceback.format_exc())
-                    dict_cost = dict()
-                detail = ProjectRequestDetail(
+                dict_cost = costs.get(project_member.pk, dict())
+                details.append(ProjectRequestDetail(
                     project_request=self,
                     project_member=project_member,
                     year=self.year,
@@ -619,8 +613,77 @@ class ProjectRequest(BaseModel):
                     total_price=item['ITEM_AMOUNT_TOTAL'],
                     expenses_price=expenses_price,
                     comment=item['ITEM_COMMENT']
-                )
-                detail.save()
+                ))
+            ProjectRequestDetail.objects.bulk_create(details)
+            # 一括で削除、作成したのでシグナルは発生しない。売上集計は請求自体の post_save で更新される。
+            procedure_cache.invalidate_tables(
+                ProjectRequestHeading._meta.db_table, ProjectRequestDetail._meta.db_table
+            )
+
+    def get_member_costs(self, project_members, expenses_list):
+        """アサインした社員のコストをまとめて計算する。
+
+        出勤情報がない社員のコストは計算しない。
+        まとめて計算できない場合、社員ごとに計算しなおし、エラーになった社員のコストは計算しない。
+
+        :param project_members: ProjectMemberのリスト
+        :param expenses_list: 社員ごとの精算金額のリスト
+        :return: ProjectMemberのＩＤをキーとした、給料（salary）とコスト（cost）の辞書
+        """
+        attendances = dict()
+        for attendance in MemberAttendance.objects.filter(
+                project_member__in=project_members, year=self.year, month=self.month
+        ):
+            # 重複している場合は計算しない。
+            attendances[attendance.project_member_id] = (
+                None if attendance.project_member_id in attendances else attendance
+            )
+        business_days = business_calendar.count(self.year, self.month)
+        params = []
+        for project_member, expenses_price in zip(project_members, expenses_list):
+            attendance = attendances.get(project_member.pk)
+            if attendance is None:
+                logger.error(constants.ERROR_NO_ATTENDANCE.format(name=project_member))
+                continue
+            params.append((
+                project_member.member_id,
+                project_member.pk,
+                # 勤務時間が未入力の場合、文字列の 'None' を渡さないように０時間とする。
+                attendance.total_hours_bp or attendance.total_hours or 0,
+                attendance.allowance or 0,
+                attendance.night_days or 0,
+                attendance.traffic_cost or 0,
+                expenses_price or 0,
+            ))
+        if not params:
+            return dict()
+
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.callproc('sp_project_members_cost', [
+                    self.year,
+                    self.month,
+                    business_days,
+                    ';'.join(','.join(str(value) for value in row) for row in params),
+                ])
+                return dict((row['project_member_id'], row) for row in common.dictfetchall(cursor))
+        except Exception as ex:
+            logger.error(ex)
+            logger.error(traceback.format_exc())
+
+        costs = dict()
+        for row in params:
+            try:
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.callproc('sp_project_member_cost', [
+                        row[0], row[1], self.year, self.month, business_days,
+                        row[2], row[3], row[4], row[5], row[6],
+                    ])
+                    costs[row[1]] = common.dictfetchall(cursor)[0]
+            except Exception as ex:
+                logger.error(ex)
+                logger.error(traceback.format_exc())
+        return costs
 
 
 class ProjectRequestHeading(BaseModel):
@@ -723,3 +786,72 @@ class ProjectRequestDetail(BaseModel):
 
     def delete(self, using=None, keep_parents=False):
         return super(BaseModel, self).delete(using, keep_parents)
+
+
+class ProjectRequestBatch(models.Model):
+    year = models.CharField(max_length=4, verbose_name="対象年")
+    month = models.CharField(max_length=2, choices=constants.CHOICE_MONTH_LIST, verbose_name="対象月")
+    status = models.CharField(
+        max_length=2, default='01', choices=constants.CHOICE_REQUEST_BATCH_STATUS, verbose_name="ステータス"
+    )
+    total = models.IntegerField(default=0, verbose_name="対象件数")
+    succeeded = models.IntegerField(default=0, verbose_name="作成件数")
+    skipped = models.IntegerField(default=0, verbose_name="変更なし件数")
+    failed = models.IntegerField(default=0, verbose_name="エラー件数")
+    created_user = models.ForeignKey(
+        User, related_name='created_request_batches', null=True, on_delete=models.PROTECT,
+        editable=False, verbose_name="作成者"
+    )
+    created_dt = models.DateTimeField(auto_now_add=True, db_column='created_date', verbose_name="作成日時")
+    updated_dt = models.DateTimeField(auto_now=True, db_column='updated_date', verbose_name="更新日時")
+    finished_dt = models.DateTimeField(blank=True, null=True, db_column='finished_date', verbose_name="終了日時")
+    lock_key = models.CharField(
+        max_length=6, blank=True, null=True, unique=True, editable=False, verbose_name="実行中の対象年月"
+    )
+    locked_dt = models.DateTimeField(
+        blank=True, null=True, editable=False, db_column='locked_date', verbose_name="最終応答日時"
+    )
+
+    class Meta:
+        managed = False
+        db_table = 'eb_projectrequest_batch'
+        default_permissions = ()
+        ordering = ('-id',)
+        verbose_name = verbose_name_plural = "請求書一括作成"
+
+    def __str__(self):
+        return '{}年{}月'.format(self.year, self.month)
+
+    @property
+    def processed(self):
+        return self.succeeded + self.skipped + self.failed
+
+
+class ProjectRequestBatchItem(models.Model):
+    batch = models.ForeignKey(
+        ProjectRequestBatch, related_name='items', on_delete=models.CASCADE, verbose_name="一括作成"
+    )
+    project = models.ForeignKey(Project, on_delete=models.PROTECT, verbose_name="案件")
+    customer_order = models.ForeignKey(
+        CustomerOrder, db_column='client_order_id', on_delete=models.PROTECT, verbose_name="注文書"
+    )
+    request_no = models.CharField(max_length=7, blank=True, null=True, verbose_name="請求番号")
+    project_request = models.ForeignKey(
+        ProjectRequest, blank=True, null=True, on_delete=models.SET_NULL, verbose_name="請求"
+    )
+    status = models.CharField(
+        max_length=2, default='01', choices=constants.CHOICE_REQUEST_BATCH_ITEM_STATUS, verbose_name="ステータス"
+    )
+    input_hash = models.CharField(max_length=40, blank=True, null=True, verbose_name="入力データのハッシュ値")
+    message = models.CharField(max_length=2000, blank=True, null=True, verbose_name="メッセージ")
+    updated_dt = models.DateTimeField(auto_now=True, db_column='updated_date', verbose_name="更新日時")
+
+    class Meta:
+        managed = False
+        db_table = 'eb_projectrequest_batch_item'
+        default_permissions = ()
+        ordering = ('batch', 'id')
+        verbose_name = verbose_name_plural = "請求書一括作成明細"
+
+    def __str__(self):
+        return '{} {}'.format(self.project, self.customer_order)
@@ -0,0 +1,458 @@
+"""請求書の一括作成
+
+指定年月に実施中の案件と注文書の請求書をまとめて作成する。
+請求書ごとに別のトランザクションで作成するので、１件エラーになっても他の請求書は作成される。
+
+ワーカーはプロセスプールで実行し、データベースの接続はワーカーごとに１つ作成する。
+作成済みの請求書は作成に使ったデータのハッシュ値を記録し、再実行した時に
+データが変わっていない請求書は作成しなおさない。
+
+同じ年月の一括作成は同時に１つだけ登録できる（lock_key の一意制約）。実行中のプロセスは
+locked_dt を定期的に更新し、REQUEST_BATCH_LOCK_TIMEOUT 秒（既定値は600秒）以上更新されていない
+一括作成は、異常終了したものとして次の一括作成がエラーにして引き継ぐ。
+"""
+import datetime
+import io
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import traceback
+
+from functools import partial
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connections, transaction, IntegrityError
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import biz, models
+from master.models import Company
+from utils import common, constants
+from utils.errors import CustomException
+
+logger = common.get_system_logger()
+
+STATUS_WAITING = '01'
+STATUS_RUNNING = '02'
+STATUS_FINISHED = '03'
+STATUS_ERROR = '04'
+
+ITEM_PENDING = '01'
+ITEM_SUCCEEDED = '02'
+ITEM_SKIPPED = '03'
+ITEM_FAILED = '04'
+
+# 実行中のプロセスが locked_dt を更新する間隔（秒）
+HEARTBEAT_INTERVAL = 30
+
+
+def get_lock_timeout():
+    return getattr(settings, 'REQUEST_BATCH_LOCK_TIMEOUT', 600)
+
+
+def get_stale_condition():
+    """応答が途絶えた（locked_dt が古い）一括作成の条件
+
+    :return:
+    """
+    threshold = timezone.now() - datetime.timedelta(seconds=get_lock_timeout())
+    return Q(locked_dt__isnull=True) | Q(locked_dt__lt=threshold)
+
+
+def get_targets(year, month):
+    """指定年月の請求対象の案件と注文書を取得する。
+
+    複数の案件を持つ注文書の場合、請求書は注文書に１つだけなので、既に請求がある案件、
+    なければＩＤの一番小さい案件で作成する。
+
+    :param year: 対象年
+    :param month: 対象月
+    :return: (案件, 注文書) のリスト
+    """
+    first_day = common.get_first_day_from_ym(year + month)
+    last_day = common.get_last_day_by_month(first_day)
+    requested = dict(models.ProjectRequest.objects.filter(
+        year=year, month=month, customer_order__isnull=False,
+    ).values_list('customer_order_id', 'project_id'))
+    projects = dict()
+    for project_order in models.ProjectOrder.objects.filter(
+        customer_order__start_date__lte=last_day,
+        customer_order__end_date__gte=first_day,
+        customer_order__is_deleted=False,
+        project__start_date__lte=last_day,
+        project__end_date__gte=first_day,
+        project__is_deleted=False,
+    ).select_related('project__customer', 'customer_order').order_by('customer_order_id', 'project_id'):
+        order_id = project_order.customer_order_id
+        if order_id not in projects or requested.get(order_id) == project_order.project_id:
+            projects[order_id] = (project_order.project, project_order.customer_order)
+    return [projects[order_id] for order_id in sorted(projects)]
+
+
+@transaction.atomic
+def create_batch(year, month, user=None):
+    """一括作成を登録する。
+
+    新規の請求書の請求番号はここで採番するので、ワーカーが並列に作成しても重複しない。
+    同じ年月の一括作成が待機中または実行中の場合はエラーとする。
+
+    :param year: 対象年
+    :param month: 対象月
+    :param user: 実行者
+    :return: ProjectRequestBatch
+    """
+    release_stale_batch(year, month)
+    try:
+        with transaction.atomic():
+            batch = models.ProjectRequestBatch.objects.create(
+                year=year, month=month, created_user=user, lock_key=year + month, locked_dt=timezone.now(),
+            )
+    except IntegrityError:
+        raise CustomException(constants.ERROR_REQUEST_BATCH_RUNNING.format(year=year, month=month))
+    requests = dict(
+        ((r.project_id, r.customer_order_id), r.request_no)
+        for r in models.ProjectRequest.objects.filter(year=year, month=month)
+    )
+    # 前回エラーになった請求書は、前回採番した請求番号を使いまわして欠番を作らない。
+    used_request_no = set(requests.values())
+    reserved = dict()
+    for project_id, customer_order_id, request_no in models.ProjectRequestBatchItem.objects.filter(
+        batch__year=year, batch__month=month, project_request__isnull=True,
+    ).exclude(batch=batch).order_by('pk').values_list('project_id', 'customer_order_id', 'request_no'):
+        if request_no not in used_request_no:
+            reserved[(project_id, customer_order_id)] = request_no
+    reserved_request_no = set(reserved.values())
+    next_request_no = models.Project.get_next_request_no(year, month)
+    next_no = int(next_request_no[4:7])
+    items = []
+    for project, customer_order in get_targets(year, month):
+        request_no = requests.get((project.pk, customer_order.pk)) or reserved.get((project.pk, customer_order.pk))
+        while request_no is None:
+            request_no = '{}{}{:03d}'.format(year[2:], month, next_no)
+            next_no += 1
+            if request_no in reserved_request_no:
+                request_no = None
+        items.append(models.ProjectRequestBatchItem(
+            batch=batch,
+            project=project,
+            customer_order=customer_order,
+            request_no=request_no,
+        ))
+    models.ProjectRequestBatchItem.objects.bulk_create(items)
+    batch.total = len(items)
+    batch.save(update_fields=('total', 'updated_dt'))
+    return batch
+
+
+def start_batch_process(batch, workers=None, force=False):
+    """一括作成を別プロセスで実行する（generate_requests コマンド）。
+
+    プロセスの終了を別スレッドで待ち、異常終了した場合は一括作成をエラーにする。
+
+    :param batch: ProjectRequestBatch
+    :param workers: ワーカー数
+    :param force: Trueの場合、データが変わっていない請求書も作成しなおす
+    :return:
+    """
+    args = [sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'generate_requests', '--batch', str(batch.pk)]
+    if workers:
+        args.extend(['--workers', str(workers)])
+    if force:
+        args.append('--force')
+    process = subprocess.Popen(
+        args, cwd=settings.BASE_DIR, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, close_fds=True,
+    )
+    thread = threading.Thread(target=watch_batch_process, args=(batch.pk, process), daemon=True)
+    thread.start()
+    return process
+
+
+def watch_batch_process(batch_id, process):
+    """一括作成のプロセスの終了を待つ。
+
+    :param batch_id: ProjectRequestBatchのＩＤ
+    :param process: subprocess.Popen
+    :return:
+    """
+    returncode = process.wait()
+    if returncode == 0:
+        return
+    logger.error('request batch %s exited with code %s.', batch_id, returncode)
+    try:
+        release_batch(batch_id)
+    except Exception as ex:
+        logger.error(ex)
+        logger.error(traceback.format_exc())
+    finally:
+        connections.close_all()
+
+
+def release_batch(batch_id, condition=None):
+    """待機中または実行中の一括作成をエラーにして、対象年月のロックを解放する。
+
+    :param batch_id: ProjectRequestBatchのＩＤ
+    :param condition: 追加の条件
+    :return: 更新件数
+    """
+    queryset = models.ProjectRequestBatch.objects.filter(
+        pk=batch_id, status__in=(STATUS_WAITING, STATUS_RUNNING)
+    )
+    if condition is not None:
+        queryset = queryset.filter(condition)
+    now = timezone.now()
+    return queryset.update(status=STATUS_ERROR, lock_key=None, finished_dt=now, updated_dt=now)
+
+
+def release_stale_batch(year, month):
+    """指定年月の応答が途絶えた一括作成をエラーにして、ロックを解放する。
+
+    :param year: 対象年
+    :param month: 対象月
+    :return:
+    """
+    for batch in models.ProjectRequestBatch.objects.filter(lock_key=year + month).filter(get_stale_condition()):
+        if release_batch(batch.pk, get_stale_condition()):
+            logger.warning('request batch %s of %s/%s is taken over.', batch.pk, year, month)
+
+
+def lock_batch(batch):
+    """一括作成を実行中にする。
+
+    他のプロセスで実行中の場合、または同じ年月の他の一括作成が実行中の場合はエラーとする。
+
+    :param batch: ProjectRequestBatch
+    :return:
+    """
+    release_stale_batch(batch.year, batch.month)
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            updated = models.ProjectRequestBatch.objects.filter(
+                Q(status__in=(STATUS_WAITING, STATUS_FINISHED, STATUS_ERROR)) | get_stale_condition(), pk=batch.pk,
+            ).update(
+                status=STATUS_RUNNING, lock_key=batch.year + batch.month, locked_dt=now,
+                failed=F('failed') - batch.items.filter(status=ITEM_FAILED).count(),
+                finished_dt=None, updated_dt=now,
+            )
+    except IntegrityError:
+        updated = 0
+    if not updated:
+        raise CustomException(constants.ERROR_REQUEST_BATCH_RUNNING.format(year=batch.year, month=batch.month))
+    batch.refresh_from_db()
+
+
+def heartbeat(batch):
+    """実行中であることを記録する。
+
+    :param batch: ProjectRequestBatch
+    :return:
+    """
+    models.ProjectRequestBatch.objects.filter(pk=batch.pk).update(locked_dt=timezone.now())
+
+
+def get_running_batch(year, month):
+    return models.ProjectRequestBatch.objects.filter(
+        year=year, month=month, status__in=(STATUS_WAITING, STATUS_RUNNING)
+    ).exclude(get_stale_condition()).first()
+
+
+def run_batch(batch, workers=None, force=False, progress=None):
+    """一括作成を実行する。
+
+    未処理とエラーになった請求書を作成するので、中断した一括作成は再実行すれば続きから作成される。
+
+    :param batch: ProjectRequestBatch
+    :param workers: ワーカー数、省略時は settings.REQUEST_BATCH_WORKERS（既定値は４）
+    :param force: Trueの場合、データが変わっていない請求書も作成しなおす
+    :param progress: 請求書ごとに呼ばれる関数、引数は (ProjectRequestBatch, 明細のＩＤ, ステータス, メッセージ)
+    :return: ProjectRequestBatch
+    """
+    workers = workers or getattr(settings, 'REQUEST_BATCH_WORKERS', 4)
+    item_id_list = list(batch.items.filter(
+        status__in=(ITEM_PENDING, ITEM_FAILED)
+    ).values_list('pk', flat=True))
+    lock_batch(batch)
+    try:
+        process_items(batch, item_id_list, workers, force, progress)
+    except BaseException:
+        # 中断した場合も、次の一括作成を待たせない。未処理の請求書は再実行で作成される。
+        release_batch(batch.pk)
+        raise
+    update_batch_status(batch)
+    return batch
+
+
+def process_items(batch, item_id_list, workers, force, progress):
+    """請求書をワーカーで作成する。
+
+    :param batch: ProjectRequestBatch
+    :param item_id_list: 作成する明細のＩＤのリスト
+    :param workers: ワーカー数
+    :param force: Trueの場合、データが変わっていない請求書も作成しなおす
+    :param progress: 請求書ごとに呼ばれる関数
+    :return:
+    """
+    if not item_id_list:
+        return
+    func = partial(process_item, force=force)
+    if workers > 1 and len(item_id_list) > 1:
+        # 親プロセスの接続を子プロセスに引き継がない。
+        connections.close_all()
+        pool = multiprocessing.Pool(min(workers, len(item_id_list)), initializer=init_worker)
+        try:
+            results = pool.imap_unordered(func, item_id_list)
+            while True:
+                try:
+                    result = results.next(HEARTBEAT_INTERVAL)
+                except multiprocessing.TimeoutError:
+                    # 時間のかかる請求書でも、応答が途絶えたと判断されないようにする。
+                    heartbeat(batch)
+                    continue
+                except StopIteration:
+                    break
+                on_item_processed(batch, result, progress)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for item_id in item_id_list:
+            on_item_processed(batch, func(item_id), progress)
+    if batch.succeeded:
+        # 請求書ごとの売上集計の更新は並列に実行されるので、最後にもう一度集計しなおす。
+        ym = batch.year + batch.month
+        try:
+            call_command('rebuild_turnover', start=ym, end=ym, stdout=io.StringIO())
+        except Exception as ex:
+            logger.error(ex)
+            logger.error(traceback.format_exc())
+
+
+def init_worker():
+    # 親プロセスの接続は閉じてからフォークしているので、各ワーカーは最初のクエリで自分の接続を作成する。
+    connections.close_all()
+
+
+def on_item_processed(batch, result, progress):
+    item_id, status, message = result
+    field = {ITEM_SUCCEEDED: 'succeeded', ITEM_SKIPPED: 'skipped'}.get(status, 'failed')
+    now = timezone.now()
+    models.ProjectRequestBatch.objects.filter(pk=batch.pk).update(
+        **{field: F(field) + 1, 'updated_dt': now, 'locked_dt': now}
+    )
+    setattr(batch, field, getattr(batch, field) + 1)
+    if progress:
+        progress(batch, item_id, status, message)
+
+
+def update_batch_status(batch):
+    batch.status = STATUS_ERROR if batch.items.filter(status=ITEM_FAILED).exists() else STATUS_FINISHED
+    batch.finished_dt = timezone.now()
+    batch.lock_key = None
+    batch.save(update_fields=('status', 'finished_dt', 'lock_key', 'updated_dt'))
+
+
+def process_item(item_id, force=False):
+    """請求書を１件作成する（ワーカーで実行する）。
+
+    :param item_id: ProjectRequestBatchItemのＩＤ
+    :param force: Trueの場合、データが変わっていなくても作成しなおす
+    :return: (明細のＩＤ, ステータス, メッセージ)
+    """
+    try:
+        with transaction.atomic():
+            item = models.ProjectRequestBatchItem.objects.select_related(
+                'batch', 'batch__created_user', 'project__customer', 'customer_order__bank_account__bank',
+            ).get(pk=item_id)
+            status, message = create_request(item, force)
+    except Exception as ex:
+        logger.error(ex)
+        logger.error(traceback.format_exc())
+        status = ITEM_FAILED
+        message = getattr(ex, 'message', None) or str(ex) or ex.__class__.__name__
+        models.ProjectRequestBatchItem.objects.filter(pk=item_id).update(
+            status=status, message=message[:2000], updated_dt=timezone.now()
+        )
+    return item_id, status, message
+
+
+def create_request(item, force=False):
+    batch = item.batch
+    project = item.project
+    customer_order = item.customer_order
+    year, month = batch.year, batch.month
+    project_request = project.get_project_request(year, month, customer_order)
+    if not project_request.pk:
+        project_request.request_no = item.request_no
+    request_data = biz.generate_request_data(
+        Company.get_company(), project, customer_order, year, month, get_initial(project_request)
+    )
+    input_hash = biz.get_request_data_hash(request_data, project_request.request_no)
+
+    if not force and project_request.pk and project_request.filename and models.ProjectRequestBatchItem.objects.filter(
+        project_request=project_request, status__in=(ITEM_SUCCEEDED, ITEM_SKIPPED), input_hash=input_hash,
+    ).exists():
+        status = ITEM_SKIPPED
+    else:
+        biz.save_project_request(project_request, request_data, batch.created_user)
+        status = ITEM_SUCCEEDED
+    item.project_request = project_request
+    item.request_no = project_request.request_no
+    item.input_hash = input_hash
+    item.status = status
+    item.message = None
+    item.save()
+    return status, None
+
+
+def get_initial(project_request):
+    """作成済みの請求書の場合、前回の契約件名と振込先口座を使う。
+
+    :param project_request:
+    :return:
+    """
+    if not project_request.pk:
+        return None
+    initial = {'contract_name': project_request.request_name}
+    heading = models.ProjectRequestHeading.objects.filter(project_request=project_request).first()
+    if heading and heading.bank_account:
+        initial['bank_account'] = heading.bank_account
+    return initial
+
+
+def get_batch_data(batch, with_items=True):
+    """一括作成の進捗を取得する。
+
+    :param batch:
+    :param with_items: 明細を含むかどうか
+    :return:
+    """
+    data = {
+        'id': batch.pk,
+        'year': batch.year,
+        'month': batch.month,
+        'status': batch.status,
+        'status_name': batch.get_status_display(),
+        'total': batch.total,
+        'processed': batch.processed,
+        'succeeded': batch.succeeded,
+        'skipped': batch.skipped,
+        'failed': batch.failed,
+        'created_dt': batch.created_dt,
+        'finished_dt': batch.finished_dt,
+    }
+    if with_items:
+        data['items'] = [{
+            'id': item.pk,
+            'project_id': item.project_id,
+            'project_name': item.project.name,
+            'customer_order_id': item.customer_order_id,
+            'customer_order_name': item.customer_order.name,
+            'request_no': item.request_no,
+            'status': item.status,
+            'status_name': item.get_status_display(),
+            'message': item.message,
+        } for item in batch.items.select_related('project', 'customer_order')]
+    return data
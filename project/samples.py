@@ -0,0 +1,41 @@
+"""ベンチマークとテストで使う案件のサンプルデータ
+
+データベースには保存せず、主キーを指定したインスタンスだけを作成する。
+"""
+import datetime
+
+import pytz
+
+from . import models
+
+
+def create_projects(count):
+    customer = models.Customer(pk=1, name='お客様')
+    projects = []
+    for i in range(count):
+        project = models.Project(
+            pk=i + 1,
+            name='案件{}'.format(i),
+            status='1',
+            start_date=datetime.date(2018, 1, 1) if i % 2 else None,
+            updated_dt=datetime.datetime(2018, 12, 31, 15, 30, i % 60, tzinfo=pytz.utc) if i % 3 else None,
+        )
+        if i % 4:
+            project.customer = customer
+        projects.append(project)
+    return projects
+
+
+def create_vprojects(count):
+    return [models.VProject(
+        pk=i + 1,
+        name='案件{}'.format(i),
+        customer_id=i if i % 2 else None,
+        customer_name='お客様{}'.format(i),
+        business_type='01',
+        member_name=None,
+        start_date=datetime.date(2018, 1, 1),
+        end_date=None if i % 2 else datetime.date(2018, 12, 31),
+        status=i % 5,
+        updated_dt=datetime.datetime(2018, 12, 31, 15, 30, i % 60, tzinfo=pytz.utc),
+    ) for i in range(count)]
@@ -0,0 +1,8 @@
+from utils.search_service import SearchTarget, register
+
+# 関連先（顧客）の項目は、MySQLのFULLTEXTインデックスと同じ組み合わせにする。
+CUSTOMER_FIELDS = ('customer__name', 'customer__kana')
+
+customer = register(SearchTarget('customer', 'project.Customer', ('name', 'kana')))
+customer_member = register(SearchTarget('customer_member', 'project.CustomerMember', ('name',) + CUSTOMER_FIELDS))
+project = register(SearchTarget('project', 'project.Project', ('name',) + CUSTOMER_FIELDS))
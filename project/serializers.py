@@ -67,6 +67,7 @@ class ProjectMemberSerializer(BaseModelSerializer):
     def get_url_member_detail(self, obj):
         return '/member/{pk}/details/'.format(pk=obj.member_id)
 
+    get_member_name.related_fields = ('member',)
     get_is_working.field_type = 'boolean'
 
 
@@ -1,3 +1,52 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, override_settings
 
-# Create your tests here.
+from rest_framework.renderers import JSONRenderer
+
+from . import serializers
+from .samples import create_projects, create_vprojects
+from utils.query_plan import query_planner
+
+
+class RowPlanSerializerTest(SimpleTestCase):
+
+    def assert_same_output(self, serializer_class, instances):
+        serializer = serializer_class(instances, many=True)
+        by_plan = JSONRenderer().render(serializer.data)
+        by_fields = JSONRenderer().render([
+            serializer.child.to_representation_by_fields(instance) for instance in instances
+        ])
+        self.assertEqual(by_plan, by_fields)
+
+    def test_vproject(self):
+        self.assert_same_output(serializers.VProjectSerializer, create_vprojects(50))
+
+    def test_project(self):
+        self.assert_same_output(serializers.ProjectSerializer, create_projects(50))
+
+    @override_settings(TIME_ZONE='UTC')
+    def test_time_zone(self):
+        self.assert_same_output(serializers.VProjectSerializer, create_vprojects(5))
+
+    def test_single_object(self):
+        instance = create_vprojects(1)[0]
+        serializer = serializers.VProjectSerializer(instance)
+        self.assertEqual(serializer.data, serializer.to_representation_by_fields(instance))
+        self.assertEqual(serializer.data['updated_dt'], '2019-01-01 00:30:00')
+
+
+class QueryPlanTest(SimpleTestCase):
+
+    def test_dotted_sources(self):
+        plan = query_planner.get_plan(serializers.ProjectSerializer)
+        self.assertEqual(plan.select_related, ['customer', 'manager', 'contact', 'organization'])
+        self.assertEqual(plan.prefetch_related, [])
+
+    def test_method_field_hints(self):
+        plan = query_planner.get_plan(serializers.ProjectMemberSerializer)
+        self.assertEqual(plan.select_related, ['member', 'project'])
+        self.assertEqual(plan.prefetch_related, ['stages'])
+
+    def test_no_related(self):
+        plan = query_planner.get_plan(serializers.VProjectSerializer)
+        self.assertEqual(plan.select_related, [])
+        self.assertEqual(plan.prefetch_related, [])
@@ -1,36 +1,31 @@
-import operator
 import django_filters
 
-from functools import reduce
-
 from django.db import transaction
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 
 from rest_framework import status as rest_status
 from rest_framework.response import Response
 
-from . import models, serializers, biz
-from master.models import Company, BankAccount, Attachment
-from utils import constants, file_gen, common
-from utils.rest_base import BaseModelViewSet, BaseModelSchemaView, BaseApiView
+from . import models, serializers, biz, request_batch
+from master.models import Company, BankAccount
+from utils import constants, search_service
+from utils.errors import CustomException
+from utils.rest_base import BaseModelViewSet, BaseModelSchemaView, BaseApiView, KeysetPagination
 
 
 # Create your views here.
 class CustomerViewSet(BaseModelViewSet):
     queryset = models.Customer.objects.all()
     serializer_class = serializers.CustomerSerializer
+    pagination_class = KeysetPagination
     list_display = ('name',)
     list_display_links = ('name',)
     filter_fields = ('name',)
 
     def get_queryset(self):
         search = self.request.GET.get('search')
-        if not search:
-            return self.queryset
-        else:
-            return self.queryset.filter(name__icontains=search)
+        return search_service.filter_queryset(self.queryset, 'customer', search)
 
 
 class CustomerMemberViewSet(BaseModelViewSet):
@@ -40,14 +35,7 @@ class CustomerMemberViewSet(BaseModelViewSet):
 
     def get_queryset(self):
         search = self.request.GET.get('search')
-        queryset = self.queryset
-        if not search:
-            return queryset
-        else:
-            for bit in search.split():
-                or_queries = [Q(**{orm_lookup: bit}) for orm_lookup in ('name__icontains', 'customer__name__icontains')]
-                queryset = queryset.filter(reduce(operator.or_, or_queries))
-            return queryset
+        return search_service.filter_queryset(self.queryset, 'customer_member', search)
 
 
 class VProjectFilter(django_filters.FilterSet):
@@ -73,6 +61,7 @@ class ProjectViewSet(BaseModelViewSet):
 class VProjectViewSet(BaseModelViewSet):
     queryset = models.VProject.objects.all()
     serializer_class = serializers.VProjectSerializer
+    pagination_class = KeysetPagination
     list_display = (
         'name', 'customer_name', 'business_type', 'salesperson_name', 'member_name',
         'start_date', 'end_date', 'updated_dt', 'status'
@@ -267,25 +256,7 @@ class ProjectRequestCreateApiView(BaseApiView):
         }
         project_request = project.get_project_request(year, month, customer_order)
         request_data = biz.generate_request_data(company, project, customer_order, year, month, initial)
-        heading = request_data.get('heading')
-        byte_file = file_gen.generate_request(request_data, project_request.request_no)
-        project_request.request_name = heading.get('CONTRACT_NAME')
-        project_request.amount = heading['ITEM_AMOUNT_ALL']
-        project_request.turnover_amount = heading.get('ITEM_AMOUNT_ATTENDANCE')
-        project_request.tax_amount = heading.get('ITEM_AMOUNT_ATTENDANCE_TAX')
-        project_request.expenses_amount = heading.get('ITEM_AMOUNT_EXPENSES')
-        project_request.created_user = request.user
-        project_request.updated_user = request.user
-        project_request.save(other_data=request_data)
-        filename = common.get_request_filename(project_request.request_no, heading.get('CONTRACT_NAME'))
-        attachment = Attachment.save_from_bytes(
-            project_request,
-            byte_file,
-            filename,
-            existed_file=project_request.filename
-        )
-        project_request.filename = attachment.uuid
-        project_request.save(update_fields=('filename',))
+        biz.save_project_request(project_request, request_data, request.user)
         data = serializers.CustomerOrderSerializer(customer_order).data
         data['projects'] = biz.get_project_choice(data['projects'])
         data['request_no'] = project_request.request_no
@@ -295,3 +266,32 @@ class ProjectRequestCreateApiView(BaseApiView):
         )
         data['uuid'] = project_request.filename
         return Response(data)
+
+
+class ProjectRequestBatchApiView(BaseApiView):
+    """請求書の一括作成
+
+    POSTで指定年月の請求書の一括作成を開始し、GETで進捗を取得する。
+    """
+
+    def get_context_data(self, **kwargs):
+        if kwargs.get('pk'):
+            batch = get_object_or_404(models.ProjectRequestBatch, pk=kwargs.get('pk'))
+        else:
+            batch = models.ProjectRequestBatch.objects.filter(
+                year=self.request.GET.get('year'), month=self.request.GET.get('month'),
+            ).first()
+            if batch is None:
+                return {}
+        return request_batch.get_batch_data(batch, with_items=self.request.GET.get('items', '1') == '1')
+
+    def post(self, request, *args, **kwargs):
+        year = request.data.get('year')
+        month = request.data.get('month')
+        if not year or not month:
+            raise CustomException(constants.ERROR_REQUIRE_FIELD.format(name='対象年月'))
+        year = str(year)
+        month = '{:02d}'.format(int(month))
+        batch = request_batch.create_batch(year, month, request.user)
+        request_batch.start_batch_process(batch, force=request.data.get('force') in (True, '1', 'true'))
+        return Response(request_batch.get_batch_data(batch, with_items=False))
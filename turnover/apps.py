@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class TurnoverConfig(AppConfig):
     name = 'turnover'
+
+    def ready(self):
+        from . import biz, signals  # noqa
@@ -1,9 +1,108 @@
 import datetime
+import threading
 
-from django.db import connection
+from django.db import connection, transaction
 
-from . import models
-from utils import constants, common
+from . import models, cube
+from project.models import ProjectRequest
+from utils import constants, common, procedure_cache
+from utils.procedure_cache import CachedProcedure
+
+logger = common.get_system_logger()
+
+SUMMARY_TABLES = (
+    models.TurnoverMonthly._meta.db_table,
+    models.TurnoverYearly._meta.db_table,
+    models.TurnoverMonthlyByOrganization._meta.db_table,
+    models.TurnoverCustomersByMonth._meta.db_table,
+    models.TurnoverProject._meta.db_table,
+    models.TurnoverMember._meta.db_table,
+)
+
+# 集計を予約した年月（スレッドごと）
+_pending = threading.local()
+
+sp_turnover_monthly_chart = CachedProcedure('sp_turnover_monthly_chart', tables=(
+    models.TurnoverMonthly._meta.db_table,
+))
+sp_turnover_monthly_by_division_chart = CachedProcedure('sp_turnover_monthly_by_division_chart', tables=(
+    models.TurnoverMonthlyByOrganization._meta.db_table, 'eb_section',
+))
+
+
+def refresh_turnover_summary(year, month):
+    """指定年月の売上集計テーブルを再作成し、売上キューブの該当年月を無効にする。
+
+    :param year: 対象年
+    :param month: 対象月
+    :return:
+    """
+    year, month = '%04d' % int(year), '%02d' % int(month)
+    # 売上キューブは請求のテーブルから直接読むので、集計テーブルの結果に関わらず無効にする。
+    cube.turnover_cube.invalidate_month(year, month)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.callproc('sp_refresh_turnover', (year, month))
+    procedure_cache.invalidate_tables(*SUMMARY_TABLES)
+    logger.info('turnover summary of %s/%s is refreshed.', year, month)
+
+
+def schedule_turnover_summary(year, month):
+    """売上集計テーブルの再作成を予約する。
+
+    トランザクション中の場合はコミット後に一回だけ再作成する。
+    例えば請求書を作成する時、請求、見出しと複数の明細が同じ年月に保存されるが、集計は一回だけ行う。
+    ロールバックされた年月は、次のコミット後に集計しなおす（結果は変わらない）。
+
+    :param year: 対象年
+    :param month: 対象月
+    :return:
+    """
+    if not year or not month:
+        return
+    key = ('%04d' % int(year), '%02d' % int(month))
+    months = getattr(_pending, 'months', None)
+    if months is None:
+        months = _pending.months = set()
+    months.add(key)
+    # 予約するたびに登録するが、最初に実行された時に全ての年月を集計するので、以降は何もしない。
+    transaction.on_commit(_flush_turnover_summary)
+
+
+def schedule_project_request(project_request_id):
+    """請求の年月の売上集計テーブルの再作成を予約する。
+
+    見出しや明細を一括で削除した場合など、請求が読み込まれていないインスタンスごとに呼ばれるので、
+    年月は請求ごとに一回だけ取得する。
+
+    :param project_request_id: 請求のＩＤ
+    :return:
+    """
+    if not project_request_id:
+        return
+    requests = getattr(_pending, 'requests', None)
+    if requests is None:
+        requests = _pending.requests = set()
+    if project_request_id in requests:
+        return
+    requests.add(project_request_id)
+    ym = ProjectRequest._base_manager.filter(pk=project_request_id).values_list('year', 'month').first()
+    if ym:
+        schedule_turnover_summary(*ym)
+
+
+def _flush_turnover_summary():
+    months = getattr(_pending, 'months', None)
+    _pending.requests = set()
+    if not months:
+        return
+    _pending.months = set()
+    for year, month in sorted(months):
+        try:
+            refresh_turnover_summary(year, month)
+        except Exception as ex:
+            # 集計の失敗で請求書の保存を失敗させない、rebuild_turnoverコマンドで再作成できる。
+            logger.error('failed to refresh turnover summary of %s/%s: %s', year, month, ex)
 
 
 def get_turnover_monthly_chart():
@@ -11,13 +110,11 @@ def get_turnover_monthly_chart():
 
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_turnover_monthly_chart')
-        labels = []
-        turnover_amount_list = []
-        for row in cursor.fetchall():
-            labels.append(constants.DICT_MONTH_EN[row[1]])
-            turnover_amount_list.append(row[2])
+    labels = []
+    turnover_amount_list = []
+    for row in sp_turnover_monthly_chart():
+        labels.append(constants.DICT_MONTH_EN[row.get('month')])
+        turnover_amount_list.append(row.get('turnover_amount'))
     return {
         'labels': labels,
         'series': [turnover_amount_list],
@@ -46,25 +143,27 @@ def get_turnover_monthly_by_department_chart():
 
     :return:
     """
-    with connection.cursor() as cursor:
-        cursor.callproc('sp_turnover_monthly_by_division_chart')
-        data = common.dictfetchall(cursor)
-    labels = []
+    if cube.is_available():
+        start_ym = common.add_months(datetime.date.today(), -12).strftime('%Y%m')
+        data = [
+            (item['year'], item['month'], item['division'], item['turnover_amount'])
+            for item in cube.turnover_cube.group_by(
+                ('year', 'month', 'division'), ('turnover_amount',), filters={'ym__gte': start_ym}
+            ) if item['division'] is not None
+        ]
+    else:
+        data = [
+            (int(item.get('year')), int(item.get('month')), item.get('division_id'), item.get('turnover_amount'))
+            for item in sp_turnover_monthly_by_division_chart()
+        ]
+    labels = sorted(set((year, month) for year, month, division_id, amount in data))
+    label_index = dict((ym, i) for i, ym in enumerate(labels))
     dict_division = dict()
-    first_month = None
-    for item in data:
-        ym = (item.get('year'), item.get('month'))
-        if ym not in labels:
-            if first_month is None:
-                first_month = datetime.date(int(ym[0]), int(ym[1]), 1)
-            labels.append(ym)
-        division_id = item.get('division_id')
+    for year, month, division_id, amount in sorted(data, key=lambda r: (r[0], r[1])):
         if division_id not in dict_division:
-            interval = (int(ym[0]) * 12 + int(ym[1])) - (first_month.year * 12 + first_month.month)
-            dict_division[division_id] = [None] * interval
-        division = dict_division[division_id]
-        division.append(item.get('turnover_amount', 0))
+            dict_division[division_id] = [None] * len(labels)
+        dict_division[division_id][label_index[(year, month)]] = amount or 0
     return {
-        'labels': [constants.DICT_MONTH_EN[m] for y, m in labels],
-        'series': dict_division.values(),
+        'labels': [constants.DICT_MONTH_EN['%02d' % m] for y, m in labels],
+        'series': list(dict_division.values()),
     }
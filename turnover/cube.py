@@ -0,0 +1,413 @@
+import threading
+import time
+
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from member.models import Organization
+from project.models import ProjectRequest, ProjectRequestDetail
+
+CACHE_ALIAS = 'default'
+KEY_PREFIX = 'turnover_cube'
+NULL_ID = -1
+
+LEVEL_REQUEST = 'request'
+LEVEL_MEMBER = 'member'
+
+# 粒度ごとのディメンションとメジャー
+LEVELS = {
+    # 請求単位（ProjectRequest）
+    LEVEL_REQUEST: {
+        'dimensions': ('customer', 'project', 'organization'),
+        'measures': ('cost', 'amount', 'turnover_amount', 'tax_amount', 'expenses_amount'),
+    },
+    # メンバー単位（ProjectRequestDetail）
+    LEVEL_MEMBER: {
+        'dimensions': ('customer', 'project', 'member', 'organization'),
+        'measures': ('cost', 'turnover_amount', 'expenses_amount'),
+    },
+}
+# 保存された列から算出するディメンション
+DERIVED_DIMENSIONS = ('ym', 'year', 'month', 'division')
+
+
+def is_available():
+    """NumPyがインストールされているかどうか
+
+    :return:
+    """
+    return np is not None
+
+
+def _load_request_facts(year, month):
+    return ProjectRequest.objects.filter(
+        year=year,
+        month=month,
+        projectrequestheading__isnull=False,
+        project__is_deleted=False,
+    ).values_list(
+        'project__customer_id', 'project_id', 'project__organization_id',
+        'cost', 'amount', 'turnover_amount', 'tax_amount', 'expenses_amount',
+    )
+
+
+def _load_member_facts(year, month):
+    return ProjectRequestDetail.objects.filter(
+        project_request__year=year,
+        project_request__month=month,
+        project_request__is_deleted=False,
+        project_member__project__is_deleted=False,
+    ).values_list(
+        'project_member__project__customer_id', 'project_member__project_id', 'project_member__member_id',
+        'organization_id',
+        'cost', 'total_price', 'expenses_price',
+    )
+
+
+_LOADERS = {
+    LEVEL_REQUEST: _load_request_facts,
+    LEVEL_MEMBER: _load_member_facts,
+}
+
+
+def get_division_map():
+    """部署ＩＤから事業部ＩＤへのマッピングを取得する。
+
+    get_division_new（data/SQL/001）と同じ規則で判定する。
+
+    :return:
+    """
+    organizations = dict(
+        (org.pk, org) for org in Organization.objects.all()
+    )
+    division_map = dict()
+    for pk, org in organizations.items():
+        parent = organizations.get(org.parent_id)
+        if org.org_type == '02':
+            division_map[pk] = pk if parent else None
+        elif org.org_type == '03':
+            division_map[pk] = parent.pk if parent and organizations.get(parent.parent_id) else None
+        else:
+            division_map[pk] = pk
+    return division_map
+
+
+class _MonthChunk(object):
+    """１か月分の列データ"""
+
+    def __init__(self, year, month, version):
+        self.ym = int(year) * 100 + int(month)
+        self.version = version
+        self.columns = dict()
+        for level, definition in LEVELS.items():
+            names = definition['dimensions'] + definition['measures']
+            rows = list(_LOADERS[level](year, month))
+            data = dict()
+            for i, name in enumerate(names):
+                data[name] = np.array(
+                    [NULL_ID if row[i] is None else row[i] for row in rows], dtype=np.int64
+                )
+            data['ym'] = np.full(len(rows), self.ym, dtype=np.int64)
+            self.columns[level] = data
+
+
+class TurnoverCube(object):
+    """売上キューブ
+
+    請求（ProjectRequest）と請求明細（ProjectRequestDetail）の金額を、年月、取引先、案件、社員、部署を
+    ディメンションとしたNumPyの列データとしてメモリ上に保持し、集計（group_by）、小計（rollup）、
+    上位Ｎ件（top）の問い合わせに答える。
+
+    データは年月単位で、問い合わせの絞り込み条件（ym、year、month）に該当する年月だけを読み込む。
+    請求が変更されると、その年月のバージョンが上がり（invalidate_month）、次の問い合わせでその年月だけ読み直す。
+    バージョンは settings.CACHES の共有のキャッシュ（memcached）に保存するので、他のプロセスにも反映される。
+    プロセスごとのキャッシュ（LocMemCache）では、変更したプロセス以外は古いデータのままになる。
+    """
+
+    # 結合した列データを保持する絞り込み条件（年月の組み合わせ）の数
+    MAX_COLUMNS = 16
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._months = dict()
+        self._chunks = dict()
+        self._version = None
+        self._columns = dict()
+
+    # ---------------------------------------------------------------- バージョン管理
+    @staticmethod
+    def _get_version_key(ym=None):
+        return '{}:version'.format(KEY_PREFIX) if ym is None else '{}:version:{}'.format(KEY_PREFIX, ym)
+
+    @staticmethod
+    def _new_version():
+        return int(time.time() * 1000)
+
+    def invalidate_month(self, year, month):
+        """指定年月のデータを無効にする。
+
+        バージョンは共有のキャッシュに保存するので、全てのプロセスで次の問い合わせ時に読み直す。
+
+        :param year: 対象年
+        :param month: 対象月
+        :return:
+        """
+        cache = caches[CACHE_ALIAS]
+        for key in (self._get_version_key(int(year) * 100 + int(month)), self._get_version_key()):
+            try:
+                cache.incr(key)
+            except ValueError:
+                cache.set(key, self._new_version(), None)
+
+    def _get_versions(self, cache, keys):
+        versions = cache.get_many(keys)
+        for key in keys:
+            if versions.get(key) is None:
+                cache.add(key, self._new_version(), None)
+                versions[key] = cache.get(key)
+        return versions
+
+    def _sync(self):
+        """キャッシュのバージョンと比較して、変更された年月のデータを破棄する。
+
+        年月の一覧とバージョンだけを更新し、データは問い合わせで必要になった時に読み込む。
+        """
+        if np is None:
+            raise ImproperlyConfigured('NumPy is required to use the turnover cube.')
+        cache = caches[CACHE_ALIAS]
+        version_key = self._get_version_key()
+        version = self._get_versions(cache, [version_key])[version_key]
+        if version == self._version:
+            return
+        with self._lock:
+            if version == self._version:
+                return
+            months = set(ProjectRequest.objects.values_list('year', 'month').distinct())
+            keys = dict((self._get_version_key(int(y) * 100 + int(m)), (y, m)) for y, m in months)
+            versions = self._get_versions(cache, list(keys))
+            self._months = dict((key, versions[version_key]) for version_key, key in keys.items())
+            self._chunks = dict(
+                (key, chunk) for key, chunk in self._chunks.items() if self._months.get(key) == chunk.version
+            )
+            self._columns = dict()
+            self._version = version
+
+    @staticmethod
+    def _filter_months(months, filters):
+        """絞り込み条件の ym、year、month に該当する年月だけを取得する。
+
+        :param months: (年, 月) のリスト
+        :param filters: 絞り込み条件
+        :return:
+        """
+        results = []
+        for year, month in months:
+            ym = int(year) * 100 + int(month)
+            values = {'ym': ym, 'year': ym // 100, 'month': ym % 100}
+            for key, value in (filters or {}).items():
+                name, _, lookup = key.partition('__')
+                if name not in values or value is None:
+                    continue
+                if lookup == 'gte':
+                    matched = values[name] >= int(value)
+                elif lookup == 'lte':
+                    matched = values[name] <= int(value)
+                elif lookup in ('', 'in'):
+                    if isinstance(value, (list, tuple, set)):
+                        matched = values[name] in [int(v) for v in value if v is not None]
+                    else:
+                        matched = values[name] == int(value)
+                else:
+                    # 不明な条件は _get_mask でエラーになる。
+                    continue
+                if not matched:
+                    break
+            else:
+                results.append((year, month))
+        return sorted(results)
+
+    def _get_chunk(self, key, version):
+        chunk = self._chunks.get(key)
+        if chunk is None or chunk.version != version:
+            with self._lock:
+                chunk = self._chunks.get(key)
+                if chunk is None or chunk.version != version:
+                    chunk = _MonthChunk(key[0], key[1], version)
+                    self._chunks[key] = chunk
+        return chunk
+
+    def _get_columns(self, level, filters=None):
+        self._sync()
+        all_months = self._months
+        months = tuple(self._filter_months(all_months, filters))
+        columns = self._columns.get((level, months))
+        if columns is None:
+            chunks = [self._get_chunk(key, all_months[key]).columns[level] for key in months]
+            definition = LEVELS[level]
+            columns = dict()
+            for name in ('ym',) + definition['dimensions'] + definition['measures']:
+                if chunks:
+                    columns[name] = np.concatenate([chunk[name] for chunk in chunks])
+                else:
+                    columns[name] = np.zeros(0, dtype=np.int64)
+            with self._lock:
+                if len(self._columns) >= self.MAX_COLUMNS:
+                    self._columns = dict()
+                # 結合中に読み直された場合は保持しない。
+                if self._months is all_months:
+                    self._columns[(level, months)] = columns
+        return columns
+
+    # ---------------------------------------------------------------- 問い合わせ
+    @staticmethod
+    def _get_dimension(columns, name, context):
+        if name == 'year':
+            return columns['ym'] // 100
+        elif name == 'month':
+            return columns['ym'] % 100
+        elif name == 'division':
+            if 'division_map' not in context:
+                context['division_map'] = get_division_map()
+            division_map = context['division_map']
+            organizations = columns['organization']
+            keys, inverse = np.unique(organizations, return_inverse=True)
+            divisions = np.array([
+                NULL_ID if division_map.get(k) is None else division_map.get(k) for k in keys.tolist()
+            ], dtype=np.int64)
+            return divisions[inverse] if len(keys) else organizations
+        elif name in columns:
+            return columns[name]
+        else:
+            raise ValueError('unknown dimension: {}'.format(name))
+
+    def _get_mask(self, columns, filters, context):
+        size = len(columns['ym'])
+        mask = np.ones(size, dtype=bool)
+        for key, value in (filters or {}).items():
+            name, _, lookup = key.partition('__')
+            values = self._get_dimension(columns, name, context)
+            if lookup == 'gte':
+                mask &= values >= int(value)
+            elif lookup == 'lte':
+                mask &= values <= int(value)
+            elif lookup in ('', 'in'):
+                if isinstance(value, (list, tuple, set)):
+                    mask &= np.isin(values, [NULL_ID if v is None else int(v) for v in value])
+                else:
+                    mask &= values == (NULL_ID if value is None else int(value))
+            else:
+                raise ValueError('unknown lookup: {}'.format(key))
+        return mask
+
+    def group_by(self, dimensions, measures=None, filters=None, level=LEVEL_REQUEST):
+        """ディメンションごとにメジャーを合計する。
+
+        :param dimensions: ディメンション名のリスト、例：('ym', 'division')
+        :param measures: メジャー名のリスト、省略時は全てのメジャー
+        :param filters: 絞り込み条件、例：{'year': 2018, 'customer__in': [1, 2], 'ym__gte': 201804}
+        :param level: 粒度、 request または member
+        :return: ディメンション順にソートされた辞書のリスト、ＩＤがない場合はNone
+        """
+        if level not in LEVELS:
+            raise ValueError('unknown level: {}'.format(level))
+        dimensions = tuple(dimensions)
+        measures = tuple(measures or LEVELS[level]['measures'])
+        for name in measures:
+            if name not in LEVELS[level]['measures']:
+                raise ValueError('unknown measure: {}'.format(name))
+        columns = self._get_columns(level, filters)
+        context = dict()
+        mask = self._get_mask(columns, filters, context)
+        size = int(mask.sum())
+        if size == 0:
+            return []
+        if dimensions:
+            keys = np.stack([self._get_dimension(columns, name, context)[mask] for name in dimensions], axis=1)
+            groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+        else:
+            groups = np.zeros((1, 0), dtype=np.int64)
+            inverse = np.zeros(size, dtype=np.int64)
+        totals = dict(
+            (name, np.bincount(inverse, weights=columns[name][mask], minlength=len(groups)).round().astype(np.int64))
+            for name in measures
+        )
+        results = []
+        for i, group in enumerate(groups.tolist()):
+            row = dict((name, None if value == NULL_ID else value) for name, value in zip(dimensions, group))
+            for name in measures:
+                row[name] = int(totals[name][i])
+            if 'turnover_amount' in totals and 'cost' in totals:
+                row['profit_amount'] = row['turnover_amount'] - row['cost']
+            results.append(row)
+        return results
+
+    def rollup(self, dimensions, measures=None, filters=None, level=LEVEL_REQUEST):
+        """SQLの WITH ROLLUP と同様に、ディメンションの前方から順に小計と総計を付けて集計する。
+
+        小計の行では集計されたディメンションの値が None となり、 'rollup' に小計のレベルが入る。
+
+        :param dimensions: ディメンション名のリスト
+        :param measures: メジャー名のリスト
+        :param filters: 絞り込み条件
+        :param level: 粒度
+        :return:
+        """
+        dimensions = tuple(dimensions)
+        results = []
+        for depth in range(len(dimensions), -1, -1):
+            for row in self.group_by(dimensions[:depth], measures, filters, level):
+                for name in dimensions[depth:]:
+                    row[name] = None
+                row['rollup'] = len(dimensions) - depth
+                results.append(row)
+        key_names = dimensions
+        results.sort(key=lambda r: tuple(
+            (r[name] is None, r[name] if r[name] is not None else 0) for name in key_names
+        ))
+        return results
+
+    def top(self, dimension, n=10, measure='turnover_amount', filters=None, level=LEVEL_REQUEST):
+        """指定メジャーの上位Ｎ件を取得する。
+
+        :param dimension: ディメンション名
+        :param n: 件数
+        :param measure: 並び替えるメジャー
+        :param filters: 絞り込み条件
+        :param level: 粒度
+        :return:
+        """
+        results = self.group_by((dimension,), filters=filters, level=level)
+        results.sort(key=lambda r: r[measure], reverse=True)
+        return results[:n]
+
+    def pivot(self, row_dimension, column_dimension, measure='turnover_amount', filters=None, level=LEVEL_REQUEST):
+        """２つのディメンションでクロス集計する。
+
+        :param row_dimension: 行のディメンション
+        :param column_dimension: 列のディメンション
+        :param measure: 集計するメジャー
+        :param filters: 絞り込み条件
+        :param level: 粒度
+        :return: 行のキー、列のキーと、値の２次元リスト（データがない場合はNone）
+        """
+        data = self.group_by((row_dimension, column_dimension), (measure,), filters, level)
+        rows = sorted(set(item[row_dimension] for item in data), key=lambda v: (v is None, v or 0))
+        cols = sorted(set(item[column_dimension] for item in data), key=lambda v: (v is None, v or 0))
+        row_index = dict((key, i) for i, key in enumerate(rows))
+        col_index = dict((key, i) for i, key in enumerate(cols))
+        values = [[None] * len(cols) for _ in rows]
+        for item in data:
+            values[row_index[item[row_dimension]]][col_index[item[column_dimension]]] = item[measure]
+        return {
+            'rows': rows,
+            'columns': cols,
+            'values': values,
+        }
+
+
+turnover_cube = TurnoverCube()
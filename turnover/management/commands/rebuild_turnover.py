@@ -0,0 +1,51 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from turnover import biz, models
+from project.models import ProjectRequest
+from utils import common
+
+
+class Command(BaseCommand):
+    help = '売上集計テーブルを指定期間の年月ごとに再作成する。'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='開始年月（YYYYMM）、省略時は請求の最初の年月')
+        parser.add_argument('--end', help='終了年月（YYYYMM）、省略時は請求の最後の年月')
+
+    def handle(self, *args, **options):
+        months = get_request_months()
+        start = parse_ym(options.get('start')) or (months[0] if months else None)
+        end = parse_ym(options.get('end')) or (months[-1] if months else None)
+        if start is None or end is None:
+            self.stdout.write('請求データがありません。')
+            return
+        if start > end:
+            raise CommandError('開始年月は終了年月より後になっています。')
+        count = 0
+        for year, month in common.get_year_month_list(start, end):
+            biz.refresh_turnover_summary(year, month)
+            count += 1
+        self.stdout.write(self.style.SUCCESS('{}～{}、{}か月分の売上集計を再作成しました。'.format(
+            start.strftime('%Y/%m'), end.strftime('%Y/%m'), count,
+        )))
+
+
+def parse_ym(ym):
+    if not ym:
+        return None
+    try:
+        return datetime.datetime.strptime(ym, '%Y%m').date()
+    except ValueError:
+        raise CommandError('年月の形式が正しくありません：{}'.format(ym))
+
+
+def get_request_months():
+    """請求または集計済みのデータが存在する年月を昇順で取得する。
+
+    :return: 各年月の初日のリスト
+    """
+    months = set(ProjectRequest._base_manager.values_list('year', 'month').distinct())
+    months.update(models.TurnoverMonthly.objects.values_list('year', 'month').distinct())
+    return sorted(datetime.date(int(year), int(month), 1) for year, month in months)
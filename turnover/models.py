@@ -20,7 +20,7 @@ class TurnoverMonthly(BaseView):
 
     class Meta:
         managed = False
-        db_table = 'v_turnover_monthly'
+        db_table = 'eb_turnover_monthly'
         ordering = ('-ym',)
         default_permissions = ()
         verbose_name = "月別売上"
@@ -42,7 +42,7 @@ class TurnoverYearly(BaseView):
 
     class Meta:
         managed = False
-        db_table = 'v_turnover_yearly'
+        db_table = 'eb_turnover_yearly'
         ordering = ('year',)
         default_permissions = ()
         verbose_name = "年間売上"
@@ -73,7 +73,7 @@ class TurnoverMonthlyByOrganization(BaseView):
 
     class Meta:
         managed = False
-        db_table = 'v_turnover_monthly_by_organization'
+        db_table = 'eb_turnover_monthly_by_organization'
         ordering = ('year', 'month')
         default_permissions = ()
         verbose_name = "部署月別売上"
@@ -97,7 +97,7 @@ class TurnoverCustomersByMonth(BaseView):
 
     class Meta:
         managed = False
-        db_table = 'v_turnover_customers_by_month'
+        db_table = 'eb_turnover_customers_by_month'
         ordering = ('customer_name',)
         default_permissions = ()
         verbose_name = "お客様別売上"
@@ -123,7 +123,7 @@ class TurnoverProject(BaseView):
 
     class Meta:
         managed = False
-        db_table = 'v_turnover_project'
+        db_table = 'eb_turnover_project'
         ordering = ('project_name',)
         default_permissions = ()
         verbose_name = "案件別売上"
@@ -151,7 +151,7 @@ class TurnoverMember(BaseView):
 
     class Meta:
         managed = False
-        db_table = 'v_turnover_member'
+        db_table = 'eb_turnover_member'
         ordering = ('name',)
         default_permissions = ()
         verbose_name = "社員売上"
@@ -0,0 +1,33 @@
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from . import biz
+from project.models import ProjectRequest, ProjectRequestHeading, ProjectRequestDetail
+
+
+@receiver(pre_save, sender=ProjectRequest)
+def project_request_moving(sender, instance, **kwargs):
+    """請求の対象年月が変更された場合、変更前の年月も集計しなおす。"""
+    if instance.pk and not kwargs.get('update_fields'):
+        old = ProjectRequest._base_manager.filter(pk=instance.pk).values('year', 'month').first()
+        if old and (old['year'], old['month']) != (instance.year, instance.month):
+            biz.schedule_turnover_summary(old['year'], old['month'])
+
+
+@receiver(post_save, sender=ProjectRequest)
+@receiver(post_delete, sender=ProjectRequest)
+def project_request_changed(sender, instance, **kwargs):
+    """請求が保存または削除されたら、その年月の売上集計を更新する。"""
+    biz.schedule_turnover_summary(instance.year, instance.month)
+
+
+@receiver(post_save, sender=ProjectRequestHeading)
+@receiver(post_delete, sender=ProjectRequestHeading)
+@receiver(post_save, sender=ProjectRequestDetail)
+@receiver(post_delete, sender=ProjectRequestDetail)
+def project_request_item_changed(sender, instance, **kwargs):
+    """請求の見出しや明細が保存または削除されたら、その年月の売上集計を更新する。"""
+    if sender.project_request.is_cached(instance):
+        biz.schedule_turnover_summary(instance.project_request.year, instance.project_request.month)
+    else:
+        biz.schedule_project_request(instance.project_request_id)
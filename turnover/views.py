@@ -2,13 +2,16 @@ import datetime
 import django_filters
 from rest_framework.response import Response
 
-from . import models, serializers, biz
-from utils.rest_base import BaseReadOnlyModelViewSet, BaseApiView
+from . import models, serializers, biz, cube
+from utils import constants
+from utils.errors import CustomException
+from utils.rest_base import BaseReadOnlyModelViewSet, BaseApiView, KeysetPagination
 
 
 class TurnoverMonthlyViewSet(BaseReadOnlyModelViewSet):
     queryset = models.TurnoverMonthly.objects.all()
     serializer_class = serializers.TurnoverMonthlySerializer
+    pagination_class = KeysetPagination
     list_display = (
         'ym', 'cost', 'turnover_amount', 'tax_amount', 'expenses_amount', 'amount',
         'profit_amount', 'profit_rate'
@@ -119,3 +122,43 @@ class TurnoverMemberViewSet(BaseReadOnlyModelViewSet):
             return self.queryset.filter(year=year, month=month, project__pk=project_id)
         else:
             return self.queryset.none()
+
+
+class TurnoverCubeApiView(BaseApiView):
+    """売上キューブのアドホック集計
+
+    例：/api/turnover/cube/?dimensions=year,division&year__gte=2018
+        /api/turnover/cube/?dimensions=customer&top=10&measure=turnover_amount
+        /api/turnover/cube/?dimensions=project,member&level=member&ym=201812&rollup=1
+    """
+
+    def get_context_data(self, **kwargs):
+        params = self.request.GET
+        dimensions = [name for name in params.get('dimensions', '').split(',') if name]
+        measures = [name for name in params.get('measures', '').split(',') if name] or None
+        level = params.get('level', cube.LEVEL_REQUEST)
+        filters = dict()
+        for key in params:
+            name = key.partition('__')[0]
+            if name in cube.DERIVED_DIMENSIONS or name in cube.LEVELS.get(level, {}).get('dimensions', ()):
+                values = params.getlist(key)
+                filters[key] = values if key.endswith('__in') or len(values) > 1 else values[0]
+        if not cube.is_available():
+            raise CustomException(constants.ERROR_TURNOVER_CUBE_UNAVAILABLE)
+        try:
+            if params.get('top'):
+                if len(dimensions) != 1:
+                    raise ValueError('top requires exactly one dimension')
+                results = cube.turnover_cube.top(
+                    dimensions[0], int(params.get('top')), params.get('measure', 'turnover_amount'), filters, level
+                )
+            elif params.get('rollup') == '1':
+                results = cube.turnover_cube.rollup(dimensions, measures, filters, level)
+            else:
+                results = cube.turnover_cube.group_by(dimensions, measures, filters, level)
+        except (ValueError, KeyError) as ex:
+            raise CustomException(str(ex))
+        return {
+            'count': len(results),
+            'results': results,
+        }
@@ -0,0 +1,147 @@
+import bisect
+import calendar
+import datetime
+import threading
+
+from . import jholiday
+
+
+class BusinessCalendar(object):
+    """営業日カレンダー
+
+    年月ごとの営業日（土日、祝日と自社休日を除いた日）を一度だけ計算して、
+    ソート済みの序数（date.toordinal()）の配列として保持する。
+    件数、第Ｎ営業日、期間内の営業日数などの問い合わせは二分探索で答える。
+
+    自社休日（master.models.Holiday）は master_cache から取得するので、テーブルのバージョンが
+    変わった場合（他のプロセスの変更を含む）、または MASTER_CACHE_TIMEOUT 秒経った場合は読み込みなおして、
+    計算済みの営業日も破棄する。このプロセスで変更した場合は invalidate() ですぐ破棄する。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._holidays = None
+        self._months = dict()
+
+    def invalidate(self):
+        """キャッシュした休日と営業日を全て破棄する。
+
+        :return:
+        """
+        with self._lock:
+            self._holidays = None
+            self._months = dict()
+
+    def _get_holidays(self):
+        """自社休日の集合を取得する。
+
+        前回と異なる集合が取得された場合は、計算済みの営業日を破棄する。
+
+        :return:
+        """
+        from master.models import Holiday
+        from .master_cache import master_cache
+        holidays = master_cache.get(
+            'business_calendar:holidays',
+            lambda: frozenset(Holiday.objects.values_list('date', flat=True)),
+            (Holiday._meta.db_table,)
+        )
+        if holidays is not self._holidays:
+            with self._lock:
+                if holidays is not self._holidays:
+                    self._holidays = holidays
+                    self._months = dict()
+        return holidays
+
+    def _build_month(self, year, month, holidays):
+        """指定年月の営業日の序数リストを作成する。
+
+        :param year: 対象年
+        :param month: 対象月
+        :param holidays: 自社休日の集合
+        :return:
+        """
+        national_holidays = jholiday.holiday_table(year)
+        ordinals = []
+        for day in range(1, calendar.monthrange(year, month)[1] + 1):
+            this_date = datetime.date(year, month, day)
+            # Monday == 0, Sunday == 6
+            if this_date.weekday() < 5 \
+                    and this_date not in national_holidays \
+                    and this_date not in holidays:
+                ordinals.append(this_date.toordinal())
+        return tuple(ordinals)
+
+    def _get_ordinals(self, year, month):
+        key = (int(year), int(month))
+        holidays = self._get_holidays()
+        ordinals = self._months.get(key)
+        if ordinals is None:
+            with self._lock:
+                ordinals = self._months.get(key)
+                if ordinals is None:
+                    ordinals = self._build_month(key[0], key[1], holidays)
+                    if holidays is self._holidays:
+                        self._months[key] = ordinals
+        return ordinals
+
+    def get_business_days(self, year, month):
+        """指定年月の営業日リストを取得する。
+
+        :param year: 対象年
+        :param month: 対象月
+        :return: datetime.dateのリスト
+        """
+        return [datetime.date.fromordinal(o) for o in self._get_ordinals(year, month)]
+
+    def count(self, year, month):
+        """指定年月の営業日数を取得する。
+
+        :param year: 対象年
+        :param month: 対象月
+        :return:
+        """
+        return len(self._get_ordinals(year, month))
+
+    def get_nth_business_day(self, year, month, n):
+        """指定年月の第Ｎ営業日を取得する。
+
+        :param year: 対象年
+        :param month: 対象月
+        :param n: １から始まる番号
+        :return: 該当する営業日がない場合はNone
+        """
+        ordinals = self._get_ordinals(year, month)
+        if 0 < n <= len(ordinals):
+            return datetime.date.fromordinal(ordinals[n - 1])
+        else:
+            return None
+
+    def is_business_day(self, date):
+        """指定日が営業日であるかどうか
+
+        :param date:
+        :return:
+        """
+        ordinals = self._get_ordinals(date.year, date.month)
+        i = bisect.bisect_left(ordinals, date.toordinal())
+        return i < len(ordinals) and ordinals[i] == date.toordinal()
+
+    def count_between(self, start_date, end_date):
+        """開始日から終了日まで（両端を含む）の営業日数を取得する。
+
+        :param start_date: 開始日
+        :param end_date: 終了日
+        :return:
+        """
+        if start_date > end_date:
+            return 0
+        start, end = start_date.toordinal(), end_date.toordinal()
+        count = 0
+        for index in range(start_date.year * 12 + start_date.month - 1, end_date.year * 12 + end_date.month):
+            ordinals = self._get_ordinals(index // 12, index % 12 + 1)
+            count += bisect.bisect_right(ordinals, end) - bisect.bisect_left(ordinals, start)
+        return count
+
+
+business_calendar = BusinessCalendar()
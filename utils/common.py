@@ -8,11 +8,18 @@ import logging
 import random
 import string
 import base64
+import hashlib
+import json
+import tempfile
 from urllib.parse import urlparse
 
 from django.conf import settings
+from django.db.models import Model
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
 
-from . import jholiday
+from .business_calendar import business_calendar
 
 
 def get_tz_utc():
@@ -38,6 +45,23 @@ def get_temp_path():
     return path
 
 
+def get_local_temp_path():
+    """ローカルの一時フォルダーを取得する。
+
+    メディアフォルダーは共有ストレージの場合があるので、処理中だけ必要なファイルはここに置く。
+    メモリ上のファイルシステム（/dev/shm）があれば使い、なければＯＳの一時フォルダーを使う。
+
+    :return:
+    """
+    path = getattr(settings, 'LOCAL_TEMP_ROOT', None)
+    if path is None:
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            path = '/dev/shm'
+        else:
+            path = tempfile.gettempdir()
+    return path
+
+
 def get_temp_file(ext):
     """指定拡張子の一時ファイルを取得する。
 
@@ -175,21 +199,18 @@ def get_integer(value, decimal_type):
 
 
 def get_business_days(year, month, exclude=None):
-    from master.models import Holiday
-    business_days = []
-    eb_holidays = [holiday.date for holiday in Holiday.objects.all()]
-    for i in range(1, 32):
-        try:
-            this_date = datetime.date(int(year), int(month), i)
-        except ValueError:
-            break
-        if this_date.weekday() < 5 and jholiday.holiday_name(int(year), int(month), i) is None:
-            # Monday == 0, Sunday == 6
-            if exclude and this_date.strftime("%Y/%m/%d") not in exclude:
-                business_days.append(this_date)
-            elif exclude is None:
-                business_days.append(this_date)
-    return [date for date in business_days if date not in eb_holidays]
+    """指定年月の営業日リストを取得する。
+
+    :param year: 対象年
+    :param month: 対象月
+    :param exclude: 除外する日付のリスト（例：「2019/01/04」）
+    :return:
+    """
+    business_days = business_calendar.get_business_days(year, month)
+    if exclude:
+        return [date for date in business_days if date.strftime("%Y/%m/%d") not in exclude]
+    else:
+        return business_days
 
 
 def get_request_filename(request_no, request_name, ext='.xlsx'):
@@ -271,6 +292,9 @@ def get_year_month_list(start_date, end_date, is_reverse=False):
             temp_date = add_months(temp_date)
 
 
+HTML_BODY_PATTERN = re.compile('<body[^<>]*>(.+)</body>', re.MULTILINE | re.DOTALL)
+
+
 def join_html(html1, html2):
     """二つのＨＴＭＬを１つに結合する
 
@@ -279,8 +303,7 @@ def join_html(html1, html2):
     :return:
     """
     # 二つ目のHTML中で、<body></body>中身の内容を取り出す。
-    pattern = re.compile('<body[^<>]*>(.+)</body>', re.MULTILINE | re.DOTALL)
-    m = pattern.search(html2)
+    m = HTML_BODY_PATTERN.search(html2)
     if m:
         html2 = m.groups()[0]
     end_body_index = html1.rfind('</body>')
@@ -303,3 +326,65 @@ def generate_password(length=8):
 def get_signature():
     path = os.path.join(settings.BASE_DIR, 'static/img/signature.png')
     return 'data:image/png;base64,' + base64.b64encode(open(path, 'rb').read()).decode('utf-8')
+
+
+def get_data_hash(*values):
+    """データのハッシュ値を取得する。
+
+    辞書はキーの順番に関係なく同じ値になる。モデルのインスタンスは各項目の値でハッシュ値を計算する。
+
+    :param values: JSONに変換できるデータ（日付、Decimal、モデルのインスタンスを含んでもいい）
+    :return: sha1の16進数文字列
+    """
+    def default(obj):
+        if isinstance(obj, Model):
+            return [obj._meta.label] + [
+                str(getattr(obj, field.attname)) for field in obj._meta.concrete_fields
+            ]
+        elif isinstance(obj, (set, frozenset)):
+            return sorted(obj, key=str)
+        return str(obj)
+
+    content = json.dumps(list(values), default=default, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+def get_template_sources(template_name):
+    """テンプレートと、継承（extends）または読み込み（include）している全てのテンプレートの内容を取得する。
+
+    テンプレート名が変数の場合は、どのテンプレートか分からないので含まない。
+
+    :param template_name: テンプレート名
+    :return: (テンプレート名, 内容) のリスト、テンプレートが存在しない場合の内容はNone
+    """
+    sources = []
+    names = [template_name]
+    while names:
+        name = names.pop(0)
+        if any(name == loaded for loaded, source in sources):
+            continue
+        try:
+            template = get_template(name).template
+        except TemplateDoesNotExist:
+            sources.append((name, None))
+            continue
+        sources.append((name, template.source))
+        nodelist = template.nodelist
+        for node in nodelist.get_nodes_by_type(ExtendsNode) + nodelist.get_nodes_by_type(IncludeNode):
+            expression = node.parent_name if isinstance(node, ExtendsNode) else node.template
+            if isinstance(expression.var, str):
+                names.append(str(expression.var))
+    return sources
+
+
+def get_render_key(template_name, data):
+    """帳票の描画結果をキャッシュするためのキーを取得する。
+
+    Djangoのテンプレートの場合は、継承元（common/base_pdf.html など）と読み込んでいるテンプレートの内容も含めるので、
+    どのテンプレートを修正してもキーが変わる。
+
+    :param template_name: テンプレート名
+    :param data: テンプレートに渡すデータ
+    :return:
+    """
+    return get_data_hash(template_name, get_template_sources(template_name), data)
@@ -288,6 +288,25 @@ CHOICE_ALLOWANCE_UNIT = (
     ('03', '円/時間'),
     ('10', '時間'),
 )
+CHOICE_REQUEST_BATCH_STATUS = (
+    ('01', '待機中'),
+    ('02', '実行中'),
+    ('03', '完了'),
+    ('04', 'エラーあり'),
+)
+CHOICE_REQUEST_BATCH_ITEM_STATUS = (
+    ('01', '未処理'),
+    ('02', '作成済み'),
+    ('03', '変更なし'),
+    ('04', 'エラー'),
+)
+CHOICE_MAIL_OUTBOX_STATUS = (
+    ('01', '送信待ち'),
+    ('02', '送信中'),
+    ('03', '送信済み'),
+    ('04', '再送信待ち'),
+    ('05', '送信失敗'),
+)
 
 DICT_MONTH_EN = {
     '01': 'Jan',
@@ -343,5 +362,12 @@ ERROR_ORGANIZATION_POSITION = '{org_type} の場合 {value} は選択できま
 ERROR_DATA_DUPLICATE = 'データは重複しています。'
 ERROR_MAIL_GROUP_NOT_FOUND = 'メールグループ {name} は設定されていません。'
 ERROR_MAIL_GROUP_MULTI_FOUND = 'メールグループ {name} は複数設定されています。'
+ERROR_MAIL_CONFIG_NOT_FOUND = 'メールサーバーの設定 {name} がありません。'
+ERROR_MAIL_CONNECTION_FAILED = 'メールサーバーに接続できません。{message}'
+ERROR_TURNOVER_CUBE_UNAVAILABLE = '売上キューブを使うにはNumPyをインストールしてください。'
+ERROR_INVALID_CURSOR = 'ページの指定が正しくありません。'
+ERROR_REQUEST_BATCH_RUNNING = '{year}年{month}月の請求書は一括作成中です。'
+ERROR_PDF_RENDER_FAILED = 'ＰＤＦの作成に失敗しました。{message}'
+ERROR_PDF_RENDER_TIMEOUT = 'ＰＤＦの作成は{timeout}秒以内に終わりませんでした。'
 
 LABEL_BP_ORDER_DEFAULT_LOCATION = "弊社指定場所"
@@ -1,11 +1,13 @@
 import os
 import xlsxwriter
-import pdfkit
 import traceback
 from io import BytesIO
 from utils import common
+from utils.pdf_renderer import pdf_renderer
 
 logger = common.get_system_logger()
+# 請求書の描画キャッシュのキー、請求書のレイアウトを変更したらバージョンを上げる。
+REQUEST_TEMPLATE_NAME = 'file_gen.generate_request:1'
 
 
 def generate_request(data, request_no):
@@ -273,32 +275,28 @@ def generate_pdf_from_string(html, out_path, config=None):
     try:
         # config = pdfkit.configuration(wkhtmltopdf=r'C:\Program Files\wkhtmltopdf\bin\wkhtmltopdf.exe')
         # パスに日本語があったら、エラーになる。暫定対策：英語にしてから、また日本語名に変更する。
-        options = {
-            'encoding': "UTF-8",
-            'page-size': 'A4',
-            'dpi': 300,
-        }
-        if config and isinstance(config, dict):
-            options.update(config)
-        # css = ['']
-        pdfkit.from_string(html, out_path, options=options)
+        data = pdf_renderer.render(html, config)
+        with open(out_path, 'wb') as f:
+            f.write(data)
     except Exception as ex:
         logger.error(str(ex))
         logger.error(traceback.format_exc())
 
 
 def generate_report_pdf_binary(html, config=None):
-    temp_file = common.get_temp_file('pdf')
+    return generate_report_pdf_binaries([html], config)[0]
+
+
+def generate_report_pdf_binaries(html_list, config=None):
+    """複数のＨＴＭＬをまとめてＰＤＦに変換する。
+
+    :param html_list: ＨＴＭＬ文字列のリスト
+    :param config: wkhtmltopdfのオプション
+    :return: BytesIOのリスト
+    """
     header_html = config and config.get('header-html', None)
     try:
-        generate_pdf_from_string(html, temp_file, config)
-        data = open(temp_file, 'rb').read()
-        return BytesIO(data)
-    except Exception as ex:
-        logger.error(ex)
-        logger.error(traceback.format_exc())
+        return [BytesIO(data) for data in pdf_renderer.render_many(html_list, config)]
     finally:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
         if header_html and os.path.exists(header_html):
             os.remove(header_html)
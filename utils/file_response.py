@@ -0,0 +1,121 @@
+import mimetypes
+import os
+import re
+import unicodedata
+
+from urllib.parse import quote
+
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import parse_etags
+
+from . import constants
+
+CHUNK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def get_content_disposition(filename, disposition='attachment'):
+    """日本語のファイル名に対応したContent-Dispositionを取得する。
+
+    RFC 6266 の filename* にUTF-8のファイル名を、古いブラウザ向けの filename にASCIIだけのファイル名を設定する。
+
+    :param filename: ファイル名
+    :param disposition: attachment または inline
+    :return:
+    """
+    ascii_name = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+    ascii_name = re.sub(r'[\\"\r\n]', '', ascii_name).strip()
+    if not ascii_name or ascii_name.startswith('.'):
+        ascii_name = 'download' + os.path.splitext(filename)[1].encode('ascii', 'ignore').decode('ascii')
+    return '{}; filename="{}"; filename*=UTF-8\'\'{}'.format(disposition, ascii_name, quote(filename, safe=''))
+
+
+def parse_range(range_header, size):
+    """Rangeヘッダーを解析する。
+
+    １つの範囲だけに対応する。複数の範囲や解析できない場合はNoneを返し、ファイル全体を返す。
+
+    :param range_header: Rangeヘッダー（例：bytes=0-1023）
+    :param size: ファイルのサイズ
+    :return: (開始位置, 終了位置)、範囲外の場合は False
+    """
+    match = RANGE_RE.match(range_header.strip()) if range_header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-500 は最後の500バイト
+        length = int(end)
+        if length == 0 or size == 0:
+            # 空のファイルには返せる範囲がない。
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def iter_file_range(path, start, length, chunk_size=CHUNK_SIZE):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(chunk_size, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def get_file_response(request, path, filename, etag, content_type=None, disposition='attachment'):
+    """ファイルを少しずつ読み込んで返すレスポンスを作成する。
+
+    ファイル全体をメモリに読み込まないので、大きいファイルでもメモリを消費しない。
+    Range（１つの範囲）、ETag と If-None-Match / If-Range に対応する。
+
+    :param request:
+    :param path: ファイルのパス
+    :param filename: ダウンロードするファイル名
+    :param etag: ファイルを識別する値（ファイルの内容が変わらない値、例えばAttachmentのUUID）
+    :param content_type: 省略時はファイル名から判断する
+    :param disposition: attachment または inline
+    :return:
+    """
+    etag = '"{}"'.format(etag)
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = [e[2:] if e.startswith('W/') else e for e in parse_etags(if_none_match)]
+        if '*' in etags or etag in etags:
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+
+    size = os.path.getsize(path)
+    if content_type is None:
+        content_type = mimetypes.guess_type(filename)[0] or constants.MIME_TYPE_STREAM
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range == etag:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{}'.format(size)
+    elif byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            iter_file_range(path, start, end - start + 1), status=206, content_type=content_type
+        )
+        response['Content-Range'] = 'bytes {}-{}/{}'.format(start, end, size)
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, max-age=0'
+    response['Content-Disposition'] = get_content_disposition(filename, disposition)
+    return response
@@ -50,6 +50,12 @@
  * 2015/Nov/30
  [ import math ]の記述をコードの先頭に追記
 
+ * 2018/Dec
+ 年単位で祝日を一括生成する year_holidays() と、指定期間の祝日を序数
+ （date.toordinal()）で引ける holiday_table() を追加しました。
+ 春分・秋分の日の計算は年に一度だけ行い、振替休日も再帰せずに判定します。
+ 結果は holiday_name() と同じです。
+
 
 サンプル
 
@@ -90,7 +96,10 @@ import sys
 import datetime
 import math
 
+from functools import lru_cache
+
 MONDAY, TUESDAY, WEDNESDAY = 0, 1, 2
+SUNDAY = 6
 
 
 def _vernal_equinox(y):
@@ -253,3 +262,153 @@ def holiday_name(year=None, month=None, day=None, date=None):
         name = unicode(name, 'utf-8')
 
     return name
+
+
+def _nth_monday(year, month, n):
+    """指定年月の第Ｎ月曜日を返す
+    """
+    first_day = datetime.date(year, month, 1)
+    return first_day + datetime.timedelta(days=(MONDAY - first_day.weekday()) % 7 + 7 * (n - 1))
+
+
+@lru_cache(maxsize=None)
+def _year_holidays(year):
+    """整数で年を与えると、その年の祝日を (序数, 祝日名) のタプルで日付順に返す
+
+    holiday_name() と同じ規則を年単位で一括に適用したもの。
+    """
+    names = dict()
+
+    def add(month, day, name):
+        names.setdefault(datetime.date(year, month, day), name)
+
+    # 1月
+    add(1, 1, '元日')
+    if year >= 2000:
+        names.setdefault(_nth_monday(year, 1, 2), '成人の日')
+    else:
+        add(1, 15, '成人の日')
+    # 2月
+    if year >= 1967:
+        add(2, 11, '建国記念の日')
+    if year == 1989:
+        add(2, 24, '昭和天皇の大喪の礼')
+    # 3月
+    vernal_equinox = _vernal_equinox(year)
+    if 1 <= vernal_equinox <= 31:
+        add(3, vernal_equinox, '春分の日')
+    # 4月
+    if year >= 2007:
+        add(4, 29, '昭和の日')
+    elif year >= 1989:
+        add(4, 29, 'みどりの日')
+    else:
+        add(4, 29, '天皇誕生日')
+    if year == 1959:
+        add(4, 10, '皇太子明仁親王の結婚の儀')
+    # 5月
+    add(5, 3, '憲法記念日')
+    if year >= 2007:
+        add(5, 4, 'みどりの日')
+    elif year >= 1986 and datetime.date(year, 5, 4).weekday() != MONDAY:
+        add(5, 4, '国民の休日')
+    add(5, 5, 'こどもの日')
+    if year >= 2007 and datetime.date(year, 5, 6).weekday() in (TUESDAY, WEDNESDAY):
+        add(5, 6, '振替休日')
+    # 6月
+    if year == 1993:
+        add(6, 9, '皇太子徳仁親王の結婚の儀')
+    # 7月
+    if year >= 2003:
+        names.setdefault(_nth_monday(year, 7, 3), '海の日')
+    elif year >= 1996:
+        add(7, 20, '海の日')
+    # 8月
+    if year >= 2016:
+        add(8, 11, '山の日')
+    # 9月
+    autumn_equinox = _autumn_equinox(year)
+    if 1 <= autumn_equinox <= 30:
+        add(9, autumn_equinox, '秋分の日')
+    if year >= 2003:
+        names.setdefault(_nth_monday(year, 9, 3), '敬老の日')
+        if 2 <= autumn_equinox <= 30 and datetime.date(year, 9, autumn_equinox - 1).weekday() == TUESDAY:
+            add(9, autumn_equinox - 1, '国民の休日')
+    elif year >= 1966:
+        add(9, 15, '敬老の日')
+    # 10月
+    if year >= 2000:
+        names.setdefault(_nth_monday(year, 10, 2), '体育の日')
+    elif year >= 1966:
+        add(10, 10, '体育の日')
+    # 11月
+    add(11, 3, '文化の日')
+    add(11, 23, '勤労感謝の日')
+    if year == 1990:
+        add(11, 12, '即位礼正殿の儀')
+    # 12月
+    if year >= 1989:
+        add(12, 23, '天皇誕生日')
+
+    # 祝日法施行前の日付を除く
+    start_date = datetime.date(1948, 7, 20)
+    names = dict((date, name) for date, name in names.items() if date >= start_date)
+
+    # 振替休日
+    for date in sorted(names):
+        if date.weekday() == SUNDAY:
+            names.setdefault(date + datetime.timedelta(days=1), '振替休日')
+
+    return tuple(sorted((date.toordinal(), name) for date, name in names.items()))
+
+
+def year_holidays(year):
+    """整数で年を与えると、その年の祝日を (datetime.date, 祝日名) のリストで日付順に返す
+    """
+    return [(datetime.date.fromordinal(ordinal), name) for ordinal, name in _year_holidays(int(year))]
+
+
+class HolidayTable(object):
+    """指定期間の祝日表
+
+    start_year から end_year まで（両端を含む）の祝日を序数（date.toordinal()）をキーとして保持する。
+    期間内の日付であれば、 holiday_name() と同じ結果を辞書の参照だけで返す。
+    """
+
+    def __init__(self, start_year, end_year=None):
+        self.start_year = int(start_year)
+        self.end_year = int(end_year) if end_year is not None else self.start_year
+        if self.start_year > self.end_year:
+            raise ValueError('start_year must not be greater than end_year')
+        self._min_ordinal = datetime.date(self.start_year, 1, 1).toordinal()
+        self._max_ordinal = datetime.date(self.end_year, 12, 31).toordinal()
+        self._names = dict()
+        for year in range(self.start_year, self.end_year + 1):
+            self._names.update(_year_holidays(year))
+
+    def _to_ordinal(self, date):
+        ordinal = date if isinstance(date, int) else date.toordinal()
+        if not self._min_ordinal <= ordinal <= self._max_ordinal:
+            raise ValueError('%s is out of range %s-%s' % (date, self.start_year, self.end_year))
+        return ordinal
+
+    def get(self, date):
+        """datetime.date または序数を与えると、祝日であればその名前を、祝日でなければ None を返す
+        """
+        return self._names.get(self._to_ordinal(date))
+
+    def __contains__(self, date):
+        return self._to_ordinal(date) in self._names
+
+    def __len__(self):
+        return len(self._names)
+
+    def __iter__(self):
+        for ordinal in sorted(self._names):
+            yield datetime.date.fromordinal(ordinal), self._names[ordinal]
+
+
+def holiday_table(start_year, end_year=None):
+    """指定年、または指定期間の祝日表（HolidayTable）を返す
+    """
+    return HolidayTable(start_year, end_year)
@@ -0,0 +1,106 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from . import procedure_cache
+
+
+class MasterDataCache(object):
+    """マスターデータのキャッシュ（プロセス単位）
+
+    自社情報、システム設定、メールグループなど、ほとんど変更されないデータをプロセスのメモリに保持する。
+    データごとに参照するテーブルを指定し、テーブルのバージョン（procedure_cache と同じもの）が
+    変わったら読み込みなおす。バージョンはDjangoのキャッシュに保存されているので、
+    共有のキャッシュ（memcachedなど）を設定すれば他のプロセスの変更も反映される。
+
+    バージョンの確認は MASTER_CACHE_CHECK_INTERVAL 秒（既定値は１秒）ごとに１回だけ行う。
+    共有のキャッシュを使わない場合に備えて、MASTER_CACHE_TIMEOUT 秒（既定値は300秒）経ったデータも読み込みなおす。
+    このプロセスで変更した場合は、コミット後にすぐ破棄する（invalidate_tables）。
+    参照するテーブルは、モジュールの読み込み時に procedure_cache.track_tables() で登録しておくこと。
+    登録しないと、テーブルが変更されてもバージョンが上がらない。
+
+    使用例::
+
+        company = master_cache.get('company', lambda: Company.objects.first(), ('eb_company',))
+    """
+
+    def __init__(self, check_interval=None, timeout=None):
+        self.check_interval = check_interval if check_interval is not None \
+            else getattr(settings, 'MASTER_CACHE_CHECK_INTERVAL', 1)
+        self.timeout = timeout or getattr(settings, 'MASTER_CACHE_TIMEOUT', 300)
+        self._lock = threading.Lock()
+        self._entries = dict()
+        self._versions = dict()
+
+    def get_versions(self, tables):
+        """テーブルのバージョンを取得する。
+
+        前回の確認から check_interval 秒以内の場合は、前回のバージョンを使う。
+
+        :param tables: テーブル名のリスト
+        :return:
+        """
+        now = time.time()
+        versions = dict()
+        stale = []
+        for table in tables:
+            cached = self._versions.get(table)
+            if cached is None or cached[1] + self.check_interval <= now:
+                stale.append(table)
+            else:
+                versions[table] = cached[0]
+        if stale:
+            found = procedure_cache.get_table_versions(stale)
+            with self._lock:
+                for table in stale:
+                    self._versions[table] = (found[table], now)
+            versions.update(found)
+        return tuple(versions[table] for table in tables)
+
+    def get(self, key, loader, tables):
+        """キャッシュしたデータを取得する。
+
+        :param key: データのキー
+        :param loader: データを読み込む関数
+        :param tables: データが参照するテーブル名のリスト
+        :return:
+        """
+        tables = tuple(tables)
+        versions = self.get_versions(tables)
+        entry = self._entries.get(key)
+        if entry is not None and entry[1] == versions and entry[2] > time.time():
+            return entry[3]
+        value = loader()
+        with self._lock:
+            self._entries[key] = (tables, versions, time.time() + self.timeout, value)
+        return value
+
+    def invalidate_tables(self, *tables):
+        """指定テーブルを参照するデータを破棄する。
+
+        トランザクション中の場合はコミット後に破棄する。
+
+        :param tables: テーブル名
+        :return:
+        """
+        if any(table in self._versions for table in tables):
+            transaction.on_commit(lambda: self._forget(tables))
+
+    def _forget(self, tables):
+        with self._lock:
+            for table in tables:
+                self._versions.pop(table, None)
+            self._entries = dict(
+                (key, entry) for key, entry in self._entries.items()
+                if not any(table in entry[0] for table in tables)
+            )
+
+    def clear(self):
+        with self._lock:
+            self._entries = dict()
+            self._versions = dict()
+
+
+master_cache = MasterDataCache()
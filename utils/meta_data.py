@@ -12,6 +12,7 @@ from utils import common
 class BaseSimpleMetadata(SimpleMetadata):
     schema_object = None
     serializer = None
+    model_field_names = None
 
     def determine_metadata(self, request, view):
         if view.schema_class:
@@ -28,21 +29,27 @@ class BaseSimpleMetadata(SimpleMetadata):
             metadata['fieldsets'] = self.schema_object.get_fieldsets()
             if not metadata['fieldsets']:
                 if view.serializer_class.Meta.fields == '__all__':
-                    model = view.serializer_class.Meta.model
-                    model_fields = [field.name for field in model._meta.fields]
+                    model_fields = list(self.get_model_field_names())
                     model_fields.extend([
                         field_name for field_name in self.serializer.fields.keys()
-                        if field_name not in model_fields
+                        if field_name not in self.get_model_field_names()
                     ])
-                    sort_list = []
-                    for i, col in enumerate(columns):
-                        try:
-                            sort_list.append(model_fields.index(col['name']))
-                        except ValueError:
-                            sort_list.append(10000 + i)
+                    field_index = dict((name, i) for i, name in enumerate(model_fields))
+                    sort_list = [field_index.get(col['name'], 10000 + i) for i, col in enumerate(columns)]
                     metadata['columns'] = [c for c, _ in sorted(zip(columns, sort_list), key=lambda pair: pair[1])]
         return metadata
 
+    def get_model_field_names(self):
+        """シリアライザーのモデルのＤＢ項目名を取得する
+
+        :return:
+        """
+        if self.model_field_names is None:
+            self.model_field_names = OrderedDict(
+                (f.name, None) for f in self.serializer.Meta.model._meta.fields
+            )
+        return self.model_field_names
+
     def get_serializer_info(self, serializer, view=None):
         """
         Given an instance of a serializer, return a dictionary of metadata
@@ -103,7 +110,7 @@ class BaseSimpleMetadata(SimpleMetadata):
         :param field:
         :return:
         """
-        if field.field_name in [f.name for f in self.serializer.Meta.model._meta.fields]:
+        if field.field_name in self.get_model_field_names():
             # 項目がＤＢ項目の場合、並び替え可
             return field.field_name
         elif hasattr(self.serializer, 'get_' + field.field_name):
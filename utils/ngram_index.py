@@ -0,0 +1,203 @@
+import re
+import threading
+import unicodedata
+
+from collections import defaultdict
+
+# 検索で無視する文字（空白、中黒、ピリオドなど）
+IGNORE_PATTERN = re.compile(r'[\s・･.,、。]+')
+
+
+def to_hiragana(text):
+    return ''.join(chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c for c in text)
+
+
+def to_katakana(text):
+    return ''.join(chr(ord(c) + 0x60) if 'ぁ' <= c <= 'ゖ' else c for c in text)
+
+
+def normalize(text):
+    """検索用に文字列を正規化する。
+
+    全角英数字と半角カナをNFKCで統一し、英字は小文字、カタカナはひらがなに変換する。
+    空白と中黒などの区切り文字は削除する。
+
+    :param text: 文字列
+    :return:
+    """
+    if not text:
+        return ''
+    text = to_hiragana(unicodedata.normalize('NFKC', str(text)).lower())
+    return IGNORE_PATTERN.sub('', text)
+
+
+def split_keyword(keyword):
+    """検索キーワードを空白で分割して、正規化する。
+
+    :param keyword: 検索キーワード
+    :return: 正規化したトークンのリスト
+    """
+    if not keyword:
+        return []
+    tokens = []
+    for word in unicodedata.normalize('NFKC', str(keyword)).split():
+        token = normalize(word)
+        if token and token not in tokens:
+            tokens.append(token)
+    return tokens
+
+
+def get_grams(text, n=2):
+    if len(text) < n:
+        return {text} if text else set()
+    return set(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class NgramIndex(object):
+    """N-gram（バイグラム）の転置インデックス
+
+    キー（モデルのＩＤなど）ごとに複数の文字列を登録し、部分一致で検索する。
+    １文字のキーワードでも検索できるように、１文字のインデックスも作成する。
+    キーワードを空白で区切った場合は、全てのトークンを含むキーを検索する（AND検索）。
+
+    使用例::
+
+        index = NgramIndex()
+        index.add(1, ['山田 太郎', 'ヤマダ タロウ'])
+        index.search('やまだ')  # => [1]
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._terms = dict()
+        self._unigrams = defaultdict(set)
+        self._bigrams = defaultdict(set)
+
+    def __len__(self):
+        return len(self._terms)
+
+    def __contains__(self, key):
+        return key in self._terms
+
+    def clear(self):
+        with self._lock:
+            self._terms = dict()
+            self._unigrams = defaultdict(set)
+            self._bigrams = defaultdict(set)
+
+    def add(self, key, texts):
+        """キーの文字列を登録する。既に登録されている場合は置き換える。
+
+        :param key: キー
+        :param texts: 文字列のリスト
+        :return:
+        """
+        terms = []
+        for text in texts:
+            term = normalize(text)
+            if term and term not in terms:
+                terms.append(term)
+        with self._lock:
+            self.remove(key)
+            if not terms:
+                return
+            self._terms[key] = tuple(terms)
+            for term in terms:
+                for c in term:
+                    self._unigrams[c].add(key)
+                for gram in get_grams(term):
+                    self._bigrams[gram].add(key)
+
+    def remove(self, key):
+        with self._lock:
+            terms = self._terms.pop(key, None)
+            if not terms:
+                return
+            for term in terms:
+                for c in term:
+                    self._discard(self._unigrams, c, key)
+                for gram in get_grams(term):
+                    self._discard(self._bigrams, gram, key)
+
+    @staticmethod
+    def _discard(postings, gram, key):
+        keys = postings.get(gram)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del postings[gram]
+
+    def _get_candidates(self, token):
+        postings = self._unigrams if len(token) == 1 else self._bigrams
+        candidates = None
+        for gram in sorted(get_grams(token), key=lambda g: len(postings.get(g, ()))):
+            keys = postings.get(gram)
+            if not keys:
+                return set()
+            candidates = set(keys) if candidates is None else candidates & keys
+            if not candidates:
+                break
+        return candidates or set()
+
+    @staticmethod
+    def get_score(token, terms):
+        """トークンとキーの文字列の一致度を計算する。
+
+        :param token: 正規化したトークン
+        :param terms: キーの正規化した文字列
+        :return: 完全一致は３、前方一致は２、部分一致は１、一致しない場合は０
+        """
+        score = 0
+        for term in terms:
+            if term == token:
+                return 3
+            elif term.startswith(token):
+                score = 2
+            elif score == 0 and token in term:
+                score = 1
+        return score
+
+    def rank(self, keyword, limit=None):
+        """キーワードを含むキーを一致度の高い順に取得する。
+
+        一致度が同じ場合は文字列の短い順、キーの順に並べる。
+
+        :param keyword: 検索キーワード
+        :param limit: 最大件数
+        :return: (キー, 一致度) のリスト、一致度は全てのトークンが完全一致の場合に１となる
+        """
+        tokens = split_keyword(keyword)
+        if not tokens:
+            return []
+        with self._lock:
+            candidates = None
+            for token in sorted(tokens, key=len, reverse=True):
+                keys = self._get_candidates(token)
+                candidates = keys if candidates is None else candidates & keys
+                if not candidates:
+                    return []
+            ranked = []
+            for key in candidates:
+                terms = self._terms[key]
+                total = 0
+                for token in tokens:
+                    # N-gramが含まれていても、連続していない場合は一致しない。
+                    score = self.get_score(token, terms)
+                    if score == 0:
+                        break
+                    total += score
+                else:
+                    ranked.append((-total, min(len(term) for term in terms), key))
+        ranked.sort()
+        if limit:
+            ranked = ranked[:limit]
+        return [(key, -total / (3.0 * len(tokens))) for total, length, key in ranked]
+
+    def search(self, keyword, limit=None):
+        """キーワードを含むキーを一致度の高い順に取得する。
+
+        :param keyword: 検索キーワード
+        :param limit: 最大件数
+        :return: キーのリスト
+        """
+        return [key for key, score in self.rank(keyword, limit)]
@@ -0,0 +1,338 @@
+import atexit
+import os
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+import pdfkit
+
+from django.conf import settings
+
+from . import common, constants
+from .errors import CustomException
+
+logger = common.get_system_logger()
+
+DEFAULT_OPTIONS = {
+    'encoding': "UTF-8",
+    'page-size': 'A4',
+    'dpi': 300,
+}
+# 完了を標準エラー出力の「Done」で判断するので、ログを抑制するオプションは使わない。
+IGNORED_OPTIONS = ('quiet', 'q', 'log-level', 'read-args-from-stdin')
+PDF_EOF = b'%%EOF'
+
+
+def get_options(config=None):
+    options = dict(DEFAULT_OPTIONS)
+    if config and isinstance(config, dict):
+        options.update(config)
+    return options
+
+
+def get_args(options):
+    """pdfkitと同じ形式のオプションをwkhtmltopdfの引数に変換する。
+
+    :param options: オプションの辞書（例：{'page-size': 'A4', 'no-outline': None}）
+    :return:
+    """
+    args = []
+    for key, value in options.items():
+        key = key.lstrip('-')
+        if key in IGNORED_OPTIONS:
+            continue
+        values = value if isinstance(value, (list, tuple)) else [value]
+        for value in values:
+            args.append('--' + key)
+            if isinstance(value, (list, tuple)):
+                args.extend(str(v) for v in value)
+            elif value is not None and value != '':
+                args.append(str(value))
+    return args
+
+
+def quote_arg(arg):
+    return '"{}"'.format(arg.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+class WkhtmltopdfProcess(object):
+    """常駐するwkhtmltopdfのプロセス
+
+    --read-args-from-stdin で起動すると、標準入力の１行が１回分の引数になり、
+    プロセスを終了せずに次の行を待つので、文書ごとにプロセスを起動するコストがかからない。
+    変換が終わると標準エラー出力に「Done」が出力される。
+    変換に失敗した場合、プロセスは終了するので、次の文書で起動しなおす。
+
+    出力先は「-」（標準出力）にして、ＰＤＦはパイプから読み込む。
+    標準入力は引数に使うので、入力のＨＴＭＬだけはプロセス専用の一時フォルダーに置く。
+    """
+
+    def __init__(self, binary):
+        self.binary = binary
+        self.process = None
+        self.lines = None
+        self.output = bytearray()
+        self.output_closed = False
+        self.output_cond = threading.Condition()
+        self.workdir = tempfile.mkdtemp(prefix='wkhtmltopdf_', dir=common.get_local_temp_path())
+
+    def is_alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        os.makedirs(self.workdir, exist_ok=True)
+        self.process = subprocess.Popen(
+            [self.binary, '--read-args-from-stdin'],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            cwd=self.workdir, close_fds=True,
+        )
+        self.lines = queue.Queue()
+        with self.output_cond:
+            self.output = bytearray()
+            self.output_closed = False
+        for target, args in ((self.read_stderr, (self.process.stderr, self.lines)),
+                             (self.read_stdout, (self.process.stdout,))):
+            reader = threading.Thread(target=target, args=args)
+            reader.daemon = True
+            reader.start()
+
+    def read_stdout(self, stream):
+        output = self.output
+        while True:
+            chunk = os.read(stream.fileno(), 65536)
+            with self.output_cond:
+                if output is not self.output:
+                    # 起動しなおしたプロセスの出力ではない。
+                    stream.close()
+                    break
+                if not chunk:
+                    self.output_closed = True
+                else:
+                    output.extend(chunk)
+                self.output_cond.notify_all()
+            if not chunk:
+                stream.close()
+                break
+
+    def is_output_completed(self):
+        return self.output_closed or self.output.rstrip().endswith(PDF_EOF)
+
+    def pop_output(self, timeout):
+        """標準出力に書き込まれたＰＤＦを取得する。
+
+        「Done」が出力された時点でＰＤＦは書き込み済みだが、読み込みが終わるまで待つ。
+
+        :param timeout: タイムアウト（秒）
+        :return:
+        """
+        with self.output_cond:
+            self.output_cond.wait_for(self.is_output_completed, timeout)
+            data = bytes(self.output)
+            del self.output[:]
+        return data
+
+    @staticmethod
+    def read_stderr(stream, lines):
+        # 進捗は「\r」で上書きされるので、「\r」と「\n」の両方で行を区切る。
+        buf = b''
+        while True:
+            chunk = os.read(stream.fileno(), 4096)
+            if not chunk:
+                stream.close()
+                break
+            buf += chunk.replace(b'\r', b'\n')
+            *completed, buf = buf.split(b'\n')
+            for line in completed:
+                if line.strip():
+                    lines.put(line.decode('utf-8', 'replace').strip())
+        if buf.strip():
+            lines.put(buf.decode('utf-8', 'replace').strip())
+        lines.put(None)
+
+    def stop(self):
+        if self.process is None:
+            return
+        try:
+            self.process.kill()
+            self.process.wait(5)
+        except Exception as ex:
+            logger.warning(ex)
+        # 標準出力と標準エラー出力は、プロセスの終了後に読み込み側のスレッドで閉じる。
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        self.process = None
+
+    def close(self):
+        self.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def render(self, html, options, timeout):
+        """ＨＴＭＬをＰＤＦに変換する。
+
+        :param html: ＨＴＭＬ文字列
+        :param options: wkhtmltopdfのオプション
+        :param timeout: タイムアウト（秒）
+        :return: ＰＤＦのバイト列
+        """
+        if not self.is_alive():
+            self.stop()
+            self.start()
+        in_path = os.path.join(self.workdir, 'input.html')
+        with open(in_path, 'w', encoding='utf-8') as f:
+            f.write(html)
+        with self.output_cond:
+            del self.output[:]
+        args = get_args(options) + [in_path, '-']
+        try:
+            self.process.stdin.write((' '.join(quote_arg(arg) for arg in args) + '\n').encode('utf-8'))
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError):
+            self.stop()
+            raise CustomException(constants.ERROR_PDF_RENDER_FAILED.format(message='wkhtmltopdf exited'))
+
+        deadline = time.time() + timeout
+        messages = []
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                self.stop()
+                raise CustomException(constants.ERROR_PDF_RENDER_TIMEOUT.format(timeout=timeout))
+            try:
+                line = self.lines.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if line is None:
+                self.stop()
+                raise CustomException(constants.ERROR_PDF_RENDER_FAILED.format(message=' '.join(messages[-3:])))
+            if line.startswith('Done'):
+                break
+            if not line.startswith(('[', 'Loading', 'Counting', 'Resolving', 'Printing', 'Rendering')):
+                messages.append(line)
+        data = self.pop_output(max(deadline - time.time(), 1))
+        if not data.rstrip().endswith(PDF_EOF):
+            self.stop()
+            raise CustomException(constants.ERROR_PDF_RENDER_FAILED.format(message=' '.join(messages[-3:])))
+        return data
+
+
+class RenderJob(object):
+
+    def __init__(self, html, options, timeout):
+        self.html = html
+        self.options = options
+        self.timeout = timeout
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class PdfRenderer(object):
+    """ＨＴＭＬからＰＤＦを作成するサービス
+
+    常駐するwkhtmltopdfのプロセスを持つワーカー（PDF_RENDERER_WORKERS、既定値は２）が
+    キューから順番に文書を取り出して変換する。１文書の変換時間が PDF_RENDERER_TIMEOUT
+    （既定値は60秒）を超えた場合、そのプロセスを終了させてエラーにする。
+    PDF_RENDERER_WORKERS が０の場合、常駐プロセスを使わずに文書ごとに pdfkit で変換する。
+
+    使用例::
+
+        pdf_renderer.render(html)
+        pdf_renderer.render_many([html1, html2], {'orientation': 'Landscape'})
+    """
+
+    def __init__(self, workers=None, timeout=None):
+        self.workers = workers if workers is not None else getattr(settings, 'PDF_RENDERER_WORKERS', 2)
+        self.timeout = timeout or getattr(settings, 'PDF_RENDERER_TIMEOUT', 60)
+        self._lock = threading.Lock()
+        self._queue = None
+        self._processes = []
+        self._pid = None
+
+    def _get_queue(self):
+        # フォークした子プロセスでは親のワーカースレッドが存在しないので作成しなおす。
+        if self._queue is None or self._pid != os.getpid():
+            with self._lock:
+                if self._queue is None or self._pid != os.getpid():
+                    self._start_workers()
+        return self._queue
+
+    def _start_workers(self):
+        binary = pdfkit.configuration().wkhtmltopdf
+        if isinstance(binary, bytes):
+            binary = binary.decode('utf-8')
+        self._queue = queue.Queue()
+        self._processes = []
+        self._pid = os.getpid()
+        for i in range(self.workers):
+            process = WkhtmltopdfProcess(binary)
+            self._processes.append(process)
+            worker = threading.Thread(target=self._run, args=(self._queue, process), name='pdf_renderer_{}'.format(i))
+            worker.daemon = True
+            worker.start()
+
+    @staticmethod
+    def _run(jobs, process):
+        while True:
+            job = jobs.get()
+            try:
+                job.result = process.render(job.html, job.options, job.timeout)
+            except Exception as ex:
+                job.error = ex
+            finally:
+                job.done.set()
+
+    def render(self, html, config=None, timeout=None):
+        """ＨＴＭＬをＰＤＦに変換する。
+
+        :param html: ＨＴＭＬ文字列
+        :param config: wkhtmltopdfのオプション（既定のオプションに上書きする）
+        :param timeout: タイムアウト（秒）
+        :return: ＰＤＦのバイト列
+        """
+        return self.render_many([html], config, timeout)[0]
+
+    def render_many(self, html_list, config=None, timeout=None):
+        """複数のＨＴＭＬをまとめてＰＤＦに変換する。
+
+        全てのワーカーで並列に変換し、全ての文書が終わってから結果を返す。
+        エラーになった文書はそれぞれログに出力し、最初のエラーを発生させる。
+
+        :param html_list: ＨＴＭＬ文字列のリスト
+        :param config: wkhtmltopdfのオプション（既定のオプションに上書きする）
+        :param timeout: １文書のタイムアウト（秒）
+        :return: ＰＤＦのバイト列のリスト
+        """
+        options = get_options(config)
+        timeout = timeout or self.timeout
+        if self.workers <= 0:
+            return [pdfkit.from_string(html, False, options=options) for html in html_list]
+
+        jobs = [RenderJob(html, options, timeout) for html in html_list]
+        pdf_queue = self._get_queue()
+        for job in jobs:
+            pdf_queue.put(job)
+        errors = []
+        for job in jobs:
+            job.done.wait()
+            if job.error is not None:
+                logger.error('pdf rendering failed: %s', getattr(job.error, 'message', job.error))
+                errors.append(job.error)
+        if errors:
+            raise errors[0]
+        return [job.result for job in jobs]
+
+    def close(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                for process in self._processes:
+                    process.close()
+            self._processes = []
+
+
+pdf_renderer = PdfRenderer()
+atexit.register(pdf_renderer.close)
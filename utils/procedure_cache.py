@@ -0,0 +1,201 @@
+import hashlib
+import threading
+import time
+
+from django.core.cache import caches
+from django.db import connection, transaction
+from django.dispatch import Signal
+
+from . import common
+
+DEFAULT_TIMEOUT = 300
+CACHE_ALIAS = 'default'
+KEY_PREFIX = 'procedure_cache'
+
+# 新しいテーブルが登録された場合に送信する（master.signals でそのモデルの変更を受け取るため）
+tables_tracked = Signal(providing_args=['tables'])
+
+
+class CachedProcedure(object):
+    """結果をキャッシュするストアドプロシージャ
+
+    プロシージャ名と引数をキーにして、 common.dictfetchall() の結果をキャッシュする。
+    キャッシュのキーには参照するテーブルのバージョンも含まれているので、
+    invalidate_tables() でテーブルのバージョンを上げると、そのテーブルを参照する
+    全てのプロシージャのキャッシュが無効になる。
+
+    バージョンは settings.CACHES の共有のキャッシュ（memcached）に保存するので、他のプロセスにも反映される。
+    どのプロセスで変更されてもバージョンが上がるように、インスタンスはモジュールの読み込み時に作成すること
+    （各アプリの biz モジュールは master.apps で起動時に読み込む）。
+
+    使用例::
+
+        sp_member_status = CachedProcedure(
+            'sp_member_status', tables=('eb_member', 'eb_projectmember'), timeout=60
+        )
+        results = sp_member_status()
+    """
+
+    _registry = dict()
+    _tables = set()
+    _lock = threading.Lock()
+
+    def __init__(self, name, tables=(), timeout=DEFAULT_TIMEOUT):
+        """
+        :param name: プロシージャ名
+        :param tables: プロシージャが参照するテーブル名のリスト
+        :param timeout: キャッシュの有効期間（秒）
+        """
+        self.name = name
+        self.tables = tuple(sorted(set(tables)))
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        with self._lock:
+            CachedProcedure._registry[name] = self
+        track_tables(*self.tables)
+
+    def __call__(self, *args):
+        cache = caches[CACHE_ALIAS]
+        key = self.get_cache_key(args, cache)
+        results = cache.get(key)
+        if results is None:
+            results = self.execute(*args)
+            cache.set(key, results, self.timeout)
+            self._count(hit=False)
+        else:
+            self._count(hit=True)
+        return results
+
+    def execute(self, *args):
+        """キャッシュを使わずにプロシージャを実行する。
+
+        :param args: プロシージャの引数
+        :return:
+        """
+        with connection.cursor() as cursor:
+            if args:
+                cursor.callproc(self.name, args)
+            else:
+                cursor.callproc(self.name)
+            return common.dictfetchall(cursor)
+
+    def get_cache_key(self, args, cache=None):
+        """プロシージャ名、引数と参照テーブルのバージョンからキャッシュのキーを作成する。
+
+        :param args: プロシージャの引数
+        :param cache:
+        :return:
+        """
+        versions = get_table_versions(self.tables, cache)
+        raw = '{}:{}'.format(
+            repr(args),
+            ','.join('{}={}'.format(table, versions[table]) for table in self.tables),
+        )
+        return '{}:{}:{}'.format(KEY_PREFIX, self.name, hashlib.md5(raw.encode('utf-8')).hexdigest())
+
+    def _count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+
+    @classmethod
+    def get_stats(cls):
+        """プロシージャごとのヒット数とミス数を取得する（プロセス単位）。
+
+        :return:
+        """
+        with cls._lock:
+            return [{
+                'name': procedure.name,
+                'tables': procedure.tables,
+                'timeout': procedure.timeout,
+                'hits': procedure.hits,
+                'misses': procedure.misses,
+            } for name, procedure in sorted(cls._registry.items())]
+
+    @classmethod
+    def is_tracked(cls, table):
+        return table in cls._tables
+
+
+def track_tables(*tables):
+    """キャッシュで使うテーブルを登録する。
+
+    登録したテーブルのモデルは、データが変更されたら invalidate_tables() でバージョンが上がる（master.signals）。
+    プロシージャ以外のキャッシュ（master_cache など）で使うテーブルも、モジュールの読み込み時に登録すること。
+
+    :param tables: テーブル名
+    :return:
+    """
+    with CachedProcedure._lock:
+        tables = set(tables) - CachedProcedure._tables
+        CachedProcedure._tables.update(tables)
+    if tables:
+        tables_tracked.send(sender=CachedProcedure, tables=tables)
+
+
+def get_tracked_tables():
+    """登録したテーブルを全て取得する。
+
+    :return:
+    """
+    with CachedProcedure._lock:
+        return frozenset(CachedProcedure._tables)
+
+
+def _get_version_key(table):
+    return '{}:table:{}'.format(KEY_PREFIX, table)
+
+
+def get_table_versions(tables, cache=None):
+    """テーブルのバージョンを取得する。
+
+    バージョンが存在しない（または追い出された）場合は現在時刻で初期化するので、
+    以前のバージョンのキャッシュが再利用されることはない。
+
+    :param tables: テーブル名のリスト
+    :param cache:
+    :return: テーブル名をキーとした辞書
+    """
+    cache = cache or caches[CACHE_ALIAS]
+    keys = dict((_get_version_key(table), table) for table in tables)
+    found = cache.get_many(list(keys))
+    versions = dict()
+    for key, table in keys.items():
+        version = found.get(key)
+        if version is None:
+            cache.add(key, int(time.time() * 1000), None)
+            version = cache.get(key)
+        versions[table] = version
+    return versions
+
+
+def invalidate_tables(*tables):
+    """指定テーブルのバージョンを上げて、そのテーブルを参照するキャッシュを全て無効にする。
+
+    このプロセスで登録されていないテーブルでも、他のプロセスで参照している場合があるので必ず上げる。
+    トランザクション中の場合はコミット後に無効にする。
+
+    :param tables: テーブル名
+    :return:
+    """
+    if tables:
+        transaction.on_commit(lambda: _increase_versions(tables))
+
+
+def _increase_versions(tables):
+    cache = caches[CACHE_ALIAS]
+    for table in tables:
+        key = _get_version_key(table)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, int(time.time() * 1000), None)
@@ -0,0 +1,71 @@
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, connections
+
+from . import common
+
+logger = common.get_system_logger()
+
+
+class QueryExecutor(object):
+    """独立した複数のレポートクエリを並列に実行する
+
+    スレッド数に上限のあるスレッドプールで実行する。
+    Djangoのデータベース接続はスレッドごとに作成されるので、各クエリは別々の接続で実行され、
+    クエリ終了後にそのスレッドの接続を閉じる。
+
+    トランザクション中に呼ばれた場合は、コミット前のデータが別の接続から見えないので、
+    呼び出し元のスレッドで順番に実行する。
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or getattr(settings, 'QUERY_EXECUTOR_MAX_WORKERS', 4)
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    @staticmethod
+    def _call(func, args):
+        try:
+            return func(*args)
+        finally:
+            connections.close_all()
+
+    def run(self, tasks):
+        """クエリを並列に実行し、全ての結果を取得する。
+
+        いずれかのクエリでエラーが発生した場合、全てのクエリが終わってから、
+        エラーとなったクエリをそれぞれログに出力し、最初のエラーを発生させる。
+
+        :param tasks: キーと関数、または キーと (関数, 引数のタプル) の辞書
+        :return: キーと結果の辞書
+        """
+        tasks = [(key, task if isinstance(task, tuple) else (task, ())) for key, task in tasks.items()]
+        if connection.in_atomic_block:
+            return dict((key, func(*args)) for key, (func, args) in tasks)
+
+        pool = self._get_pool()
+        futures = [(key, pool.submit(self._call, func, args)) for key, (func, args) in tasks]
+        results = dict()
+        errors = []
+        for key, future in futures:
+            try:
+                results[key] = future.result()
+            except Exception as ex:
+                logger.error('query "%s" failed: %s', key, ex)
+                errors.append(ex)
+        if errors:
+            raise errors[0]
+        return results
+
+
+query_executor = QueryExecutor()
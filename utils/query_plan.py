@@ -0,0 +1,174 @@
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+
+from rest_framework.fields import SerializerMethodField
+from rest_framework.relations import ManyRelatedField, RelatedField
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+
+def get_relation_field(opts, attr):
+    """属性名から関連フィールドを取得する。
+
+    逆参照の場合、属性名は related_name（なければ xxx_set）になる。
+
+    :param opts: モデルの_meta
+    :param attr: 属性名
+    :return: 関連フィールドでない場合はNone
+    """
+    try:
+        field = opts.get_field(attr)
+        if field.concrete:
+            return field if field.is_relation and field.related_model is not None else None
+    except FieldDoesNotExist:
+        pass
+    for field in opts.get_fields():
+        if field.auto_created and not field.concrete and field.get_accessor_name() == attr:
+            return field
+    return None
+
+
+class QueryPlan(object):
+    """シリアライザーが参照する関連オブジェクトの取得計画
+
+    シリアライザーの source（customer.name など）、ネストしたシリアライザー、
+    関連フィールドとメソッドフィールドのヒントから、一覧の各行で発生する
+    関連オブジェクトのクエリを洗い出し、 select_related / prefetch_related にまとめる。
+
+    メソッドフィールドの中で関連オブジェクトを参照する場合は、メソッドに
+    related_fields を設定する::
+
+        def get_member_name(self, obj):
+            return '{} {}'.format(obj.member.first_name, obj.member.last_name)
+
+        get_member_name.related_fields = ('member',)
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.select_related = []
+        self.prefetch_related = []
+        # (シリアライザーのフィールド名, 参照パス, 取得方法)
+        self.reasons = []
+
+    def add(self, field_name, attrs):
+        """参照パスを解決し、計画に追加する。
+
+        :param field_name: シリアライザーのフィールド名
+        :param attrs: 参照パス（属性名のリスト）
+        :return:
+        """
+        opts = self.model._meta
+        path = []
+        prefetch = False
+        for attr in attrs:
+            field = get_relation_field(opts, attr)
+            if field is None:
+                break
+            path.append(field.name if field.concrete else field.get_accessor_name())
+            if field.many_to_many or field.one_to_many or not field.concrete:
+                prefetch = True
+            opts = field.related_model._meta
+        if not path:
+            return
+        lookup = '__'.join(path)
+        if prefetch:
+            method = 'prefetch_related'
+            target = self.prefetch_related
+        else:
+            method = 'select_related'
+            target = self.select_related
+        if lookup not in target:
+            target.append(lookup)
+        self.reasons.append((field_name, lookup, method))
+
+    def apply(self, queryset):
+        """クエリセットに select_related / prefetch_related を適用する。
+
+        values() や union() などのクエリセットには適用しない。
+
+        :param queryset:
+        :return:
+        """
+        if queryset.model is not self.model or queryset._fields is not None or queryset.query.combinator:
+            return queryset
+        if self.select_related:
+            queryset = queryset.select_related(*self.select_related)
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*self.prefetch_related)
+        return queryset
+
+    def report(self):
+        """取得計画の説明（デバッグ用）
+
+        :return:
+        """
+        lines = ['{}.{}'.format(self.model._meta.app_label, self.model.__name__)]
+        if not self.reasons:
+            lines.append('  (no related lookups)')
+        lines.extend('  {}: {}({!r})'.format(field_name, method, lookup) for field_name, lookup, method in self.reasons)
+        return '\n'.join(lines)
+
+
+class QueryPlanner(object):
+    """シリアライザークラスごとに取得計画を作成し、プロセス内で再利用する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._plans = dict()
+
+    def get_plan(self, serializer_class):
+        """取得計画を取得する。
+
+        :param serializer_class: ModelSerializerのクラス
+        :return: QueryPlan。モデルのないシリアライザーの場合はNone
+        """
+        plan = self._plans.get(serializer_class)
+        if plan is None:
+            plan = self.build_plan(serializer_class)
+            with self._lock:
+                self._plans[serializer_class] = plan
+        return plan or None
+
+    def build_plan(self, serializer_class):
+        meta = getattr(serializer_class, 'Meta', None)
+        model = getattr(meta, 'model', None)
+        if model is None:
+            return False
+        plan = QueryPlan(model)
+        self.add_serializer(plan, serializer_class(), [], '')
+        return plan
+
+    def add_serializer(self, plan, serializer, prefix, name_prefix):
+        for field_name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            name = name_prefix + field_name
+            if isinstance(field, SerializerMethodField):
+                method = getattr(serializer, field.method_name or 'get_' + field_name, None)
+                for hint in getattr(method, 'related_fields', ()):
+                    plan.add(name, prefix + hint.replace('.', '__').split('__'))
+                continue
+            if field.source == '*':
+                continue
+            attrs = prefix + list(field.source_attrs)
+            if isinstance(field, BaseSerializer):
+                child = field.child if isinstance(field, ListSerializer) else field
+                plan.add(name, attrs)
+                self.add_serializer(plan, child, attrs, name + '.')
+            elif isinstance(field, ManyRelatedField):
+                plan.add(name, attrs)
+            elif isinstance(field, RelatedField) and not field.use_pk_only_optimization():
+                plan.add(name, attrs)
+            else:
+                # 最後の属性は値なので、その手前までが関連オブジェクトになる。
+                # 外部キーの主キーだけの場合は、外部キーの値を使うのでクエリは発生しない。
+                plan.add(name, attrs[:-1])
+
+    def clear(self):
+        with self._lock:
+            self._plans = dict()
+
+
+query_planner = QueryPlanner()
@@ -1,32 +1,62 @@
+import base64
+import binascii
 import datetime
+import hashlib
+import json
+import logging
+import operator
+import threading
 from collections import OrderedDict
 
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
 from django.db.models.deletion import ProtectedError
 from django.utils import timezone
 
 from rest_framework import status as rest_status
+from rest_framework.decorators import action
 from rest_framework.fields import SkipField
 from rest_framework.views import APIView
 from rest_framework.viewsets import GenericViewSet
 from rest_framework.mixins import ListModelMixin, \
     RetrieveModelMixin, CreateModelMixin, UpdateModelMixin, DestroyModelMixin
-from rest_framework.serializers import DateTimeField, ModelSerializer
+from rest_framework.serializers import (
+    BaseSerializer, DateTimeField, ListSerializer, ModelSerializer, SerializerMethodField,
+)
 from rest_framework.pagination import LimitOffsetPagination
-from rest_framework.relations import PKOnlyObject
+from rest_framework.relations import ManyRelatedField, PKOnlyObject, RelatedField
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.views import exception_handler
 
-from utils import constants
+from utils import common, constants
 from utils.errors import CustomException
 from utils.meta_data import BaseModelMetadata
+from utils.query_plan import query_planner
+
+logger = common.get_system_logger()
 
 
 class BaseModelSerializer(ModelSerializer):
+    # many=True の一覧の場合、事前に作成した行プランで出力する。
+    use_row_plan = True
+
+    _row_plan_specs = dict()
 
     def to_representation(self, instance):
         """
         Object instance -> Dict of primitive datatypes.
         """
+        if self.use_row_plan and isinstance(self.parent, ListSerializer):
+            return self.to_representation_by_plan(instance)
+        else:
+            return self.to_representation_by_fields(instance)
+
+    def to_representation_by_fields(self, instance):
         ret = OrderedDict()
         fields = self._readable_fields
 
@@ -53,6 +83,94 @@ class BaseModelSerializer(ModelSerializer):
 
         return ret
 
+    def to_representation_by_plan(self, instance):
+        """行プランで出力する。
+
+        結果は to_representation_by_fields() と同じ。
+        """
+        ret = OrderedDict()
+        tz = None
+        for field_name, getter, get_attribute, to_representation, is_related, is_datetime in self.get_row_plan():
+            if getter is not None:
+                try:
+                    attribute = getter(instance)
+                except AttributeError:
+                    try:
+                        attribute = get_attribute(instance)
+                    except SkipField:
+                        continue
+            else:
+                try:
+                    attribute = get_attribute(instance)
+                except SkipField:
+                    continue
+
+            if attribute is None or (is_related and isinstance(attribute, PKOnlyObject) and attribute.pk is None):
+                ret[field_name] = None
+            elif is_datetime and isinstance(attribute, datetime.datetime):
+                if tz is None:
+                    tz = timezone.get_current_timezone()
+                ret[field_name] = timezone.localtime(attribute, tz).strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                ret[field_name] = to_representation(attribute)
+        return ret
+
+    def get_row_plan(self):
+        """行プランを取得する。
+
+        項目ごとに、値の取得方法（モデルの単純な項目の場合は attrgetter）、
+        関連項目かどうか、日時項目かどうかをシリアライザーのクラス単位で一度だけ判定し、
+        このシリアライザーの項目にバインドしたものを返す。
+
+        :return:
+        """
+        plan = self.__dict__.get('_row_plan')
+        if plan is None:
+            fields = list(self._readable_fields)
+            key = (self.__class__, tuple((field.field_name, field.source, field.__class__) for field in fields))
+            specs = self._row_plan_specs.get(key)
+            if specs is None:
+                specs = [(
+                    self.get_plain_attribute_name(field),
+                    isinstance(field, RelatedField),
+                    isinstance(field, DateTimeField),
+                ) for field in fields]
+                self._row_plan_specs[key] = specs
+            plan = [
+                (
+                    field.field_name,
+                    operator.attrgetter(attr_name) if attr_name else None,
+                    field.get_attribute,
+                    field.to_representation,
+                    is_related,
+                    is_datetime,
+                )
+                for field, (attr_name, is_related, is_datetime) in zip(fields, specs)
+            ]
+            self._row_plan = plan
+        return plan
+
+    def get_plain_attribute_name(self, field):
+        """モデルの単純な項目（リレーションではないＤＢ項目）を参照する場合、その属性名を返す
+
+        :param field:
+        :return:
+        """
+        if isinstance(field, (BaseSerializer, RelatedField, ManyRelatedField, SerializerMethodField)):
+            return None
+        if field.source == '*' or len(field.source_attrs) != 1:
+            return None
+        model = getattr(getattr(self, 'Meta', None), 'model', None)
+        if model is None:
+            return None
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            return None
+        if not model_field.concrete or model_field.is_relation or model_field.attname != field.source:
+            return None
+        return field.source
+
 
 class MyLimitOffsetPagination(LimitOffsetPagination):
 
@@ -66,6 +184,283 @@ class MyLimitOffsetPagination(LimitOffsetPagination):
         ]))
 
 
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """カーソルのキーの値をJSONに変換する。
+
+    DjangoJSONEncoder は日時をミリ秒までに切り捨てるので、同じミリ秒内の行が飛ばされないように
+    マイクロ秒まで出力する。
+    """
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super(CursorJSONEncoder, self).default(o)
+
+
+class KeysetPagination(MyLimitOffsetPagination):
+    """キーセット（カーソル）方式のページング
+
+    前のページの最後の行の並び順のキーを条件にして次のページを取得するので、
+    OFFSETのように後ろのページほど遅くなることはない。
+    並び順の最後には一意なキー（なければpk）を追加し、順番が一意になるようにする。
+    外部キーで並び替える場合は、外部キーの値（xxx_id）で並び替える。
+    NULLはMySQLと同様に最小値として扱う。
+
+    返すデータの形式は MyLimitOffsetPagination と同じで、
+    offset が指定された場合は従来通り MyLimitOffsetPagination としてページングする。
+
+    件数（count）の取得方法は count_mode で指定する。リクエストのパラメーター
+    count_mode でも変更できる。
+
+    * exact: 毎回 COUNT(*) で数える
+    * cached: COUNT(*) の結果を count_cache_timeout 秒間キャッシュする
+    * estimated: MySQLの実行計画の見積もり件数（MySQL以外の場合は exact）
+    * none: 件数を数えない（countはNone）
+    """
+    cursor_query_param = 'cursor'
+    count_mode_query_param = 'count_mode'
+    count_mode = 'cached'
+    count_modes = ('exact', 'cached', 'estimated', 'none')
+    count_cache_timeout = 60
+
+    def __init__(self):
+        self.use_offset = False
+        self.ordering = []
+        self.next_values = None
+        self.previous_values = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.offset_query_param in request.query_params:
+            self.use_offset = True
+            return super(KeysetPagination, self).paginate_queryset(queryset, request, view)
+
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.request = request
+        self.count = self.get_count_by_mode(queryset, request)
+        self.ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request)
+        reverse = cursor is not None and cursor['reverse']
+
+        queryset = queryset.order_by(*[
+            ('-' if descending != reverse else '') + name for name, descending in self.ordering
+        ])
+        if cursor is not None:
+            queryset = queryset.filter(self.get_keyset_filter(cursor['values'], reverse))
+        results = list(queryset[:self.limit + 1])
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if reverse:
+            results.reverse()
+            has_next, has_previous = True, has_more
+        else:
+            has_next, has_previous = has_more, cursor is not None
+
+        self.next_values = self.get_key_values(results[-1]) if results and has_next else None
+        self.previous_values = self.get_key_values(results[0]) if results and has_previous else None
+        return results
+
+    def get_ordering(self, queryset):
+        """並び順のフィールドを取得する。
+
+        :param queryset:
+        :return: (フィールド名, 降順かどうか) のリスト
+        """
+        model = queryset.model
+        ordering = []
+        for item in queryset.query.order_by or model._meta.ordering:
+            if not isinstance(item, str) or item == '?':
+                continue
+            descending = item.startswith('-')
+            name, unique = self.resolve_field(model, item.lstrip('-'))
+            ordering.append((name, descending))
+            if unique:
+                return ordering
+        ordering.append(('pk', False))
+        return ordering
+
+    @staticmethod
+    def resolve_field(model, name):
+        """並び順のフィールド名を解決する。
+
+        :param model:
+        :param name: フィールド名（__ 区切り）
+        :return: フィールド名と一意かどうか
+        """
+        if name == 'pk':
+            return name, True
+        opts = model._meta
+        parts = name.split('__')
+        field = None
+        for i, part in enumerate(parts):
+            field = opts.get_field(part)
+            if field.is_relation and i < len(parts) - 1:
+                opts = field.related_model._meta
+        if field.is_relation:
+            parts[-1] = field.attname
+        unique = len(parts) == 1 and field.unique and not field.null
+        return '__'.join(parts), unique
+
+    def get_key_values(self, instance):
+        values = []
+        for name, descending in self.ordering:
+            value = instance
+            for part in name.split('__'):
+                value = getattr(value, part) if value is not None else None
+            values.append(value)
+        return values
+
+    def get_keyset_filter(self, values, reverse):
+        """カーソルの位置より後ろの行を取得する条件を作成する。
+
+        (a, b) の昇順の場合、 a > x OR (a = x AND b > y) となる。
+
+        :param values: カーソルの位置のキーの値
+        :param reverse: 前のページを取得する場合はTrue
+        :return:
+        """
+        if len(values) != len(self.ordering):
+            raise CustomException(constants.ERROR_INVALID_CURSOR)
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            if descending != reverse:
+                # 降順の場合、NULLは最後になる。
+                after = Q(**{name + '__lt': value}) | Q(**{name + '__isnull': True}) if value is not None else None
+            else:
+                after = Q(**{name + '__gt': value}) if value is not None else Q(**{name + '__isnull': False})
+            if after is not None:
+                condition |= equal & after
+            equal &= Q(**{name: value}) if value is not None else Q(**{name + '__isnull': True})
+        return condition
+
+    def get_count_by_mode(self, queryset, request):
+        count_mode = request.query_params.get(self.count_mode_query_param)
+        if count_mode not in self.count_modes:
+            count_mode = self.count_mode
+
+        if count_mode == 'none':
+            return None
+        elif count_mode == 'cached':
+            sql = str(queryset.query)
+            key = 'keyset_count:{}'.format(hashlib.md5(sql.encode('utf-8')).hexdigest())
+            count = cache.get(key)
+            if count is None:
+                count = queryset.count()
+                cache.set(key, count, self.count_cache_timeout)
+            return count
+        elif count_mode == 'estimated':
+            connection = connections[queryset.db]
+            if connection.vendor == 'mysql':
+                sql, params = queryset.query.sql_with_params()
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN ' + sql, params)
+                    rows = [row.get('rows') or 0 for row in common.dictfetchall(cursor)]
+                return max(rows) if rows else 0
+        return queryset.count()
+
+    def encode_cursor(self, values, reverse):
+        data = json.dumps({'v': values, 'r': 1 if reverse else 0}, cls=CursorJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            return {'values': list(data['v']), 'reverse': bool(data['r'])}
+        except (TypeError, ValueError, KeyError, UnicodeError, binascii.Error):
+            raise CustomException(constants.ERROR_INVALID_CURSOR)
+
+    def get_cursor_link(self, values, reverse):
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(values, reverse))
+
+    def get_next_link(self):
+        if self.use_offset:
+            return super(KeysetPagination, self).get_next_link()
+        if self.next_values is None:
+            return None
+        return self.get_cursor_link(self.next_values, False)
+
+    def get_previous_link(self):
+        if self.use_offset:
+            return super(KeysetPagination, self).get_previous_link()
+        if self.previous_values is None:
+            return None
+        return self.get_cursor_link(self.previous_values, True)
+
+    def get_html_context(self):
+        if self.use_offset:
+            return super(KeysetPagination, self).get_html_context()
+        return {'previous_url': self.get_previous_link(), 'next_url': self.get_next_link()}
+
+
+class ListSchemaCache(object):
+    """一覧のスキーマ（columnsとfieldsets）のキャッシュ
+
+    スキーマはビュークラス、シリアライザー、表示項目とユーザーの権限だけで決まるので、
+    一度作成したらプロセス内で再利用する。スキーマの内容からハッシュ値（バージョン）を算出し、
+    クライアントはバージョンが変わった時だけスキーマを取得しなおせばいい。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._schemas = dict()
+
+    @staticmethod
+    def get_key(request, view):
+        user = request.user
+        if user.is_superuser:
+            perms = ('__all__',)
+        elif user.is_authenticated:
+            perms = tuple(sorted(user.get_all_permissions()))
+        else:
+            perms = ()
+        return (
+            view.__class__,
+            view.metadata_class,
+            view.get_serializer_class(),
+            tuple(view.get_list_display()),
+            tuple(view.get_list_display_links()),
+            perms,
+        )
+
+    def get(self, request, view):
+        """スキーマを取得する。
+
+        :param request:
+        :param view:
+        :return: バージョン、columns、fieldsetsを持つ辞書
+        """
+        key = self.get_key(request, view)
+        schema = self._schemas.get(key)
+        if schema is None:
+            data = view.metadata_class().determine_metadata(request, view)
+            columns = data.get('columns', list()) if data else list()
+            fieldsets = data.get('fieldsets', list()) if data else list()
+            content = json.dumps([columns, fieldsets], cls=JSONEncoder, sort_keys=True, ensure_ascii=False)
+            schema = {
+                'version': hashlib.sha1(content.encode('utf-8')).hexdigest(),
+                'columns': columns,
+                'fieldsets': fieldsets,
+            }
+            with self._lock:
+                self._schemas[key] = schema
+        return schema
+
+    def clear(self):
+        with self._lock:
+            self._schemas = dict()
+
+
+list_schema_cache = ListSchemaCache()
+
+
 class BaseListModelMixin(ListModelMixin):
     list_display = ()
     list_display_links = ()
@@ -87,18 +482,26 @@ class BaseListModelMixin(ListModelMixin):
         schema = request.GET.get('schema', '1') or '1'
         if schema == '1':
             queryset = self.filter_queryset(self.get_queryset())
-            data = self.metadata_class().determine_metadata(request, self)
-            columns = data.get('columns', list()) if data else list()
-            fieldsets = data.get('fieldsets', list()) if data else list()
+            list_schema = list_schema_cache.get(request, self)
+            # クライアントが持っているスキーマが最新の場合、スキーマのバージョンだけを返す。
+            if request.GET.get('schema_version') == list_schema['version']:
+                columns = list()
+                fieldsets = list()
+            else:
+                columns = list_schema['columns']
+                fieldsets = list_schema['fieldsets']
 
             page = self.paginate_queryset(queryset)
             if page is not None:
                 serializer = self.get_serializer(page, many=True)
-                return self.get_paginated_response(serializer.data, columns)
+                response = self.get_paginated_response(serializer.data, columns)
+                response.data['schema_version'] = list_schema['version']
+                return response
 
             serializer = self.get_serializer(queryset, many=True)
             return Response(OrderedDict([
                 ('count', queryset.count()),
+                ('schema_version', list_schema['version']),
                 ('columns', columns),
                 ('fieldsets', fieldsets),
                 ('results', serializer.data),
@@ -106,6 +509,21 @@ class BaseListModelMixin(ListModelMixin):
         else:
             return super(BaseListModelMixin, self).list(request, *args, **kwargs)
 
+    @action(methods=['get'], url_path='schema', detail=False)
+    def list_schema(self, request, *args, **kwargs):
+        """一覧のスキーマを取得する。
+
+        ETagにスキーマのバージョンを設定し、If-None-Matchが一致する場合は304を返す。
+        """
+        list_schema = list_schema_cache.get(request, self)
+        etag = '"{}"'.format(list_schema['version'])
+        if etag in [tag.strip() for tag in request.META.get('HTTP_IF_NONE_MATCH', '').split(',')]:
+            response = Response(status=rest_status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(list_schema)
+        response['ETag'] = etag
+        return response
+
 
 class BaseRetrieveModelMixin(RetrieveModelMixin):
     choice_classes = {}
@@ -155,7 +573,30 @@ class BaseModelSchemaView(object):
         pass
 
 
-class BaseReadOnlyModelViewSet(BaseRetrieveModelMixin,
+class QueryPlanMixin(object):
+    """シリアライザーの参照する関連オブジェクトを一括で取得する
+
+    get_queryset() の結果に、シリアライザーから作成した select_related / prefetch_related
+    を自動的に適用する。使わない場合は use_query_plan = False にする。
+    """
+    use_query_plan = True
+
+    def get_query_plan(self):
+        return query_planner.get_plan(self.get_serializer_class())
+
+    def filter_queryset(self, queryset):
+        queryset = super(QueryPlanMixin, self).filter_queryset(queryset)
+        if self.use_query_plan:
+            plan = self.get_query_plan()
+            if plan is not None:
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug('%s query plan:\n%s', self.__class__.__name__, plan.report())
+                queryset = plan.apply(queryset)
+        return queryset
+
+
+class BaseReadOnlyModelViewSet(QueryPlanMixin,
+                               BaseRetrieveModelMixin,
                                BaseListModelMixin,
                                GenericViewSet):
     pagination_class = MyLimitOffsetPagination
@@ -166,7 +607,8 @@ class BaseReadOnlyModelViewSet(BaseRetrieveModelMixin,
         return self.paginator.get_paginated_response(data, columns)
 
 
-class BaseModelViewSet(CreateModelMixin,
+class BaseModelViewSet(QueryPlanMixin,
+                       CreateModelMixin,
                        BaseRetrieveModelMixin,
                        UpdateModelMixin,
                        BaseDestroyModelMixin,
@@ -0,0 +1,536 @@
+"""横断検索
+
+案件、顧客、協力会社、銀行、メンバーなどの名前を１つのＡＰＩで検索する。
+検索対象（SearchTarget）は各アプリの search.py で register() し、
+検索方法（バックエンド）は SEARCH_BACKEND で切り替える。
+
+- utils.search_service.MemoryBackend（既定値）:
+  プロセスのメモリにN-gramのインデックスを作成する（utils.ngram_index）。
+- utils.search_service.MysqlFulltextBackend:
+  MySQLのFULLTEXTインデックス（ngramパーサー）で検索する。
+  data/SQL/114.search_fulltext_index.sql でインデックスを作成しておく必要がある。
+
+どちらのバックエンドも、空白で区切ったキーワードは全てを含むデータを一致度の高い順に返す。
+ただし、一致する範囲はバックエンドによって異なる。
+
+- MemoryBackend はデータとキーワードを同じように正規化するので、全角・半角、大文字・小文字、
+  カタカナ・ひらがなの違いと中黒などの区切り文字を無視する。姓名を続けた文字列など、
+  get_texts で追加した文字列でも検索できる。
+- MysqlFulltextBackend はキーワードをNFKCで統一し、カタカナとひらがなの両方の表記で検索する。
+  データ側の違い（半角カナ、区切り文字など）はMySQLの照合順序に依存し、
+  FULLTEXTインデックスの項目にない文字列（get_texts で追加した姓名の連結など）では検索できない。
+"""
+import datetime
+import os
+import threading
+import time
+import unicodedata
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from utils import common, procedure_cache
+from utils.master_cache import master_cache
+from utils.ngram_index import NgramIndex, normalize, split_keyword, to_hiragana, to_katakana
+
+logger = common.get_system_logger()
+
+_targets = dict()
+
+# 検索対象が登録された時に送信する（master.signals で対象のモデルの変更を受け取る）。
+target_registered = Signal(providing_args=['target'])
+
+
+class SearchTarget(object):
+    """検索対象の定義
+
+    使用例::
+
+        register(SearchTarget('project', 'project.Project', ('name', 'customer__name', 'customer__kana')))
+
+    :param name: 検索対象の名前（検索結果の type）
+    :param model: モデルのラベル（app_label.ModelName）
+    :param fields: 検索する項目、関連先の項目は「外部キー__項目」で指定する（１階層まで）
+    :param get_texts: 項目の値の辞書から検索する文字列のリストを取得する関数、省略時は fields の値
+    :param get_label: 項目の値の辞書から表示名を取得する関数、省略時は fields の最初の値
+    """
+
+    def __init__(self, name, model, fields, get_texts=None, get_label=None):
+        self.name = name
+        self.model_label = model
+        self.fields = tuple(fields)
+        self._get_texts = get_texts
+        self._get_label = get_label
+
+    @cached_property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @cached_property
+    def verbose_name(self):
+        return str(self.model._meta.verbose_name)
+
+    @cached_property
+    def related(self):
+        """関連先の外部キーとモデルの辞書"""
+        related = dict()
+        for field_name in self.fields:
+            if '__' in field_name:
+                fk_name = field_name.split('__')[0]
+                related[fk_name] = self.model._meta.get_field(fk_name).related_model
+        return related
+
+    @cached_property
+    def tables(self):
+        return (self.model._meta.db_table,) + tuple(sorted(set(m._meta.db_table for m in self.related.values())))
+
+    def get_texts(self, values):
+        if self._get_texts:
+            return self._get_texts(values)
+        return [values.get(field_name) for field_name in self.fields]
+
+    def get_label(self, values):
+        if self._get_label:
+            return self._get_label(values)
+        return values.get(self.fields[0])
+
+    def get_values(self, queryset):
+        """検索する項目の値を取得する。
+
+        :param queryset: 対象モデルのクエリセット
+        :return: 項目の値の辞書のイテレーター
+        """
+        return queryset.values('pk', 'is_deleted', *self.fields).iterator()
+
+
+def register(target):
+    """検索対象を登録する。
+
+    各アプリの ready() で呼び出すので、参照するテーブルもここで登録する。
+
+    :param target: SearchTarget
+    :return:
+    """
+    procedure_cache.track_tables(*target.tables)
+    _targets[target.name] = target
+    target_registered.send(sender=SearchTarget, target=target)
+    return target
+
+
+def get_target(name):
+    return _targets.get(name)
+
+
+def get_targets(names=None):
+    """検索対象を取得する。
+
+    :param names: 検索対象の名前のリスト、省略時は全て
+    :return:
+    """
+    if not names:
+        return list(_targets.values())
+    return [_targets[name] for name in names if name in _targets]
+
+
+class BaseBackend(object):
+    """検索のバックエンド"""
+
+    def search(self, target, keyword, limit=None):
+        """検索する。
+
+        :param target: SearchTarget
+        :param keyword: 検索キーワード
+        :param limit: 最大件数、省略時は全て
+        :return: 一致度の高い順の (主キー, 一致度, 表示名) のリスト
+        """
+        raise NotImplementedError
+
+    def instance_changed(self, model, pk, deleted=False):
+        """データが保存または削除されたら、コミット後に呼ばれる。
+
+        :param model: モデル
+        :param pk: 主キー
+        :param deleted: 物理削除の場合はTrue
+        :return:
+        """
+        pass
+
+
+class TargetIndex(object):
+    """検索対象ごとのN-gramインデックス
+
+    初回の検索時に全てのデータを読み込み、その後はテーブル（関連先を含む）のバージョンが変わった場合か
+    SEARCH_INDEX_SYNC_INTERVAL 秒（既定値は30秒）ごとに、前回以降に更新・削除されたデータだけを読み込む。
+    物理削除に備えて、SEARCH_INDEX_REBUILD_INTERVAL 秒（既定値は3600秒）ごとに作り直す。
+    """
+
+    # サーバー間の時刻のずれを考慮して、前回の読み込みより少し前から読み込む。
+    SYNC_MARGIN = 60
+
+    def __init__(self, target, sync_interval=None, rebuild_interval=None):
+        self.target = target
+        self.sync_interval = sync_interval or getattr(settings, 'SEARCH_INDEX_SYNC_INTERVAL', 30)
+        self.rebuild_interval = rebuild_interval or getattr(settings, 'SEARCH_INDEX_REBUILD_INTERVAL', 3600)
+        self._lock = threading.Lock()
+        self._index = NgramIndex()
+        self._labels = dict()
+        self._pid = None
+        self._built = 0
+        self._synced = 0
+        self._versions = None
+
+    def _load(self, index, labels, queryset):
+        count = 0
+        for values in self.target.get_values(queryset):
+            if values['is_deleted']:
+                index.remove(values['pk'])
+                labels.pop(values['pk'], None)
+            else:
+                index.add(values['pk'], self.target.get_texts(values))
+                labels[values['pk']] = self.target.get_label(values)
+            count += 1
+        return count
+
+    def rebuild(self):
+        """全てのデータを読み込みなおす。
+
+        作成中も以前のインデックスで検索できるように、新しいインデックスを作成してから置き換える。
+
+        :return:
+        """
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        started = time.time()
+        versions = master_cache.get_versions(self.target.tables)
+        index = NgramIndex()
+        labels = dict()
+        count = self._load(index, labels, self.target.model.objects.all())
+        self._index = index
+        self._labels = labels
+        self._versions = versions
+        self._pid = os.getpid()
+        self._built = self._synced = started
+        logger.info('search index built: %s %s rows' % (self.target.name, count))
+
+    def sync(self):
+        """前回以降に更新または削除されたデータ（関連先の変更を含む）を読み込む。
+
+        :return:
+        """
+        with self._lock:
+            self._sync()
+
+    def _sync(self):
+        started = time.time()
+        versions = master_cache.get_versions(self.target.tables)
+        since = datetime.datetime.fromtimestamp(self._synced - self.SYNC_MARGIN, timezone.utc)
+        condition = Q(updated_dt__gte=since) | Q(deleted_dt__gte=since)
+        for fk_name in self.target.related:
+            condition |= Q(**{fk_name + '__updated_dt__gte': since})
+        self._load(self._index, self._labels, self.target.model._base_manager.filter(condition))
+        self._versions = versions
+        self._synced = started
+
+    def is_built(self):
+        return self._pid == os.getpid()
+
+    def needs_rebuild(self):
+        return not self.is_built() or self._built + self.rebuild_interval <= time.time()
+
+    def needs_sync(self):
+        return self._synced + self.sync_interval <= time.time() \
+            or master_cache.get_versions(self.target.tables) != self._versions
+
+    def refresh(self):
+        """必要に応じてインデックスを作成または更新する。
+
+        作成または更新するかどうかはロックを取得してから判断するので、同時に検索しても一度しか読み込まない。
+        インデックスが作成済みで、他のスレッドが読み込み中の場合は、待たないで以前のインデックスで検索する。
+
+        :return:
+        """
+        if not self.needs_rebuild() and not self.needs_sync():
+            return
+        if self.is_built():
+            if not self._lock.acquire(blocking=False):
+                return
+        else:
+            self._lock.acquire()
+        try:
+            if self.needs_rebuild():
+                self._rebuild()
+            elif self.needs_sync():
+                self._sync()
+        finally:
+            self._lock.release()
+
+    def search(self, keyword, limit=None):
+        self.refresh()
+        labels = self._labels
+        return [(pk, score, labels.get(pk)) for pk, score in self._index.rank(keyword, limit)]
+
+    def reload(self, queryset):
+        """指定したデータを読み込みなおす。インデックスがまだ作成されていない場合は何もしない。
+
+        :param queryset: 対象モデルのクエリセット（削除済みを含む）
+        :return:
+        """
+        if self._pid == os.getpid():
+            self._load(self._index, self._labels, queryset)
+
+    def remove(self, pk):
+        if self._pid == os.getpid():
+            self._index.remove(pk)
+            self._labels.pop(pk, None)
+
+
+class MemoryBackend(BaseBackend):
+    """プロセスのメモリのN-gramインデックスで検索する。
+
+    このプロセスで保存・削除したデータはコミット後にすぐ反映する。
+    他のプロセスの変更はテーブルのバージョンが変わった時（共有のキャッシュを使う場合）か、
+    SEARCH_INDEX_SYNC_INTERVAL 秒ごとに反映する。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = dict()
+
+    def get_index(self, target):
+        index = self._indexes.get(target.name)
+        if index is None:
+            with self._lock:
+                index = self._indexes.get(target.name)
+                if index is None:
+                    index = self._indexes[target.name] = TargetIndex(target)
+        return index
+
+    def search(self, target, keyword, limit=None):
+        return self.get_index(target).search(keyword, limit)
+
+    def instance_changed(self, model, pk, deleted=False):
+        for target in get_targets():
+            index = self._indexes.get(target.name)
+            if index is None:
+                continue
+            if target.model is model:
+                if deleted:
+                    index.remove(pk)
+                else:
+                    index.reload(target.model._base_manager.filter(pk=pk))
+            for fk_name, related_model in target.related.items():
+                if related_model is model and not deleted:
+                    # 関連先の名前が変わった場合、参照しているデータの検索文字列も変わる。
+                    index.reload(target.model._base_manager.filter(**{fk_name: pk}))
+
+
+class MysqlFulltextBackend(BaseBackend):
+    """MySQLのFULLTEXTインデックス（ngramパーサー）で検索する。
+
+    キーワードのトークンごとに、対象テーブルと関連先テーブルの MATCH ... AGAINST を OR でつなぎ、
+    トークン同士は AND で検索する。ngram_token_size（既定値は２）より短いトークンは LIKE で検索する。
+    トークンはNFKCで統一するだけで、カタカナとひらがなの両方の表記を OR で検索する。
+    取得したデータはPythonで正規化して一致度を計算しなおす。
+    MATCHする項目は、FULLTEXTインデックスの項目と同じでなければならない。
+    """
+
+    TOKEN_SIZE = 2
+
+    def __init__(self):
+        self.candidate_limit = getattr(settings, 'SEARCH_CANDIDATE_LIMIT', 500)
+
+    @staticmethod
+    def quote_name(name):
+        return connection.ops.quote_name(name)
+
+    def get_columns(self, model, field_names):
+        return ', '.join(self.quote_name(model._meta.get_field(name).column) for name in field_names)
+
+    @staticmethod
+    def get_tokens(keyword):
+        """検索キーワードを空白で分割して、NFKCで統一する。
+
+        ひらがな・小文字には変換しないので、データの表記のままMySQLで検索できる。
+
+        :param keyword: 検索キーワード
+        :return: トークンのリスト
+        """
+        tokens = []
+        normalized = []
+        for word in unicodedata.normalize('NFKC', str(keyword or '')).split():
+            token = normalize(word)
+            if token and token not in normalized:
+                normalized.append(token)
+                tokens.append(word)
+        return tokens
+
+    @staticmethod
+    def get_variants(token):
+        """トークンのカタカナとひらがなの表記を取得する。
+
+        :param token: トークン
+        :return: 重複しない表記のリスト
+        """
+        variants = []
+        for variant in (token, to_katakana(token), to_hiragana(token)):
+            if variant not in variants:
+                variants.append(variant)
+        return variants
+
+    def get_token_condition(self, target, token):
+        """１つのトークンの検索条件を作成する。
+
+        :param target: SearchTarget
+        :param token: NFKCで統一したトークン（get_tokens）
+        :return: (SQL, パラメーター)
+        """
+        variants = self.get_variants(token)
+        likes = ['%' + variant + '%' for variant in variants]
+        against = ' '.join('"{}"'.format(variant.replace('"', '')) for variant in variants)
+        own_fields = [name for name in target.fields if '__' not in name]
+        related_fields = dict()
+        for name in target.fields:
+            if '__' in name:
+                fk_name, field_name = name.split('__', 1)
+                related_fields.setdefault(fk_name, []).append(field_name)
+        table = self.quote_name(target.model._meta.db_table)
+        conditions = []
+        params = []
+        if len(token) < self.TOKEN_SIZE:
+            for name in own_fields:
+                column = '{}.{}'.format(table, self.quote_name(target.model._meta.get_field(name).column))
+                conditions.extend('{} like %s'.format(column) for like in likes)
+                params.extend(likes)
+        elif own_fields:
+            conditions.append('match ({}) against (%s in boolean mode)'.format(', '.join(
+                '{}.{}'.format(table, self.quote_name(target.model._meta.get_field(name).column)) for name in own_fields
+            )))
+            params.append(against)
+        for fk_name, field_names in related_fields.items():
+            fk = target.model._meta.get_field(fk_name)
+            related_model = fk.related_model
+            if len(token) < self.TOKEN_SIZE:
+                where = ' or '.join('{} like %s'.format(self.quote_name(
+                    related_model._meta.get_field(name).column
+                )) for name in field_names for like in likes)
+                params.extend(likes * len(field_names))
+            else:
+                where = 'match ({}) against (%s in boolean mode)'.format(self.get_columns(related_model, field_names))
+                params.append(against)
+            conditions.append('{}.{} in (select {} from {} where {})'.format(
+                table, self.quote_name(fk.column), self.quote_name(related_model._meta.pk.column),
+                self.quote_name(related_model._meta.db_table), where,
+            ))
+        return '(' + ' or '.join(conditions) + ')', params
+
+    def search(self, target, keyword, limit=None):
+        tokens = split_keyword(keyword)
+        if not tokens:
+            return []
+        queryset = target.model.objects.all()
+        for token in self.get_tokens(keyword):
+            sql, params = self.get_token_condition(target, token)
+            queryset = queryset.extra(where=[sql], params=params)
+        ranked = []
+        for values in target.get_values(queryset[:self.candidate_limit]):
+            terms = [term for term in (normalize(text) for text in target.get_texts(values)) if term]
+            total = sum(NgramIndex.get_score(token, terms) for token in tokens)
+            # 照合順序だけで一致したデータは部分一致とみなす。
+            score = max(total, len(tokens)) / (3.0 * len(tokens))
+            ranked.append((-score, min(len(term) for term in terms) if terms else 0, values['pk'], values))
+        ranked.sort(key=lambda r: r[:2])
+        if limit:
+            ranked = ranked[:limit]
+        return [(pk, -score, target.get_label(values)) for score, length, pk, values in ranked]
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """SEARCH_BACKEND で指定したバックエンドを取得する。
+
+    :return:
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'SEARCH_BACKEND', 'utils.search_service.MemoryBackend')
+                _backend = import_string(path)()
+    return _backend
+
+
+def search(keyword, types=None, limit=20):
+    """横断検索する。
+
+    :param keyword: 検索キーワード
+    :param types: 検索対象の名前のリスト、省略時は全て
+    :param limit: 検索対象ごとの最大件数
+    :return: 一致度の高い順の検索結果（type、type_name、id、label、score の辞書）のリスト
+    """
+    if not split_keyword(keyword):
+        return []
+    backend = get_backend()
+    hits = []
+    for target in get_targets(types):
+        for pk, score, label in backend.search(target, keyword, limit):
+            hits.append({
+                'type': target.name,
+                'type_name': target.verbose_name,
+                'id': pk,
+                'label': label,
+                'score': round(score, 3),
+            })
+    hits.sort(key=lambda h: -h['score'])
+    return hits
+
+
+def search_ids(name, keyword, limit=None):
+    """検索対象の主キーを一致度の高い順に取得する。
+
+    :param name: 検索対象の名前
+    :param keyword: 検索キーワード
+    :param limit: 最大件数、省略時は全て
+    :return: 主キーのリスト
+    """
+    target = _targets[name]
+    return [pk for pk, score, label in get_backend().search(target, keyword, limit)]
+
+
+def filter_queryset(queryset, name, keyword):
+    """クエリセットをキーワードで絞り込む。並び順はクエリセットのまま。
+
+    :param queryset: 検索対象のモデルのクエリセット
+    :param name: 検索対象の名前
+    :param keyword: 検索キーワード
+    :return:
+    """
+    if not split_keyword(keyword):
+        return queryset
+    return queryset.filter(pk__in=search_ids(name, keyword))
+
+
+def instance_changed(instance, deleted=False):
+    """データが保存または削除されたら、コミット後にバックエンドに通知する。
+
+    :param instance: モデルのインスタンス
+    :param deleted: 物理削除の場合はTrue
+    :return:
+    """
+    model = instance._meta.concrete_model
+    if not any(t.model is model or model in t.related.values() for t in get_targets()):
+        return
+    backend = get_backend()
+    # 削除後は主キーが None になるので、先に取得しておく。
+    pk = instance.pk
+    transaction.on_commit(lambda: backend.instance_changed(model, pk, deleted))
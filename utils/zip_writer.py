@@ -0,0 +1,195 @@
+import binascii
+import os
+import struct
+import time
+import zipfile
+import zlib
+
+CHUNK_SIZE = 64 * 1024
+
+# ZipCrypto（PKWARE の従来の暗号化）で使うCRC32のテーブル
+CRC_TABLE = []
+for _n in range(256):
+    _c = _n
+    for _k in range(8):
+        _c = (_c >> 1) ^ 0xEDB88320 if _c & 1 else _c >> 1
+    CRC_TABLE.append(_c)
+del _n, _c, _k
+# 鍵（key2の下位16ビット）から暗号化に使うバイトを計算したテーブル
+STREAM_TABLE = bytes(((((_t | 2) * ((_t | 2) ^ 1)) >> 8) & 0xFF) for _t in range(0x10000))
+
+
+class ZipCrypto(object):
+    """PKWARE の従来の暗号化（ZipCrypto）
+
+    Windows のエクスプローラーでも解凍できる暗号化方式。
+    """
+
+    def __init__(self, password):
+        self.key0 = 0x12345678
+        self.key1 = 0x23456789
+        self.key2 = 0x34567890
+        for c in password:
+            self.update_keys(c)
+
+    def update_keys(self, c):
+        self.key0 = (self.key0 >> 8) ^ CRC_TABLE[(self.key0 ^ c) & 0xFF]
+        self.key1 = ((self.key1 + (self.key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+        self.key2 = (self.key2 >> 8) ^ CRC_TABLE[(self.key2 ^ (self.key1 >> 24)) & 0xFF]
+
+    def encrypt(self, data):
+        """データを暗号化する。
+
+        １バイトずつ鍵を更新するので、メソッドの呼び出しを避けてローカル変数とテーブルで計算する。
+
+        :param data: bytes
+        :return: 暗号化したbytes
+        """
+        table = CRC_TABLE
+        stream = STREAM_TABLE
+        key0, key1, key2 = self.key0, self.key1, self.key2
+        result = bytearray(len(data))
+        i = 0
+        for c in data:
+            result[i] = c ^ stream[key2 & 0xFFFF]
+            i += 1
+            key0 = key0 >> 8 ^ table[(key0 ^ c) & 0xFF]
+            key1 = ((key1 + (key0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+            key2 = key2 >> 8 ^ table[(key2 ^ key1 >> 24) & 0xFF]
+        self.key0, self.key1, self.key2 = key0, key1, key2
+        return bytes(result)
+
+
+class ZipWriter(object):
+    """ZIPファイルを少しずつsinkに書き込む。
+
+    zipfile と違って、パスワード（ZipCrypto）とShift-JIS（CP932）のファイル名に対応する。
+    サイズとCRCはデータの後（データ記述子）に書き込むので、sinkはシークできなくてもいい。
+    ZIP64には対応しないので、4GBを超えるファイルは圧縮できない。
+
+    使用例::
+
+        with ZipWriter(buff, password='abc') as writer:
+            writer.write_file('請求書.xlsx', path)
+            writer.write_bytes('注文書.pdf', data)
+    """
+
+    def __init__(self, sink, password=None, encoding='cp932', compression=zipfile.ZIP_DEFLATED):
+        self.sink = sink
+        self.password = password.encode('utf-8') if isinstance(password, str) else password
+        self.encoding = encoding
+        self.compression = compression
+        self.offset = 0
+        self.entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def _write(self, data):
+        self.sink.write(data)
+        self.offset += len(data)
+
+    def encode_filename(self, filename):
+        """ファイル名をエンコードする。
+
+        CP932の場合はUTF-8のフラグを設定しないので、日本語のWindowsでそのまま表示できる。
+        CP932にない文字は「_」に置き換える。
+
+        :param filename:
+        :return: (bytes, フラグ)
+        """
+        if self.encoding.lower().replace('-', '') in ('utf8',):
+            return filename.encode('utf-8'), 0x800
+        name = ''.join(c if c.encode(self.encoding, 'ignore') else '_' for c in filename)
+        return name.encode(self.encoding), 0
+
+    def write_file(self, filename, path):
+        with open(path, 'rb') as f:
+            self.write_stream(filename, iter(lambda: f.read(CHUNK_SIZE), b''), time.localtime(os.path.getmtime(path)))
+
+    def write_bytes(self, filename, data):
+        view = memoryview(data)
+        self.write_stream(filename, (view[i:i + CHUNK_SIZE] for i in range(0, len(view), CHUNK_SIZE)))
+
+    def write_stream(self, filename, chunks, date_time=None):
+        """データを圧縮して書き込む。
+
+        :param filename: ZIPの中のファイル名
+        :param chunks: データのイテレーター
+        :param date_time: ファイルの更新日時（time.struct_time）
+        :return:
+        """
+        name, flags = self.encode_filename(filename)
+        date_time = date_time or time.localtime()
+        dos_time = (date_time.tm_hour << 11) | (date_time.tm_min << 5) | (date_time.tm_sec // 2)
+        dos_date = (max(date_time.tm_year, 1980) - 1980) << 9 | (date_time.tm_mon << 5) | date_time.tm_mday
+        flags |= 0x08
+        if self.password:
+            flags |= 0x01
+        header_offset = self.offset
+        self._write(struct.pack(
+            '<IHHHHHIIIHH', 0x04034B50, 20, flags, self.compression, dos_time, dos_date, 0, 0, 0, len(name), 0
+        ) + name)
+
+        crc = 0
+        size = 0
+        compress_size = 0
+        crypto = None
+        if self.password:
+            crypto = ZipCrypto(self.password)
+            # データ記述子を使う場合、暗号化ヘッダーの最後のバイトは更新時刻の上位バイト
+            encrypted = crypto.encrypt(os.urandom(11) + bytes([(dos_time >> 8) & 0xFF]))
+            self._write(encrypted)
+            compress_size += len(encrypted)
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) \
+            if self.compression == zipfile.ZIP_DEFLATED else None
+        for chunk in chunks:
+            crc = binascii.crc32(chunk, crc)
+            size += len(chunk)
+            data = compressor.compress(chunk) if compressor else bytes(chunk)
+            if data:
+                data = crypto.encrypt(data) if crypto else data
+                self._write(data)
+                compress_size += len(data)
+        if compressor:
+            data = compressor.flush()
+            data = crypto.encrypt(data) if crypto else data
+            self._write(data)
+            compress_size += len(data)
+        self._write(struct.pack('<IIII', 0x08074B50, crc, compress_size, size))
+        self.entries.append((name, flags, dos_time, dos_date, crc, compress_size, size, header_offset))
+
+    def close(self):
+        start = self.offset
+        for name, flags, dos_time, dos_date, crc, compress_size, size, header_offset in self.entries:
+            self._write(struct.pack(
+                '<IHHHHHHIIIHHHHHII', 0x02014B50, 20, 20, flags, self.compression, dos_time, dos_date,
+                crc, compress_size, size, len(name), 0, 0, 0, 0, 0x20, header_offset,
+            ) + name)
+        self._write(struct.pack(
+            '<IHHHHIIH', 0x06054B50, 0, 0, len(self.entries), len(self.entries), self.offset - start, start, 0
+        ))
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+
+
+def write_encrypted_zip(sink, files, password, encoding='cp932'):
+    """ファイルをパスワード付きで圧縮してsinkに書き込む。
+
+    :param sink: 書き込み先（writeメソッドを持つオブジェクト）
+    :param files: (ファイル名, パス, バイト列) のリスト、パスかバイト列のどちらかを指定する
+    :param password: パスワード
+    :param encoding: ファイル名のエンコーディング
+    :return: sink
+    """
+    with ZipWriter(sink, password=password, encoding=encoding) as writer:
+        for filename, path, content in files:
+            if content is not None:
+                writer.write_bytes(filename, content)
+            else:
+                writer.write_file(filename, path)
+    return sink